@@ -0,0 +1,55 @@
+import io
+import os
+import random
+import tarfile
+import tempfile
+import unittest
+
+from uac_index import ArchiveIndex
+
+SPAN = 256 * 1024
+
+
+def make_archive(path, files):
+    with tarfile.open(path, "w:gz") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+class ArchiveIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.archive = os.path.join(self.temp_dir.name, "uac.tar.gz")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def assert_reads_every_member(self, files):
+        make_archive(self.archive, files)
+        with ArchiveIndex(self.archive) as index:
+            members, points = index.build(SPAN)
+            self.assertEqual(members, len(files))
+            self.assertGreater(points, 1)
+            for name, data in files.items():
+                self.assertEqual(index.read(name), data, name)
+
+    def test_random_content(self):
+        # Incompressible data is stored in raw deflate blocks, which must stay byte-aligned when resuming
+        rng = random.Random(0)
+        files = {f"live_response/f{i}.bin": rng.randbytes(rng.randint(1000, 400000)) for i in range(40)}
+        self.assert_reads_every_member(files)
+
+    def test_mixed_content(self):
+        rng = random.Random(1)
+        files = {}
+        for i in range(20):
+            if i % 2:
+                files[f"bodyfile/f{i}.bin"] = rng.randbytes(rng.randint(1000, 300000))
+            else:
+                files[f"bodyfile/f{i}.txt"] = "".join(f"{n}|/path/{n}\n" for n in range(rng.randint(1000, 30000))).encode()
+        self.assert_reads_every_member(files)
+
+if __name__ == "__main__":
+    unittest.main()
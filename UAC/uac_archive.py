@@ -0,0 +1,186 @@
+import argparse
+import fnmatch
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.hashing import MultiHasher
+
+COPY_BUFFER_SIZE = 4 * 1024 * 1024
+MANIFEST_NAME = "extract_manifest.jsonl"
+
+
+def member_name(name):
+    # UAC archives name members with or without a leading "./"
+    return name[2:] if name.startswith("./") else name
+
+
+def matches(name, patterns):
+    """
+    True if the member name matches any glob, or lies under a pattern that
+    names a directory ("bodyfile/" or "live_response/process").
+    """
+    for pattern in patterns:
+        pattern = member_name(pattern)
+        if fnmatch.fnmatchcase(name, pattern) or name.startswith(pattern.rstrip("/") + "/"):
+            return True
+    return False
+
+
+def selected(name, include=None, exclude=None):
+    if include and not matches(name, include):
+        return False
+    return not (exclude and matches(name, exclude))
+
+
+def safe_path(output_dir, name):
+    """
+    Destination of a member inside output_dir, or None for absolute names
+    and names that climb out of it with "..".
+    """
+    target = os.path.realpath(os.path.join(output_dir, name))
+    root = os.path.realpath(output_dir)
+    if os.path.isabs(name) or os.path.commonpath([root, target]) != root:
+        return None
+    return target
+
+
+def link_is_safe(output_dir, name, member):
+    """
+    For Pythons without tarfile extraction filters: True if a link member
+    points inside output_dir, as the "data" filter would require.
+    """
+    if member.issym():
+        if os.path.isabs(member.linkname):
+            return False
+        return safe_path(output_dir, os.path.join(os.path.dirname(name), member.linkname)) is not None
+    if member.islnk():
+        return safe_path(output_dir, member_name(member.linkname)) is not None
+    # Devices and FIFOs are refused like the "data" filter does
+    return False
+
+
+def open_gzip_stream(archive_path):
+    """
+    Return (fileobj, process) with the decompressed tar stream.  pigz is
+    used when it is on the PATH (it reads, decompresses and checksums on
+    separate threads); otherwise (None, None) and tarfile's own gzip
+    reader is used.  pigz's stderr goes to process.stderr_file for
+    close_gzip_stream().
+    """
+    pigz = shutil.which("pigz")
+    if not pigz:
+        return None, None
+    stderr_file = tempfile.TemporaryFile()
+    process = subprocess.Popen([pigz, "-dc", archive_path], stdout=subprocess.PIPE, stderr=stderr_file,
+                               bufsize=COPY_BUFFER_SIZE)
+    process.stderr_file = stderr_file
+    return process.stdout, process
+
+
+def close_gzip_stream(process, archive_path, complete=True):
+    """
+    Reap pigz and raise tarfile.ReadError with its message if it failed,
+    i.e. the archive is corrupt or truncated.  With complete=True the rest
+    of its output (padding after the tar end-of-archive blocks) is drained
+    first; otherwise closing the pipe stops it and only an exit status of
+    its own counts as a failure.
+    """
+    try:
+        if complete:
+            for _ in iter(lambda: process.stdout.read(COPY_BUFFER_SIZE), b""):
+                pass
+        process.stdout.close()
+        returncode = process.wait()
+        if returncode > 0 or (complete and returncode != 0):
+            process.stderr_file.seek(0)
+            message = process.stderr_file.read().decode('utf-8', errors='replace').strip()
+            raise tarfile.ReadError(f"pigz failed on {archive_path} (exit status {returncode}): {message}")
+    finally:
+        process.stderr_file.close()
+
+
+def extract_archive(archive_path, output_dir, include=None, exclude=None):
+    """
+    Extract the members of a .tar.gz matching the include globs (all when
+    empty) and none of the exclude globs in one streaming pass, hashing
+    regular files (MD5, SHA-1, SHA-256) as they are written.  Writes a JSON-lines
+    manifest to output_dir and returns its rows.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    stream, process = open_gzip_stream(archive_path)
+    rows = []
+    complete = False
+    try:
+        if stream is not None:
+            tar = tarfile.open(fileobj=stream, mode="r|")
+        else:
+            tar = tarfile.open(archive_path, mode="r|gz", bufsize=COPY_BUFFER_SIZE)
+        with tar:
+            for member in tar:
+                name = member_name(member.name)
+                if not name or not selected(name, include, exclude):
+                    continue
+                target = safe_path(output_dir, name)
+                row = {"name": name, "size": member.size, "mtime": member.mtime, "md5": None, "sha1": None, "sha256": None,
+                       "error": None}
+                if target is None:
+                    row["error"] = "unsafe path"
+                elif member.isdir():
+                    os.makedirs(target, exist_ok=True)
+                    continue
+                elif member.isfile():
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    hasher = MultiHasher()
+                    source = tar.extractfile(member)
+                    with open(target, 'wb', buffering=COPY_BUFFER_SIZE) as f:
+                        for block in iter(lambda: source.read(COPY_BUFFER_SIZE), b""):
+                            hasher.update(block)
+                            f.write(block)
+                    os.utime(target, (member.mtime, member.mtime))
+                    row.update(hasher.hexdigests())
+                else:
+                    # Links and special files: the "data" filter refuses anything pointing outside output_dir
+                    try:
+                        if hasattr(tarfile, "data_filter"):
+                            tar.extract(member, output_dir, filter="data")
+                        elif link_is_safe(output_dir, name, member):
+                            tar.extract(member, output_dir)
+                        else:
+                            row["error"] = "link outside the output directory or special file"
+                    except (tarfile.TarError, OSError) as e:
+                        row["error"] = str(e)
+                rows.append(row)
+        complete = True
+    finally:
+        if process is not None:
+            close_gzip_stream(process, archive_path, complete)
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract selected members of a UAC .tar.gz collection in one streaming pass.')
+    parser.add_argument('archive', help='UAC output archive (.tar.gz).')
+    parser.add_argument('output_dir', help='Directory to extract into.')
+    parser.add_argument('--include', action='append', help='Glob or directory to extract, e.g. "bodyfile/" (repeatable; default: everything).')
+    parser.add_argument('--exclude', action='append', help='Glob or directory to skip (repeatable).')
+    args = parser.parse_args()
+
+    rows = extract_archive(args.archive, args.output_dir, args.include, args.exclude)
+    errors = [row for row in rows if row["error"]]
+    for row in errors:
+        print(f"Skipped {row['name']}: {row['error']}")
+    print(f"Extracted {len(rows) - len(errors)} members to {args.output_dir}; manifest in {MANIFEST_NAME}")
+
+if __name__ == "__main__":
+    main()
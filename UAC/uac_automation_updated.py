@@ -1,28 +1,45 @@
 import os
-import subprocess
+import sys
 from pathlib import Path
 
+from uac_archive import extract_archive
+from uac_index import ArchiveIndex
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.tool_runner import run_tool
+
 def run_command(command):
     """
-    Run the given command and handle exceptions.
+    Run the given argument list, echoing its output as it arrives, and
+    handle errors.  Returns True on success.
     """
     try:
-        subprocess.run(command, check=True, shell=True)
-        print(f"Command '{command}' executed successfully.")
-    except subprocess.CalledProcessError as e:
+        result = run_tool(command, on_stdout=sys.stdout.write, on_stderr=sys.stderr.write, capture=False)
+    except OSError as e:
         print(f"Error executing command: {e}")
+        return False
+    if result.returncode != 0:
+        print(f"Error executing command: '{' '.join(command)}' returned non-zero exit status {result.returncode}.")
+        return False
+    print(f"Command '{' '.join(command)}' executed successfully.")
+    return True
 
-def extract_tar_gz(file_path, output_dir):
+def extract_tar_gz(file_path, output_dir, include=None, exclude=None):
     """
-    Extract a tar.gz file to the specified output directory.
+    Extract a tar.gz file to the specified output directory, optionally
+    only the members matching the include globs and none of the exclude ones.
     """
-    extract_command = f"tar -xzvf {file_path} -C {output_dir}"
-    run_command(extract_command)
+    rows = extract_archive(str(file_path), str(output_dir), include, exclude)
+    errors = [row for row in rows if row["error"]]
+    for row in errors:
+        print(f"Skipped {row['name']}: {row['error']}")
+    print(f"Extracted {len(rows) - len(errors)} members with SHA-256 hashes recorded in the manifest.")
 
 def main():
     # Step 1: Clone the repo
     repo_url = "https://github.com/tclahr/uac.git"
-    clone_command = f"git clone {repo_url}"
+    clone_command = ["git", "clone", repo_url]
     
     # Clone the repository
     print("Cloning the repository...")
@@ -47,33 +64,43 @@ def main():
     desktop_path = Path.home() / "Desktop" / "uac_output"
     desktop_path.mkdir(parents=True, exist_ok=True)
 
-    # Step 4: Run the selected scenario with output directed to the Desktop
+    # Step 4: Run the selected scenario with output directed to the Desktop.
+    # Argument lists hand the artifact globs to uac untouched instead of to a shell.
+    output = str(desktop_path)
     if choice == '1':
-        scenario = f"./uac -p full {desktop_path}"
+        scenario = ["./uac", "-p", "full", output]
     elif choice == '2':
-        scenario = f"./uac -a live_response/*,bodyfile/bodyfile.yaml {desktop_path}"
+        scenario = ["./uac", "-a", "live_response/*,bodyfile/bodyfile.yaml", output]
     elif choice == '3':
-        scenario = f"./uac -p full -a !bodyfile/bodyfile.yaml {desktop_path}"
+        scenario = ["./uac", "-p", "full", "-a", "!bodyfile/bodyfile.yaml", output]
     elif choice == '4':
-        scenario = f"./uac -a artifacts/memory_dump/avml.yaml -p full {desktop_path}"
+        scenario = ["./uac", "-a", "artifacts/memory_dump/avml.yaml", "-p", "full", output]
     elif choice == '5':
-        scenario = f"./uac -a ./artifacts/memory_dump/avml.yaml -p ir_triage -a !artifacts/bodyfile/bodyfile.yaml {desktop_path}"
+        scenario = ["./uac", "-a", "./artifacts/memory_dump/avml.yaml", "-p", "ir_triage", "-a", "!artifacts/bodyfile/bodyfile.yaml", output]
     elif choice == '6':
-        scenario = f"./uac -p full {desktop_path} --date-range-start 2021-05-01 --date-range-end 2021-08-31"
+        scenario = ["./uac", "-p", "full", output, "--date-range-start", "2021-05-01", "--date-range-end", "2021-08-31"]
     elif choice == '7':
-        scenario = f"./uac -p full -a !live_response/* {desktop_path} --mount-point /mnt/ewf --operating-system linux"
+        scenario = ["./uac", "-p", "full", "-a", "!live_response/*", output, "--mount-point", "/mnt/ewf", "--operating-system", "linux"]
     else:
         print("Invalid selection. Exiting.")
         return
 
-    print(f"\nExecuting scenario {choice}: {scenario}")
+    print(f"\nExecuting scenario {choice}: {' '.join(scenario)}")
     run_command(scenario)
 
     # Step 5: Extract the tar.gz file if it exists
     output_tar_gz = next(desktop_path.glob("*.tar.gz"), None)
-    if output_tar_gz:
+    if output_tar_gz and input("\nIndex the archive for random access instead of extracting it? (y/n): ").strip().lower() == 'y':
+        print(f"\nIndexing {output_tar_gz}...")
+        with ArchiveIndex(str(output_tar_gz)) as index:
+            members, points = index.build()
+        print(f"Indexed {members} members ({points} access points) in {index.index_path}")
+        print(f"List, read or search it with: python uac_index.py list|cat|grep {output_tar_gz} ...")
+    elif output_tar_gz:
+        selection = input("Paths to extract, comma-separated (e.g. bodyfile/,live_response/process/; blank for everything): ")
+        include = [pattern.strip() for pattern in selection.split(",") if pattern.strip()]
         print(f"\nExtracting {output_tar_gz} to {desktop_path}...")
-        extract_tar_gz(output_tar_gz, desktop_path)
+        extract_tar_gz(output_tar_gz, desktop_path, include)
     else:
         print("\nNo tar.gz file found to extract.")
 
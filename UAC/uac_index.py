@@ -0,0 +1,502 @@
+import argparse
+import collections
+import ctypes
+import ctypes.util
+import os
+import re
+import sqlite3
+import sys
+import tarfile
+import zlib
+
+from uac_archive import matches, member_name
+
+# Uncompressed distance between access points; reading any byte decompresses at most about this much
+DEFAULT_SPAN = 4 * 1024 * 1024
+WINDOW_SIZE = 32768
+READ_SIZE = 1024 * 1024
+OUTPUT_SIZE = 256 * 1024
+GZIP_WBITS = 47  # zlib or gzip header, 32 KiB window
+RAW_WBITS = -15
+
+Z_OK, Z_STREAM_END, Z_NEED_DICT, Z_BUF_ERROR = 0, 1, 2, -5
+Z_NO_FLUSH, Z_BLOCK = 0, 5
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    # bits is NULL for the start of a gzip member, which is read from its header with no window
+    "CREATE TABLE IF NOT EXISTS points (uncompressed INTEGER PRIMARY KEY, compressed INTEGER, bits INTEGER, window BLOB)",
+    "CREATE TABLE IF NOT EXISTS members (name TEXT PRIMARY KEY, type TEXT, size INTEGER, mtime INTEGER, mode INTEGER, "
+    "offset INTEGER, linkname TEXT)",
+)
+
+Point = collections.namedtuple("Point", ["uncompressed", "compressed", "bits", "window"])
+
+
+class _ZStream(ctypes.Structure):
+    _fields_ = [
+        ("next_in", ctypes.c_void_p), ("avail_in", ctypes.c_uint), ("total_in", ctypes.c_ulong),
+        ("next_out", ctypes.c_void_p), ("avail_out", ctypes.c_uint), ("total_out", ctypes.c_ulong),
+        ("msg", ctypes.c_char_p), ("state", ctypes.c_void_p),
+        ("zalloc", ctypes.c_void_p), ("zfree", ctypes.c_void_p), ("opaque", ctypes.c_void_p),
+        ("data_type", ctypes.c_int), ("adler", ctypes.c_ulong), ("reserved", ctypes.c_ulong),
+    ]
+
+
+def load_zlib():
+    """
+    The system zlib through ctypes, or None.  Python's zlib module can't
+    stop at deflate block boundaries (Z_BLOCK), which access points need.
+    """
+    for name in ("z", "zlib1", "zlib"):
+        path = ctypes.util.find_library(name)
+        if not path:
+            continue
+        try:
+            lib = ctypes.CDLL(path)
+        except OSError:
+            continue
+        lib.zlibVersion.restype = ctypes.c_char_p
+        lib.inflateInit2_.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+        lib.inflate.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_int]
+        lib.inflateReset.argtypes = [ctypes.POINTER(_ZStream)]
+        lib.inflatePrime.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_int, ctypes.c_int]
+        lib.inflateSetDictionary.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_char_p, ctypes.c_uint]
+        lib.inflateEnd.argtypes = [ctypes.POINTER(_ZStream)]
+        return lib
+    return None
+
+
+class _GeneratorReader:
+    """
+    Minimal file object over a generator of byte blocks, for tarfile's
+    stream mode.
+    """
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        # Deleting from the front of a bytearray doesn't move the rest
+        self.buffer = bytearray()
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            block = next(self.blocks, None)
+            if block is None:
+                break
+            self.buffer += block
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+def _inflate_from(lib, f, point):
+    """
+    Yield the output of the raw deflate stream resuming at an access point
+    inside a gzip member, up to the end of that member.  As in zran, the
+    point's leftover bits of the previous byte are fed in with inflatePrime,
+    so the following bytes stay byte-aligned; shifting them instead would
+    move stored blocks (incompressible data) off their byte boundary.
+    """
+    stream = _ZStream()
+    if lib.inflateInit2_(ctypes.byref(stream), RAW_WBITS, lib.zlibVersion(), ctypes.sizeof(stream)) != Z_OK:
+        raise RuntimeError("inflateInit2 failed")
+    input_buffer = ctypes.create_string_buffer(READ_SIZE)
+    output_buffer = ctypes.create_string_buffer(OUTPUT_SIZE)
+    try:
+        if point.bits:
+            f.seek(point.compressed - 1)
+            lib.inflatePrime(ctypes.byref(stream), point.bits, f.read(1)[0] >> (8 - point.bits))
+        else:
+            f.seek(point.compressed)
+        if point.window:
+            lib.inflateSetDictionary(ctypes.byref(stream), point.window, len(point.window))
+        while True:
+            if stream.avail_in == 0:
+                count = f.readinto(input_buffer)
+                if not count:
+                    raise EOFError("archive ends inside a gzip member")
+                stream.next_in = ctypes.addressof(input_buffer)
+                stream.avail_in = count
+            stream.next_out = ctypes.addressof(output_buffer)
+            stream.avail_out = OUTPUT_SIZE
+            ret = lib.inflate(ctypes.byref(stream), Z_NO_FLUSH)
+            produced = OUTPUT_SIZE - stream.avail_out
+            if produced:
+                yield ctypes.string_at(output_buffer, produced)
+            if ret == Z_STREAM_END:
+                return
+            if ret not in (Z_OK, Z_BUF_ERROR):
+                message = stream.msg.decode('utf-8', errors='replace') if stream.msg else f"error {ret}"
+                raise ValueError(f"Corrupt deflate data after byte {point.compressed}: {message}")
+    finally:
+        lib.inflateEnd(ctypes.byref(stream))
+
+
+def _inflate_member(f, point):
+    """
+    Yield the output of the gzip member starting at point, header included.
+    """
+    f.seek(point.compressed)
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    while not decompressor.eof:
+        data = f.read(READ_SIZE)
+        if not data:
+            raise EOFError("archive ends inside a gzip member")
+        while data and not decompressor.eof:
+            block = decompressor.decompress(data, OUTPUT_SIZE)
+            if block:
+                yield block
+            data = decompressor.unconsumed_tail
+
+
+class ArchiveIndex:
+    """
+    Random access to the members of a UAC .tar.gz without extracting it.
+
+    One decompression pass records every tar member's offset in the
+    uncompressed stream and, every span bytes, a zran-style access point at
+    a deflate block boundary: the compressed offset, the bit within that
+    byte, and the 32 KiB of output before it (the window later blocks may
+    refer back to).  Reading a member then starts inflating from the
+    nearest point before it, so it costs at most about span bytes of
+    decompression however large the archive.  The archive is only read.
+
+    Without a loadable zlib library only the gzip member starts are access
+    points (and are the only ones used when reading), so reads of a
+    single-member archive decompress from the start.
+    """
+
+    def __init__(self, archive_path, index_path=None):
+        self.archive_path = archive_path
+        self.index_path = index_path or f"{archive_path}.index.sqlite"
+        self.db = sqlite3.connect(self.index_path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def _archive_state(self):
+        st = os.stat(self.archive_path)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    def is_current(self):
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'archive'").fetchone()
+        return row is not None and row[0] == self._archive_state()
+
+    def build(self, span=DEFAULT_SPAN):
+        """
+        Index the archive in one pass.  Returns (members, access points).
+        """
+        points = []
+        with open(self.archive_path, 'rb') as f:
+            lib = load_zlib()
+            blocks = self._scan_blocks(f, lib, span, points) if lib else self._scan_members(f, points)
+            members = []
+            with tarfile.open(fileobj=_GeneratorReader(blocks), mode="r|") as tar:
+                for member in tar:
+                    members.append((member_name(member.name), member.type.decode('ascii', errors='replace'),
+                                    member.size, int(member.mtime), member.mode, member.offset_data,
+                                    member.linkname or None))
+            # Drain what follows the tar end-of-archive blocks so every point is recorded
+            for _ in blocks:
+                pass
+
+        with self.db:
+            self.db.execute("DELETE FROM points")
+            self.db.execute("DELETE FROM members")
+            self.db.executemany("INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?)",
+                                [(p.uncompressed, p.compressed, p.bits, zlib.compress(p.window)) for p in points])
+            self.db.executemany("INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?, ?, ?, ?)", members)
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('archive', ?)", (self._archive_state(),))
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('span', ?)", (str(span),))
+        return len(members), len(points)
+
+    def _scan_blocks(self, f, lib, span, points):
+        """
+        Inflate with the system zlib, stopping at each deflate block
+        boundary (Z_BLOCK) to record access points; yields the output.
+        """
+        stream = _ZStream()
+        version = lib.zlibVersion()
+        if lib.inflateInit2_(ctypes.byref(stream), GZIP_WBITS, version, ctypes.sizeof(stream)) != Z_OK:
+            raise RuntimeError("inflateInit2 failed")
+        input_buffer = ctypes.create_string_buffer(READ_SIZE)
+        output_buffer = ctypes.create_string_buffer(OUTPUT_SIZE)
+        window = collections.deque()
+        window_size = 0
+        read_total = total_out = 0
+        points.append(Point(0, 0, None, b""))
+        last = 0
+        try:
+            while True:
+                if stream.avail_in == 0:
+                    count = f.readinto(input_buffer)
+                    if not count:
+                        raise EOFError("archive ends inside a gzip member")
+                    read_total += count
+                    stream.next_in = ctypes.addressof(input_buffer)
+                    stream.avail_in = count
+                stream.next_out = ctypes.addressof(output_buffer)
+                stream.avail_out = OUTPUT_SIZE
+                ret = lib.inflate(ctypes.byref(stream), Z_BLOCK)
+                produced = OUTPUT_SIZE - stream.avail_out
+                total_in = read_total - stream.avail_in
+                if produced:
+                    block = ctypes.string_at(output_buffer, produced)
+                    total_out += produced
+                    window.append(block)
+                    window_size += produced
+                    while window_size - len(window[0]) >= WINDOW_SIZE:
+                        window_size -= len(window.popleft())
+                    yield block
+
+                if ret == Z_STREAM_END:
+                    if stream.avail_in == 0:
+                        count = f.readinto(input_buffer)
+                        if not count:
+                            return
+                        read_total += count
+                        stream.next_in = ctypes.addressof(input_buffer)
+                        stream.avail_in = count
+                    # Another gzip member follows (unless it is padding, which ends the data)
+                    if ctypes.string_at(stream.next_in, min(2, stream.avail_in)) != b"\x1f\x8b":
+                        return
+                    lib.inflateReset(ctypes.byref(stream))
+                    points.append(Point(total_out, total_in, None, b""))
+                    last = total_out
+                    continue
+                if ret not in (Z_OK, Z_BUF_ERROR):
+                    message = stream.msg.decode('utf-8', errors='replace') if stream.msg else f"error {ret}"
+                    raise ValueError(f"Corrupt gzip data at byte {total_in}: {message}")
+
+                # Bit 7: stopped at the end of a block; bit 6: it was the last block
+                if stream.data_type & 128 and not stream.data_type & 64 and total_out - last >= span:
+                    points.append(Point(total_out, total_in, stream.data_type & 7, b"".join(window)[-WINDOW_SIZE:]))
+                    last = total_out
+        finally:
+            lib.inflateEnd(ctypes.byref(stream))
+
+    def _scan_members(self, f, points):
+        """
+        Inflate with the zlib module, recording only gzip member starts.
+        """
+        compressed = 0
+        total_out = 0
+        pending = b""
+        while True:
+            points.append(Point(total_out, compressed, None, b""))
+            decompressor = zlib.decompressobj(GZIP_WBITS)
+            data = pending
+            consumed = 0
+            while not decompressor.eof:
+                if not data:
+                    data = f.read(READ_SIZE)
+                    if not data:
+                        raise EOFError("archive ends inside a gzip member")
+                consumed += len(data)
+                while data and not decompressor.eof:
+                    block = decompressor.decompress(data, OUTPUT_SIZE)
+                    total_out += len(block)
+                    if block:
+                        yield block
+                    data = decompressor.unconsumed_tail
+            pending = decompressor.unused_data
+            compressed += consumed - len(pending)
+            if not pending:
+                pending = f.read(READ_SIZE)
+            if pending[:2] != b"\x1f\x8b":
+                return
+
+    def _point_at(self, offset, lib):
+        # Points inside a member need the system zlib to resume; without it only member starts will do
+        query = "SELECT uncompressed, compressed, bits, window FROM points WHERE uncompressed <= ? "
+        if lib is None:
+            query += "AND bits IS NULL "
+        row = self.db.execute(query + "ORDER BY uncompressed DESC LIMIT 1", (offset,)).fetchone()
+        return Point(row[0], row[1], row[2], zlib.decompress(row[3]))
+
+    def _member_start(self, offset):
+        row = self.db.execute("SELECT uncompressed, compressed, bits, window FROM points WHERE uncompressed = ? "
+                              "AND bits IS NULL", (offset,)).fetchone()
+        return Point(row[0], row[1], row[2], b"") if row else None
+
+    def _iter_from(self, point, lib):
+        """
+        Yield the uncompressed stream from an access point to the end.
+        """
+        position = point.uncompressed
+        with open(self.archive_path, 'rb') as f:
+            while point is not None:
+                if point.bits is None:
+                    blocks = _inflate_member(f, point)
+                else:
+                    blocks = _inflate_from(lib, f, point)
+                for block in blocks:
+                    position += len(block)
+                    yield block
+                # End of a gzip member; the next one, if any, starts with its own access point
+                point = self._member_start(position)
+
+    def members(self, patterns=None):
+        rows = self.db.execute("SELECT name, type, size, mtime, mode, offset, linkname FROM members ORDER BY offset")
+        for name, member_type, size, mtime, mode, offset, linkname in rows:
+            if patterns and not matches(name, patterns):
+                continue
+            yield {"name": name, "type": member_type, "size": size, "mtime": mtime, "mode": mode,
+                   "offset": offset, "linkname": linkname}
+
+    def member(self, name):
+        for member in self.members():
+            if member["name"] == member_name(name):
+                return member
+        return None
+
+    def read_members(self, members):
+        """
+        Yield (member, iterator of data blocks) for regular-file members in
+        archive order.  Consecutive reads continue one decompression while
+        the next member is within a span; otherwise they jump to the
+        nearest access point.
+        """
+        span = int(self.db.execute("SELECT value FROM meta WHERE key = 'span'").fetchone()[0])
+        lib = load_zlib()
+        cursor = None
+        for member in sorted(members, key=lambda member: member["offset"]):
+            if member["type"] not in ("0", "\x00", "7"):
+                continue
+            if cursor is None or not cursor.can_reach(member["offset"], span):
+                point = self._point_at(member["offset"], lib)
+                cursor = _Cursor(self._iter_from(point, lib), point.uncompressed)
+            yield member, cursor.read(member["offset"], member["size"])
+
+    def read(self, name):
+        member = self.member(name)
+        if member is None:
+            raise KeyError(name)
+        for _, blocks in self.read_members([member]):
+            return b"".join(blocks)
+        raise KeyError(f"{name} is not a regular file")
+
+    def grep(self, pattern, patterns=None, ignore_case=False):
+        """
+        Yield (member name, line number, line) for lines of the selected
+        regular files matching the regular expression.
+        """
+        regex = re.compile(pattern.encode('utf-8'), re.IGNORECASE if ignore_case else 0)
+        for member, blocks in self.read_members(self.members(patterns)):
+            remainder = b""
+            line_number = 0
+            for block in blocks:
+                lines = (remainder + block).split(b"\n")
+                remainder = lines.pop()
+                for line in lines:
+                    line_number += 1
+                    if regex.search(line):
+                        yield member["name"], line_number, line.decode('utf-8', errors='replace')
+            if remainder:
+                line_number += 1
+                if regex.search(remainder):
+                    yield member["name"], line_number, remainder.decode('utf-8', errors='replace')
+
+
+class _Cursor:
+    """
+    Forward-only reader over an uncompressed stream of blocks.
+    """
+
+    def __init__(self, blocks, position):
+        self.blocks = blocks
+        self.block = b""
+        self.block_start = position
+
+    def can_reach(self, offset, span):
+        return self.block_start <= offset and offset - (self.block_start + len(self.block)) < span
+
+    def read(self, offset, size):
+        while size > 0:
+            if self.block_start + len(self.block) <= offset:
+                self.block_start += len(self.block)
+                self.block = next(self.blocks, None)
+                if self.block is None:
+                    raise EOFError("archive ends before the member does")
+                continue
+            start = offset - self.block_start
+            piece = self.block[start:start + size]
+            offset += len(piece)
+            size -= len(piece)
+            yield piece
+
+
+def open_index(archive_path, index_path=None, span=DEFAULT_SPAN):
+    """
+    ArchiveIndex for the archive, built first if missing or out of date.
+    """
+    index = ArchiveIndex(archive_path, index_path)
+    if not index.is_current():
+        index.build(span)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List, read and search a UAC .tar.gz collection without extracting it.')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    commands = {
+        'build': 'Index the archive (one decompression pass).',
+        'list': 'List members.',
+        'cat': 'Write one member to stdout or a file.',
+        'grep': 'Search member contents with a regular expression.',
+    }
+    subcommands = {}
+    for action, help_text in commands.items():
+        sub = subparsers.add_parser(action, help=help_text)
+        sub.add_argument('archive', help='UAC output archive (.tar.gz).')
+        sub.add_argument('--index', help='Index file (default: <archive>.index.sqlite).')
+        subcommands[action] = sub
+    subcommands['build'].add_argument('--span', type=int, default=DEFAULT_SPAN // (1024 * 1024), help='Megabytes between access points (default: 4).')
+    subcommands['list'].add_argument('patterns', nargs='*', help='Globs or directories to list.')
+    subcommands['cat'].add_argument('name', help='Member name, e.g. live_response/process/ps.txt.')
+    subcommands['cat'].add_argument('-o', '--output', help='Write to this file instead of stdout.')
+    subcommands['grep'].add_argument('pattern', help='Regular expression.')
+    subcommands['grep'].add_argument('--include', action='append', help='Glob or directory to search (repeatable).')
+    subcommands['grep'].add_argument('-i', '--ignore-case', action='store_true', help='Case-insensitive match.')
+    args = parser.parse_args()
+
+    if args.action == 'build':
+        with ArchiveIndex(args.archive, args.index) as index:
+            members, points = index.build(args.span * 1024 * 1024)
+        print(f"Indexed {members} members with {points} access points in {index.index_path}")
+        return
+
+    with open_index(args.archive, args.index) as index:
+        if args.action == 'list':
+            for member in index.members(args.patterns):
+                print(f"{member['type']} {member['size']:>12} {member['name']}")
+        elif args.action == 'cat':
+            member = index.member(args.name)
+            if member is None:
+                sys.exit(f"{args.name}: not in the archive")
+            output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+            try:
+                for _, blocks in index.read_members([member]):
+                    for block in blocks:
+                        output.write(block)
+            finally:
+                if args.output:
+                    output.close()
+        else:
+            for name, line_number, line in index.grep(args.pattern, args.include, args.ignore_case):
+                print(f"{name}:{line_number}:{line}")
+
+if __name__ == "__main__":
+    main()
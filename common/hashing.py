@@ -0,0 +1,150 @@
+import argparse
+import collections
+import csv
+import datetime
+import hashlib
+import json
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_ALGORITHMS = ("md5", "sha1", "sha256")
+CHUNK_SIZE = 8 * 1024 * 1024
+# Files at least this big are hashed from a memory map instead of read() copies
+MMAP_THRESHOLD = 64 * 1024 * 1024
+# Files queued per worker, so hashing a large tree does not submit every file at once
+QUEUE_PER_WORKER = 4
+MANIFEST_FIELDS = ["path", "size", "mtime"]
+
+
+class MultiHasher:
+    """
+    Several hashlib digests fed from the same buffers, so one read of the
+    data produces all of them.
+    """
+
+    def __init__(self, algorithms=DEFAULT_ALGORITHMS):
+        self.hashes = {name: hashlib.new(name) for name in algorithms}
+
+    def update(self, data):
+        for digest in self.hashes.values():
+            digest.update(data)
+
+    def hexdigests(self):
+        return {name: digest.hexdigest() for name, digest in self.hashes.items()}
+
+
+def hash_file(file_path, algorithms=DEFAULT_ALGORITHMS, chunk_size=CHUNK_SIZE):
+    """
+    Read the file once and return (size, {algorithm: hex digest}).  Each
+    chunk is fed to every digest while it is still in the CPU cache.
+    """
+    hasher = MultiHasher(algorithms)
+    size = 0
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                with memoryview(data) as view:
+                    for offset in range(0, len(view), chunk_size):
+                        hasher.update(view[offset:offset + chunk_size])
+                    size = len(view)
+        else:
+            buffer = bytearray(chunk_size)
+            with memoryview(buffer) as view:
+                while True:
+                    count = f.readinto(buffer)
+                    if not count:
+                        break
+                    hasher.update(view[:count])
+                    size += count
+    return size, hasher.hexdigests()
+
+
+def iter_files(paths):
+    """
+    Every regular file under the given files and directories, in walk order.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    file_path = os.path.join(root, name)
+                    if os.path.isfile(file_path) and not os.path.islink(file_path):
+                        yield file_path
+        else:
+            yield path
+
+
+def hash_row(file_path, algorithms=DEFAULT_ALGORITHMS):
+    row = {"path": file_path, "size": None, "mtime": None}
+    row.update({name: None for name in algorithms})
+    row["error"] = None
+    try:
+        mtime = os.stat(file_path).st_mtime
+        row["size"], digests = hash_file(file_path, algorithms)
+        row.update(digests)
+        row["mtime"] = datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc).isoformat()
+    except OSError as e:
+        row["error"] = str(e)
+    return row
+
+
+def hash_files(file_paths, algorithms=DEFAULT_ALGORITHMS, workers=None):
+    """
+    Hash files on a thread pool (hashlib releases the GIL while it
+    digests) and yield one manifest row per file, in input order.
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for file_path in file_paths:
+            if len(pending) >= workers * QUEUE_PER_WORKER:
+                yield pending.popleft().result()
+            pending.append(executor.submit(hash_row, file_path, algorithms))
+        while pending:
+            yield pending.popleft().result()
+
+
+def write_manifest(rows, manifest_path, algorithms=DEFAULT_ALGORITHMS):
+    """
+    Write rows as CSV if manifest_path ends in .csv, else as JSON lines.
+    Returns (files, errors).
+    """
+    files = errors = 0
+    with open(manifest_path, 'w', encoding='utf-8', newline='') as f:
+        writer = None
+        if manifest_path.lower().endswith(".csv"):
+            writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS + list(algorithms) + ["error"])
+            writer.writeheader()
+        for row in rows:
+            if writer:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            files += 1
+            errors += row["error"] is not None
+    return files, errors
+
+
+def hash_manifest(paths, manifest_path, algorithms=DEFAULT_ALGORITHMS, workers=None):
+    """
+    Pipeline stage for the tool wrappers: hash every file under paths and
+    write the manifest.  Returns (files, errors).
+    """
+    return write_manifest(hash_files(iter_files(paths), algorithms, workers), manifest_path, algorithms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hash files with several algorithms in one read each and write a manifest.')
+    parser.add_argument('paths', nargs='+', help='Files or directories to hash.')
+    parser.add_argument('-o', '--output', required=True, help='Manifest file (.csv for CSV, anything else for JSON lines).')
+    parser.add_argument('--algorithms', nargs='+', default=list(DEFAULT_ALGORITHMS), choices=sorted(hashlib.algorithms_guaranteed), help='Digests to compute (default: md5 sha1 sha256).')
+    parser.add_argument('--workers', type=int, help='Hashing threads (default: number of CPUs).')
+    args = parser.parse_args()
+
+    files, errors = hash_manifest(args.paths, args.output, args.algorithms, args.workers)
+    print(f"Hashed {files} files ({errors} errors); manifest stored in {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,509 @@
+import argparse
+import functools
+import importlib
+import json
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.hashing import DEFAULT_ALGORITHMS, hash_row
+from common.metadata_cache import DEFAULT_CACHE_DIR
+from common.tool_runner import parse_limits
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB = os.path.join(DEFAULT_CACHE_DIR, "jobs.sqlite")
+# Queued plus running jobs allowed before submit() blocks
+DEFAULT_MAX_DEPTH = 10000
+DEFAULT_MAX_ATTEMPTS = 3
+# Seconds before the first retry, doubled for each further attempt
+RETRY_DELAY = 5
+POLL_INTERVAL = 1.0
+# A running job whose owner has not renewed its lease for this long is taken back
+LEASE_SECONDS = 60
+# Seconds a job's tool may run before it is killed, unless the job's options say otherwise
+DEFAULT_JOB_TIMEOUT = 3600
+DEFAULT_WORKERS = "hash=2,exiftool=2,hachoir=2,hayabusa=1,sleuthkit=2,uac-extract=1"
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobError(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    Durable queue of (tool, file, options) jobs in SQLite.
+
+    Jobs move queued -> running -> done, or back to queued with a growing
+    delay until max_attempts is used up and they end as failed.  Several
+    processes may share the database: submitters and the service only
+    meet in it.  submit() blocks while max_depth jobs are queued or
+    running, so producers slow down to the rate the workers drain.
+
+    A claimed job records its owner and a lease the owner keeps renewing;
+    only jobs whose lease ran out (their service died) are requeued, so
+    several services can work the same queue.
+    """
+
+    def __init__(self, db_path=None, max_depth=None):
+        self.db_path = db_path or os.environ.get("JOB_DB", DEFAULT_DB)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, tool TEXT NOT NULL, file TEXT NOT NULL, options TEXT NOT NULL, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, "
+            "next_run REAL NOT NULL, submitted REAL NOT NULL, started REAL, finished REAL, result TEXT, error TEXT, "
+            "owner TEXT, lease_until REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, column_type in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                # Queues created before leases were recorded
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, tool, next_run)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        if max_depth is not None:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('max_depth', ?)", (str(max_depth),))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _write(self, fn):
+        # BEGIN IMMEDIATE takes the write lock up front, so a check and the
+        # update depending on it cannot interleave with another process
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                value = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return value
+
+    @property
+    def max_depth(self):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'max_depth'").fetchone()
+        return int(row[0]) if row else DEFAULT_MAX_DEPTH
+
+    def depth(self, tool=None):
+        query = "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+        params = ()
+        if tool is not None:
+            query += " AND tool = ?"
+            params = (tool,)
+        with self._lock:
+            return self._db.execute(query, params).fetchone()[0]
+
+    def submit(self, tool, file_path, options=None, max_attempts=DEFAULT_MAX_ATTEMPTS, wait=True, timeout=None):
+        """
+        Queue a job and return its id.  While the queue is full this waits
+        (up to timeout seconds, or forever) or, with wait=False, raises
+        QueueFull straight away.
+        """
+        options = json.dumps(options or {}, sort_keys=True)
+        max_depth = self.max_depth
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def insert(db):
+            if db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0] >= max_depth:
+                return None
+            now = time.time()
+            return db.execute(
+                "INSERT INTO jobs (tool, file, options, status, max_attempts, next_run, submitted) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (tool, os.path.abspath(file_path), options, max(1, max_attempts), now, now),
+            ).lastrowid
+
+        while True:
+            job_id = self._write(insert)
+            if job_id is not None:
+                return job_id
+            if not wait or (deadline is not None and time.monotonic() >= deadline):
+                raise QueueFull(f"{max_depth} jobs are already queued or running")
+            time.sleep(POLL_INTERVAL)
+
+    def claim(self, tool, owner, lease=LEASE_SECONDS):
+        """
+        Mark the oldest ready job for tool as running under owner's lease and
+        return it, or None.
+        """
+        def take(db):
+            row = db.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND tool = ? AND next_run <= ? ORDER BY id LIMIT 1",
+                (tool, time.time()),
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            db.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, started = ?, owner = ?, "
+                       "lease_until = ? WHERE id = ?", (now, owner, now + lease, row["id"]))
+            job = _job_dict(row)
+            job["attempts"] += 1
+            return job
+
+        return self._write(take)
+
+    def renew(self, owner, lease=LEASE_SECONDS):
+        """
+        Extend the lease of every job owner is running.
+        """
+        self._write(lambda db: db.execute(
+            "UPDATE jobs SET lease_until = ? WHERE status = 'running' AND owner = ?", (time.time() + lease, owner)))
+
+    def complete(self, job_id, owner, result):
+        # A job whose lease expired may be running elsewhere by now; its result is not ours to record
+        self._write(lambda db: db.execute(
+            "UPDATE jobs SET status = 'done', finished = ?, result = ?, error = NULL, lease_until = NULL "
+            "WHERE id = ? AND status = 'running' AND owner = ?",
+            (time.time(), json.dumps(result, ensure_ascii=False), job_id, owner)))
+
+    def fail(self, job_id, owner, error):
+        """
+        Record a failed attempt; the job is queued again after a delay
+        unless it has used all its attempts.  Returns the new status, or
+        None if owner no longer holds the job.
+        """
+        def record(db):
+            row = db.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = 'running' AND owner = ?",
+                             (job_id, owner)).fetchone()
+            if row is None:
+                return None
+            attempts, max_attempts = row
+            now = time.time()
+            if attempts < max_attempts:
+                db.execute("UPDATE jobs SET status = 'queued', next_run = ?, error = ?, lease_until = NULL WHERE id = ?",
+                           (now + RETRY_DELAY * 2 ** (attempts - 1), error, job_id))
+                return "queued"
+            db.execute("UPDATE jobs SET status = 'failed', finished = ?, error = ?, lease_until = NULL WHERE id = ?",
+                       (now, error, job_id))
+            return "failed"
+
+        return self._write(record)
+
+    def requeue_expired(self):
+        """
+        Put running jobs whose lease ran out (their service died) back in
+        the queue.  Returns how many were requeued.
+        """
+        now = time.time()
+        return self._write(lambda db: db.execute(
+            "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), next_run = ?, owner = NULL, "
+            "lease_until = NULL WHERE status = 'running' AND (lease_until IS NULL OR lease_until < ?)",
+            (now, now)).rowcount)
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_dict(row) if row else None
+
+    def jobs(self, status=None, tool=None, limit=100):
+        query, params = "SELECT * FROM jobs WHERE 1 = 1", []
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        if tool:
+            query += " AND tool = ?"
+            params.append(tool)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [_job_dict(row) for row in self._db.execute(query, params)]
+
+    def counts(self):
+        with self._lock:
+            return {status: count for status, count in
+                    self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")}
+
+
+def _job_dict(row):
+    job = dict(row)
+    job["options"] = json.loads(job["options"])
+    if job["result"] is not None:
+        job["result"] = json.loads(job["result"])
+    return job
+
+
+def _family_module(directory, module):
+    # The tool families import their siblings by plain name, so their directory goes on the path
+    path = os.path.join(REPO_ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(module)
+
+
+@functools.lru_cache(maxsize=None)
+def _hayabusa(hayabusa_path, timeout):
+    return _family_module("hayabusa", "hayabusa_test").Hayabusa(hayabusa_path, timeout=timeout)
+
+
+@functools.lru_cache(maxsize=None)
+def _sleuthkit(sleuthkit_path):
+    return _family_module("sleuth_kit", "sleuth_kit_compatible_").SleuthKit(sleuthkit_path)
+
+
+def run_hash_job(file_path, options, output_path, timeout):
+    row = hash_row(file_path, options.get("algorithms", DEFAULT_ALGORITHMS))
+    if row["error"]:
+        raise JobError(row["error"])
+    return row
+
+
+def run_exiftool_job(file_path, options, output_path, timeout):
+    output = _family_module("exif-tool-working.py", "exiftoolworking").run_exiftool(file_path, timeout)
+    if not output:
+        raise JobError("exiftool produced no output")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(output)
+    return {"output": output_path}
+
+
+def run_hachoir_job(file_path, options, output_path, timeout):
+    output = _family_module("hachoir", "hachoir_updated").run_hachoir_metadata(file_path, options.get("options", ""),
+                                                                                timeout)
+    if output is None:
+        raise JobError("hachoir-metadata failed")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(output)
+    return {"output": output_path}
+
+
+def run_hayabusa_job(file_path, options, output_path, timeout):
+    """
+    options: command (e.g. "csv-timeline"), args, hayabusa_path.
+    """
+    hayabusa = _hayabusa(options.get("hayabusa_path", "/home/ronit/hayabusa-2.17.0-lin-x64-gnu"), timeout)
+    sink = _family_module("hayabusa", "hayabusa_stream").FileSink(output_path)
+    command = options.get("command", "csv-timeline")
+    output, errors = hayabusa.run_command(command, list(options.get("args", [])) + ["-f", file_path], sink)
+    if sink.returncode != 0:
+        raise JobError(errors.strip() or f"hayabusa {command} exited with {sink.returncode}")
+    return {"output": output_path, "returncode": sink.returncode, "stderr": errors}
+
+
+def run_sleuthkit_job(file_path, options, output_path, timeout):
+    """
+    options: command (e.g. "fls -r"), args (placed before the image), sleuthkit.
+    """
+    sleuthkit = _sleuthkit(options.get("sleuthkit", "C:/Path/To/SleuthKit/Binaries"))
+    command = options.get("command", "fsstat")
+    output, errors = sleuthkit.run_command(command, list(options.get("args", [])) + [file_path], timeout)
+    if output is None or (not output and errors):
+        raise JobError((errors or "").strip() or f"{command} failed")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(output)
+    return {"output": output_path, "stderr": errors}
+
+
+def run_uac_extract_job(file_path, options, output_path, timeout):
+    """
+    options: output_dir (default: a directory next to the job's result), include, exclude.
+    """
+    output_dir = options.get("output_dir") or os.path.splitext(output_path)[0]
+    rows = _family_module("UAC", "uac_archive").extract_archive(file_path, output_dir, options.get("include"),
+                                                               options.get("exclude"))
+    return {"output_dir": output_dir, "members": len(rows), "errors": sum(1 for row in rows if row["error"])}
+
+
+TOOLS = {
+    "hash": run_hash_job,
+    "exiftool": run_exiftool_job,
+    "hachoir": run_hachoir_job,
+    "hayabusa": run_hayabusa_job,
+    "sleuthkit": run_sleuthkit_job,
+    "uac-extract": run_uac_extract_job,
+}
+
+
+class JobService:
+    """
+    Worker pools draining a JobQueue: workers[tool] threads per tool, each
+    claiming one job at a time, so a tool never runs more jobs at once
+    than its pool size.  Each job's tool is killed after job_timeout
+    seconds (or the job's "timeout" option), so a hung tool can't hold a
+    worker.  stop() lets running jobs finish and claims nothing new; jobs
+    cut off by a hard kill are requeued by any service once their lease
+    runs out.
+    """
+
+    def __init__(self, queue, workers, results_dir=None, handlers=None, job_timeout=DEFAULT_JOB_TIMEOUT):
+        self.queue = queue
+        self.job_timeout = job_timeout
+        self.service_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.workers = {tool: max(1, count) for tool, count in workers.items()}
+        self.results_dir = results_dir or os.path.join(os.path.dirname(os.path.abspath(queue.db_path)), "job-results")
+        self.handlers = handlers or TOOLS
+        unknown = set(self.workers) - set(self.handlers)
+        if unknown:
+            raise ValueError(f"No handler for tools: {', '.join(sorted(unknown))}")
+        os.makedirs(self.results_dir, exist_ok=True)
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._requeue_expired()
+        # Leases outlive the service by LEASE_SECONDS; renew them well before that
+        lease_thread = threading.Thread(target=self._keep_leases, name="leases", daemon=True)
+        lease_thread.start()
+        self._threads.append(lease_thread)
+        for tool, count in self.workers.items():
+            for number in range(count):
+                thread = threading.Thread(target=self._work, args=(tool,), name=f"{tool}-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+
+    @property
+    def stopping(self):
+        return self._stopping.is_set()
+
+    def join(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def _requeue_expired(self):
+        requeued = self.queue.requeue_expired()
+        if requeued:
+            print(f"Requeued {requeued} jobs whose service stopped renewing them")
+
+    def _keep_leases(self):
+        while not self._stopping.wait(LEASE_SECONDS / 3):
+            self.queue.renew(self.service_id)
+            self._requeue_expired()
+        # Keep renewing while the workers drain
+        while any(thread.is_alive() for thread in self._threads if thread is not threading.current_thread()):
+            self.queue.renew(self.service_id)
+            time.sleep(min(LEASE_SECONDS / 3, POLL_INTERVAL))
+
+    def _work(self, tool):
+        handler = self.handlers[tool]
+        while not self._stopping.is_set():
+            job = self.queue.claim(tool, self.service_id)
+            if job is None:
+                self._stopping.wait(POLL_INTERVAL)
+                continue
+            output_path = os.path.join(self.results_dir, f"{job['id']}.txt")
+            timeout = job["options"].get("timeout", self.job_timeout)
+            try:
+                result = handler(job["file"], job["options"], output_path, timeout)
+            except Exception as e:
+                status = self.queue.fail(job["id"], self.service_id, f"{type(e).__name__}: {e}")
+                print(f"Job {job['id']} ({tool}) attempt {job['attempts']} failed: {e} -> {status or 'taken over'}")
+            else:
+                self.queue.complete(job["id"], self.service_id, result)
+
+    def serve(self):
+        """
+        Run until SIGTERM or Ctrl+C, then drain: running jobs finish and
+        their results are recorded before returning.  A second signal
+        exits at once, killing the running tools; its jobs are requeued once
+        their leases run out.
+        """
+        def handle_signal(signum, frame):
+            if self._stopping.is_set():
+                print("\nExiting without waiting for running jobs.")
+                sys.exit(1)
+            print("\nDraining: finishing running jobs, claiming no new ones (signal again to exit now).")
+            self.stop()
+
+        signal.signal(signal.SIGINT, handle_signal)
+        signal.signal(signal.SIGTERM, handle_signal)
+        self.start()
+        print(f"Serving {self.queue.db_path} with workers "
+              + ", ".join(f"{tool}={count}" for tool, count in self.workers.items()))
+        # Join in short steps so the main thread keeps handling signals
+        while not self.join(POLL_INTERVAL):
+            pass
+        print("All workers stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Durable job queue and worker service for the metadata tools.')
+    parser.add_argument('--db', help=f'Queue database (default: $JOB_DB or {DEFAULT_DB}).')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    serve = subparsers.add_parser('serve', help='Run the worker pools until SIGTERM.')
+    serve.add_argument('--workers', default=DEFAULT_WORKERS, help=f'Concurrent jobs per tool (default: {DEFAULT_WORKERS}).')
+    serve.add_argument('--max-depth', type=int, help=f'Queued plus running jobs before submitters block (default: {DEFAULT_MAX_DEPTH}).')
+    serve.add_argument('--results-dir', help='Directory for job output files (default: job-results next to the database).')
+    serve.add_argument('--timeout', type=float, default=DEFAULT_JOB_TIMEOUT, help=f'Seconds before a job\'s tool is killed, unless its options set "timeout" (default: {DEFAULT_JOB_TIMEOUT}).')
+
+    submit = subparsers.add_parser('submit', help='Queue one job per file.')
+    submit.add_argument('tool', choices=sorted(TOOLS), help='Tool to run.')
+    submit.add_argument('files', nargs='+', help='Files to process.')
+    submit.add_argument('--options', default='{}', help='Tool options as JSON, e.g. \'{"command": "fls -r"}\'.')
+    submit.add_argument('--attempts', type=int, default=DEFAULT_MAX_ATTEMPTS, help=f'Attempts before a job fails (default: {DEFAULT_MAX_ATTEMPTS}).')
+    submit.add_argument('--no-wait', action='store_true', help='Fail instead of waiting when the queue is full.')
+
+    status = subparsers.add_parser('status', help='Show one job, or the job counts.')
+    status.add_argument('job_id', type=int, nargs='?')
+
+    result = subparsers.add_parser('result', help="Print a finished job's output.")
+    result.add_argument('job_id', type=int)
+
+    listing = subparsers.add_parser('list', help='List recent jobs.')
+    listing.add_argument('--status', choices=['queued', 'running', 'done', 'failed'])
+    listing.add_argument('--tool')
+    listing.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    with JobQueue(args.db, getattr(args, 'max_depth', None)) as queue:
+        if args.action == 'serve':
+            JobService(queue, parse_limits(args.workers), args.results_dir, job_timeout=args.timeout).serve()
+        elif args.action == 'submit':
+            options = json.loads(args.options)
+            for file_path in args.files:
+                try:
+                    print(queue.submit(args.tool, file_path, options, args.attempts, wait=not args.no_wait))
+                except QueueFull as e:
+                    sys.exit(f"Queue full: {e}")
+        elif args.action == 'status':
+            if args.job_id is None:
+                print(json.dumps(queue.counts(), indent=2))
+            else:
+                job = queue.get(args.job_id)
+                if job is None:
+                    sys.exit(f"No job {args.job_id}")
+                print(json.dumps(job, indent=2, ensure_ascii=False))
+        elif args.action == 'result':
+            job = queue.get(args.job_id)
+            if job is None or job["status"] != "done":
+                sys.exit(f"Job {args.job_id} is {job['status'] if job else 'unknown'}" + (f": {job['error']}" if job and job["error"] else ""))
+            output = job["result"].get("output")
+            if output and os.path.exists(output):
+                with open(output, 'r', encoding='utf-8', errors='replace') as f:
+                    sys.stdout.write(f.read())
+            else:
+                print(json.dumps(job["result"], indent=2, ensure_ascii=False))
+        else:
+            for job in queue.jobs(args.status, args.tool, args.limit):
+                print(f"{job['id']}\t{job['tool']}\t{job['status']}\t{job['attempts']}/{job['max_attempts']}\t{job['file']}")
+
+if __name__ == "__main__":
+    main()
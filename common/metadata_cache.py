@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "metadata-saas")
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def sha256_file(file_path, chunk_size=HASH_CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MetadataCache:
+    """
+    On-disk cache of tool output keyed by file content.
+
+    Entries are keyed by (SHA-256 of the content, tool, tool version, options)
+    and stored as individual files written atomically via a temporary file
+    and os.replace().  A small SQLite index tracks entry sizes and last
+    access for LRU eviction once the cache grows past max_bytes, and
+    remembers (inode, size, mtime_ns) per path so unchanged files are not
+    rehashed.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or os.environ.get("METADATA_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(self.cache_dir, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.cache_dir, "index.sqlite"), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER NOT NULL, accessed REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS file_digests ("
+            "path TEXT PRIMARY KEY, inode INTEGER, size INTEGER, mtime_ns INTEGER, sha256 TEXT)"
+        )
+        self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def file_digest(self, file_path):
+        """
+        SHA-256 of the file, reusing the stored digest when the file's
+        inode, size and mtime_ns are unchanged since it was last hashed.
+        """
+        path = os.path.realpath(file_path)
+        st = os.stat(path)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sha256 FROM file_digests WHERE path = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+                (path, st.st_ino, st.st_size, st.st_mtime_ns),
+            ).fetchone()
+        if row:
+            return row[0]
+
+        digest = sha256_file(path)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO file_digests (path, inode, size, mtime_ns, sha256) VALUES (?, ?, ?, ?, ?)",
+                (path, st.st_ino, st.st_size, st.st_mtime_ns, digest),
+            )
+            self._db.commit()
+        return digest
+
+    @staticmethod
+    def make_key(content_digest, tool, tool_version, options):
+        material = json.dumps([content_digest, tool, tool_version, options], sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _object_path(self, key):
+        return os.path.join(self.objects_dir, key[:2], key)
+
+    def _touch(self, key):
+        with self._lock:
+            self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+
+    def get(self, key):
+        try:
+            with open(self._object_path(key), 'r', encoding='utf-8') as f:
+                value = f.read()
+        except FileNotFoundError:
+            return None
+        self._touch(key)
+        return value
+
+    def get_path(self, key):
+        """
+        Path of an entry stored with put_file(), or None.  Copy it out rather
+        than keeping it open: eviction may remove it.
+        """
+        object_path = self._object_path(key)
+        if not os.path.exists(object_path):
+            return None
+        self._touch(key)
+        return object_path
+
+    def _write(self, key, write):
+        object_path = self._object_path(key)
+        directory = os.path.dirname(object_path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a temporary file in the same directory, then rename over the
+        # final name so readers never observe a partially written entry.
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+                size = f.tell()
+            os.replace(temp_path, object_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, size, accessed) VALUES (?, ?, ?)",
+                (key, size, time.time()),
+            )
+            self._db.commit()
+        self.evict()
+
+    def put(self, key, value):
+        data = value.encode("utf-8")
+        self._write(key, lambda f: f.write(data))
+
+    def put_file(self, key, source_path, offset=0):
+        """
+        Store the bytes of source_path from offset on, streamed so large
+        tool output never has to fit in memory.
+        """
+        def copy(f):
+            with open(source_path, 'rb') as source:
+                source.seek(offset)
+                shutil.copyfileobj(source, f, COPY_BUFFER_SIZE)
+        self._write(key, copy)
+
+    def evict(self):
+        """
+        Drop least recently used entries until the cache fits in max_bytes.
+        """
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+                try:
+                    os.remove(self._object_path(key))
+                except FileNotFoundError:
+                    pass
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+            self._db.commit()
+
+    def lookup(self, file_path, tool, tool_version, options):
+        """
+        Return (key, cached value or None) for a file and tool invocation.
+        Raises OSError if the file cannot be read for hashing.
+        """
+        key = self.make_key(self.file_digest(file_path), tool, tool_version, options)
+        return key, self.get(key)
+
+    def cached(self, file_path, tool, tool_version, options, compute):
+        """
+        Return the cached output for file_path, calling compute() and storing
+        its result on a miss.  Results of None are not cached, and neither
+        are results for files that cannot be hashed: compute() still runs
+        and reports the problem the way the tool would without a cache.
+        """
+        try:
+            key, value = self.lookup(file_path, tool, tool_version, options)
+        except OSError:
+            return compute()
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.put(key, value)
+        return value
@@ -0,0 +1,383 @@
+import argparse
+import asyncio
+import atexit
+import codecs
+import collections
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+READ_SIZE = 64 * 1024
+# Seconds a timed-out process group gets to exit after SIGTERM before it is killed
+KILL_GRACE = 5
+DEFAULT_TOOL_LIMIT = os.cpu_count() or 1
+# Raw stdout chunks a ToolStream buffers before the command is paused
+STREAM_QUEUE_CHUNKS = 16
+# How often a paused pump or an idle ToolStream consumer checks again
+STREAM_POLL_SECONDS = 0.05
+
+CommandResult = collections.namedtuple("CommandResult", ["returncode", "stdout", "stderr", "timed_out", "elapsed"])
+
+
+def tool_name(argv):
+    # "C:/TSK/bin/fls.exe" and "fls" share the same limit
+    return os.path.splitext(os.path.basename(argv[0]))[0].lower()
+
+
+def parse_limits(text):
+    """
+    "fls=8,hayabusa=2" -> {"fls": 8, "hayabusa": 2}
+    """
+    limits = {}
+    for item in (text or "").split(","):
+        if "=" in item:
+            tool, limit = item.split("=", 1)
+            limits[tool.strip().lower()] = max(1, int(limit))
+    return limits
+
+
+class _LineSplitter:
+    """
+    Decode a byte stream incrementally and hand complete lines to a callback.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.partial = ""
+
+    def feed(self, data, final=False):
+        text = self.partial + self.decoder.decode(data, final)
+        end = len(text) if final else text.rfind("\n") + 1
+        self.partial = text[end:]
+        # Only "\n" ends a line; a progress bar redrawn with "\r" stays one line
+        lines = text[:end].split("\n")
+        for line in lines[:-1]:
+            self.callback(line + "\n")
+        if lines[-1]:
+            self.callback(lines[-1])
+
+
+class ToolRunner:
+    """
+    Runs every external tool invocation on one asyncio event loop.
+
+    Commands are argv lists started with asyncio.create_subprocess_exec, so
+    no shell ever parses a file name, and with stdin closed, so a tool that
+    stops to prompt fails instead of waiting forever.  Each tool (keyed by executable name)
+    has its own semaphore, so e.g. icat may run eight at a time while
+    Hayabusa runs two, and hundreds of queued calls cost a coroutine each
+    instead of a thread.  A command that outlives its timeout has its
+    whole process group terminated, children included, and so does every
+    running command when the program is interrupted or exits.
+
+    Synchronous callers use run(); submit() returns a concurrent Future.
+    Both hand the coroutine to a loop on a background thread.
+    """
+
+    def __init__(self, limits=None, default_limit=DEFAULT_TOOL_LIMIT, default_timeout=None):
+        self.limits = dict(limits or {})
+        self.default_limit = max(1, default_limit)
+        self.default_timeout = default_timeout
+        self._semaphores = {}
+        # pid -> asyncio Process of every command started and not yet reaped
+        self._processes = {}
+        # Set by kill_all(): the program is going down, so queued commands must not start
+        self._stopped = False
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def set_limit(self, tool, limit):
+        # Applies to semaphores created after the call
+        self.limits[tool.lower()] = max(1, limit)
+
+    def _semaphore(self, tool):
+        semaphore = self._semaphores.get(tool)
+        if semaphore is None:
+            semaphore = self._semaphores[tool] = asyncio.Semaphore(self.limits.get(tool, self.default_limit))
+        return semaphore
+
+    async def run_async(self, argv, tool=None, timeout=None, on_stdout=None, on_stderr=None, capture=True,
+                        stderr_lines=None, cwd=None, env=None, stdout_queue=None):
+        """
+        Run argv and return a CommandResult.
+
+        on_stdout/on_stderr receive each decoded line as it arrives.  With
+        capture=False stdout is not collected (stderr always is), which
+        keeps memory flat for tools that print gigabytes; stderr_lines keeps
+        only that many trailing stderr lines.  stdout_queue (a bounded
+        queue.Queue, see ToolStream) receives raw stdout chunks instead,
+        then None; the command waits while it is full.  Raises OSError if
+        the executable cannot be started.
+        """
+        argv = [str(arg) for arg in argv]
+        tool = (tool or tool_name(argv)).lower()
+        timeout = self.default_timeout if timeout is None else timeout
+        async with self._semaphore(tool):
+            if self._stopped:
+                raise RuntimeError(f"Not starting {argv[0]}: the tool runner was stopped")
+            start = time.perf_counter()
+            if os.name == "nt":
+                process = await asyncio.create_subprocess_exec(
+                    *argv, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                    cwd=cwd, env=env, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+            else:
+                process = await asyncio.create_subprocess_exec(
+                    *argv, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                    cwd=cwd, env=env, start_new_session=True)
+
+            self._processes[process.pid] = process
+            stdout, stderr = [], collections.deque(maxlen=stderr_lines)
+
+            def collect(chunks, callback, keep):
+                def handle(line):
+                    if keep:
+                        chunks.append(line)
+                    if callback is not None:
+                        callback(line)
+                return _LineSplitter(handle)
+
+            if stdout_queue is not None:
+                stdout_reader = self._pump_queue(process.stdout, stdout_queue)
+            else:
+                stdout_reader = self._pump(process.stdout, collect(stdout, on_stdout, capture))
+            readers = asyncio.gather(
+                stdout_reader,
+                self._pump(process.stderr, collect(stderr, on_stderr, True)))
+
+            async def finish():
+                await readers
+                return await process.wait()
+
+            timed_out = False
+            try:
+                # The deadline covers the exit too: a tool may close its output and keep running
+                returncode = await asyncio.wait_for(finish(), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                returncode = await self._kill(process)
+                await asyncio.gather(readers, return_exceptions=True)
+                stderr.append(f"\n{argv[0]} timed out after {timeout}s\n")
+            except BaseException:
+                # Cancelled by the caller, or a callback failed; don't leave the command running
+                readers.cancel()
+                await self._kill(process)
+                await asyncio.gather(readers, return_exceptions=True)
+                raise
+            finally:
+                self._processes.pop(process.pid, None)
+            return CommandResult(returncode, "".join(stdout) if capture else None, "".join(stderr), timed_out,
+                                 time.perf_counter() - start)
+
+    @staticmethod
+    async def _pump(stream, splitter):
+        while True:
+            data = await stream.read(READ_SIZE)
+            if not data:
+                splitter.feed(b"", final=True)
+                return
+            splitter.feed(data)
+
+    @staticmethod
+    async def _pump_queue(stream, chunks):
+        while True:
+            data = await stream.read(READ_SIZE)
+            # Never block the loop on a slow consumer; the pipe filling up pauses the command instead
+            while True:
+                try:
+                    chunks.put_nowait(data or None)
+                    break
+                except queue.Full:
+                    await asyncio.sleep(STREAM_POLL_SECONDS)
+            if not data:
+                return
+
+    @staticmethod
+    async def _kill(process):
+        if process.returncode is not None:
+            return process.returncode
+        try:
+            if os.name == "nt":
+                # taskkill /T takes the child processes with it
+                killer = await asyncio.create_subprocess_exec(
+                    "taskkill", "/F", "/T", "/PID", str(process.pid),
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+                await killer.wait()
+            else:
+                os.killpg(process.pid, signal.SIGTERM)
+                try:
+                    return await asyncio.wait_for(process.wait(), KILL_GRACE)
+                except asyncio.TimeoutError:
+                    os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            if process.returncode is None:
+                process.kill()
+        return await process.wait()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="tool-runner", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def submit(self, argv, **kwargs):
+        """
+        Start argv on the runner's loop and return a concurrent.futures.Future
+        of its CommandResult; cancelling the future kills the command.
+        """
+        return asyncio.run_coroutine_threadsafe(self.run_async(argv, **kwargs), self._ensure_loop())
+
+    def run(self, argv, **kwargs):
+        """
+        Blocking run(): same arguments as run_async().  Ctrl+C or sys.exit()
+        while waiting kills every running command before propagating, since
+        the loop thread may not get to do it before the program ends.
+        """
+        future = self.submit(argv, **kwargs)
+        try:
+            return future.result()
+        except (KeyboardInterrupt, SystemExit):
+            future.cancel()
+            self.kill_all()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+
+    def stream(self, argv, **kwargs):
+        """
+        ToolStream over argv's raw stdout; same arguments as run_async().
+        """
+        return ToolStream(self, argv, **kwargs)
+
+    def kill_all(self):
+        """
+        Kill the process group of every running command, synchronously and
+        from any thread, and start no further ones.  For interrupt handlers
+        and exit hooks.
+        """
+        self._stopped = True
+        for pid, process in list(self._processes.items()):
+            if process.returncode is not None:
+                continue
+            try:
+                if os.name == "nt":
+                    subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                else:
+                    os.killpg(pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+    def close(self):
+        self.kill_all()
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+                self._loop.close()
+                self._loop = self._thread = None
+                self._semaphores = {}
+
+
+class ToolStream:
+    """
+    Iterate over a command's raw stdout chunks in the calling thread while
+    the command runs on the runner, with the runner's timeout, per-tool
+    limit and kill-on-interrupt.  result holds the CommandResult once the
+    iteration has finished; stopping early kills the command.
+    """
+
+    def __init__(self, runner, argv, **kwargs):
+        self.runner = runner
+        self.argv = argv
+        self.kwargs = kwargs
+        self.result = None
+
+    def __iter__(self):
+        chunks = queue.Queue(STREAM_QUEUE_CHUNKS)
+        future = self.runner.submit(self.argv, stdout_queue=chunks, **self.kwargs)
+        finished = False
+        try:
+            while True:
+                try:
+                    data = chunks.get(timeout=STREAM_POLL_SECONDS)
+                except queue.Empty:
+                    # The command may have failed to start, or been killed before its EOF was queued
+                    if not future.done():
+                        continue
+                    try:
+                        data = chunks.get_nowait()
+                    except queue.Empty:
+                        break
+                if data is None:
+                    break
+                yield data
+            self.result = future.result()
+            finished = True
+        except (KeyboardInterrupt, SystemExit):
+            future.cancel()
+            self.runner.kill_all()
+            raise
+        finally:
+            if not finished:
+                future.cancel()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """
+    The process-wide ToolRunner.  TOOL_CONCURRENCY ("fls=8,hayabusa=2")
+    sets per-tool limits and TOOL_TIMEOUT a default timeout in seconds.
+    """
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            timeout = os.environ.get("TOOL_TIMEOUT")
+            _runner = ToolRunner(parse_limits(os.environ.get("TOOL_CONCURRENCY")),
+                                 default_timeout=float(timeout) if timeout else None)
+            # The loop runs on a daemon thread, so nothing else would stop its commands at exit
+            atexit.register(_runner.kill_all)
+        return _runner
+
+
+def kill_running_tools():
+    """
+    Kill every command started through get_runner(); call from interrupt
+    handlers before exiting.
+    """
+    if _runner is not None:
+        _runner.kill_all()
+
+
+def run_tool(argv, **kwargs):
+    return get_runner().run(argv, **kwargs)
+
+
+def stream_tool(argv, **kwargs):
+    return get_runner().stream(argv, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run one command through the shared tool runner.')
+    parser.add_argument('--timeout', type=float, help='Seconds before the command and its children are killed.')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='Executable and arguments.')
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+
+    result = run_tool(command, timeout=args.timeout, on_stdout=sys.stdout.write, on_stderr=sys.stderr.write,
+                      capture=False)
+    sys.exit(124 if result.timed_out else result.returncode)
+
+if __name__ == "__main__":
+    main()
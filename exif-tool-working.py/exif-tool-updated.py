@@ -1,10 +1,18 @@
+import atexit
 import os
-import subprocess
 import datetime
 import time
 import sys
 import signal
 
+from exiftool_pool import ExifToolPool
+
+# Path to the Exiftool executable
+EXIFTOOL_PATH = "/home/kali/Desktop/exiftool"
+
+# Shared pool of persistent ExifTool workers, started on first use
+_exiftool_pool = None
+
 def print_banner():
     print("\n\n\033[1;33;40m ####################################################\033[0m")
     print("\033[1;33;40m#\033[0m                                                   \033[1;33;40m#\033[0m")
@@ -24,18 +32,22 @@ def handle_interrupt(signum, frame):
     print("\nProcess interrupted.")
     sys.exit(1)
 
+def get_exiftool_pool(workers=None):
+    global _exiftool_pool
+    if _exiftool_pool is None:
+        _exiftool_pool = ExifToolPool(EXIFTOOL_PATH, workers=workers)
+        atexit.register(_exiftool_pool.close)
+    return _exiftool_pool
+
 def run_exiftool(file_path, exiftool_args):
-    # Path to the Exiftool executable
-    exiftool_path = "/home/kali/Desktop/exiftool"
-    
-    # Construct the Exiftool command with additional arguments
-    exiftool_command = f"\"{exiftool_path}\" {exiftool_args} \"{file_path}\""
-    
-    # Run the Exiftool command and capture the output
-    result = subprocess.run(exiftool_command, shell=True, capture_output=True, text=True)
+    # Run the Exiftool command on a persistent worker and capture the output;
+    # each argument is sent to the worker on its own line
+    output, errors = get_exiftool_pool().execute(list(exiftool_args), paths=[file_path])
+    if errors:
+        print(f"Exiftool reported: {errors.strip()}")
     
     # Return the captured output
-    return result.stdout
+    return output
 
 def save_output_to_file(output, file_path, directory):
     # Ensure the directory exists
@@ -68,7 +80,7 @@ def main():
     
     # Extract file path and any additional ExifTool arguments
     file_path = sys.argv[1]
-    exiftool_args = ' '.join(sys.argv[2:])
+    exiftool_args = sys.argv[2:]
 
     # Validate file path
     if not os.path.isfile(file_path):
@@ -0,0 +1,188 @@
+import json
+import os
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Keep each request comfortably below the platform argument limit so the same
+# batches also work if they are ever handed to a one-shot exiftool call.
+DEFAULT_MAX_FILES = 500
+ARG_MAX_FALLBACK = 32 * 1024
+# Re-reads only the tags that come from the path and stat (name, directory,
+# dates, permissions); -fast4 stops ExifTool from parsing the file itself
+SYSTEM_TAG_ARGS = ["-fast4", "-System:all"]
+
+
+def get_arg_max():
+    try:
+        arg_max = os.sysconf("SC_ARG_MAX")
+    except (AttributeError, ValueError, OSError):
+        arg_max = -1
+    if arg_max <= 0:
+        return ARG_MAX_FALLBACK
+    # Leave room for the environment and the interpreter's own arguments
+    return max(ARG_MAX_FALLBACK, arg_max // 2 - sum(len(k) + len(v) + 2 for k, v in os.environ.items()))
+
+
+def iter_files(root):
+    """
+    Recursively yield every regular file below root in a stable order.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            file_path = os.path.join(dirpath, filename)
+            if os.path.isfile(file_path):
+                yield file_path
+
+
+def source_file(path):
+    """
+    A path as it comes back in ExifTool's SourceFile: the bytes sent to the
+    worker decoded the way its output is, normalized.
+    """
+    return os.path.normpath(os.fsencode(path).decode("utf-8", errors="replace"))
+
+
+def iter_batches(paths, max_bytes=None, max_files=DEFAULT_MAX_FILES):
+    """
+    Group paths into lists whose combined argument size stays under max_bytes.
+    """
+    if max_bytes is None:
+        max_bytes = get_arg_max()
+    batch = []
+    batch_bytes = 0
+    for path in paths:
+        # One byte for the separator (newline on the worker's stdin, NUL in argv)
+        size = len(os.fsencode(path)) + 1
+        if batch and (batch_bytes + size > max_bytes or len(batch) >= max_files):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(path)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def extract_batch(pool, batch, exiftool_args=None):
+    """
+    Run one batch through the pool and return a list of per-file records.
+    """
+    args = ["-j"] + list(exiftool_args or [])
+    # Allow roughly one extra second per file on top of the per-request timeout
+    output, errors = pool.execute(args, timeout=pool.timeout + len(batch), paths=batch)
+
+    records = []
+    try:
+        records = json.loads(output) if output.strip() else []
+    except ValueError as e:
+        errors = f"{errors}Could not parse Exiftool JSON output: {e}\n"
+
+    # Files Exiftool could not read only show up on stderr
+    seen = {os.path.normpath(record.get("SourceFile", "")) for record in records}
+    for path in batch:
+        if source_file(path) not in seen:
+            records.append({"SourceFile": path, "Error": errors.strip() or "No metadata returned."})
+    return records
+
+
+def refresh_cached(pool, hits, exiftool_args=None):
+    """
+    A cached record is keyed by content, so it carries the SourceFile and
+    System tags of whichever file was extracted first.  Re-read those tags
+    for the current paths and return (records, stale) where stale lists
+    the paths ExifTool could not answer for.
+    """
+    args = ["-j"] + list(exiftool_args or []) + SYSTEM_TAG_ARGS
+    output, errors = pool.execute(args, paths=[path for path, _ in hits])
+    try:
+        fresh = json.loads(output) if output.strip() else []
+    except ValueError:
+        fresh = []
+    by_source = {os.path.normpath(record.get("SourceFile", "")): record for record in fresh}
+
+    records, stale = [], []
+    for path, record in hits:
+        system = by_source.get(source_file(path))
+        if system is None:
+            stale.append(path)
+            continue
+        record.update(system)
+        records.append(record)
+    return records, stale
+
+
+def extract_tree(pool, root, sink, exiftool_args=None, max_files=DEFAULT_MAX_FILES, cache=None, tool_version=None):
+    """
+    Walk root, fan the batches out over the pool's workers and write one JSON
+    line per file to sink as batches finish.  Returns (files, errors).
+
+    When a MetadataCache is given, files whose content was already extracted
+    with the same Exiftool version and arguments are answered from the cache
+    (with their path and stat tags re-read, see refresh_cached()) and only
+    the misses are fully extracted.
+    """
+    files = 0
+    failed = 0
+    cache_options = ["-j"] + list(exiftool_args or [])
+    # Cache keys of the files currently in flight, by normalized path
+    cache_keys = {}
+
+    def write_record(record):
+        nonlocal files, failed
+        sink.write(json.dumps(record, ensure_ascii=False) + "\n")
+        files += 1
+        if "Error" in record:
+            failed += 1
+
+    def iter_misses():
+        hits = []
+
+        def flush():
+            records, stale = refresh_cached(pool, hits, exiftool_args)
+            hits.clear()
+            for record in records:
+                write_record(record)
+            return stale
+
+        for file_path in iter_files(root):
+            if cache is None:
+                yield file_path
+                continue
+            try:
+                key, value = cache.lookup(file_path, "exiftool", tool_version, cache_options)
+            except OSError:
+                # Unreadable: let ExifTool report it in the file's record, uncached
+                yield file_path
+                continue
+            if value is not None:
+                hits.append((file_path, json.loads(value)))
+                if len(hits) >= max_files:
+                    yield from flush()
+            else:
+                cache_keys[source_file(file_path)] = key
+                yield file_path
+        if hits:
+            yield from flush()
+
+    # Bound the number of batches in flight so huge trees are never fully queued
+    max_pending = pool.size * 2
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        pending = set()
+
+        def drain(return_when):
+            nonlocal pending
+            done, pending = wait(pending, return_when=return_when)
+            for future in done:
+                for record in future.result():
+                    write_record(record)
+                    key = cache_keys.pop(os.path.normpath(record.get("SourceFile", "")), None)
+                    if key is not None and "Error" not in record:
+                        cache.put(key, json.dumps(record, ensure_ascii=False))
+
+        for batch in iter_batches(iter_misses(), max_files=max_files):
+            pending.add(executor.submit(extract_batch, pool, batch, exiftool_args))
+            if len(pending) >= max_pending:
+                drain(FIRST_COMPLETED)
+        if pending:
+            drain(ALL_COMPLETED)
+    return files, failed
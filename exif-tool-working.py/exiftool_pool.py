@@ -0,0 +1,199 @@
+import collections
+import itertools
+import os
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ExifToolResult = collections.namedtuple("ExifToolResult", ["path", "output", "errors"])
+
+
+def path_argument(path):
+    """
+    A file path as an ExifTool argument: bytes in the file system encoding,
+    so names that are not valid UTF-8 reach ExifTool unchanged, and
+    relative paths prefixed with ./ so a name like "-j.jpg" is not read as
+    an option.
+    """
+    path = os.fsencode(path)
+    if not os.path.isabs(path):
+        path = os.path.join(os.fsencode(os.curdir), path)
+    return path
+
+
+class ExifToolWorker:
+    """
+    One long-lived `exiftool -stay_open True -@ -` process.
+
+    Each request is written to stdin as one argument per line followed by
+    -execute{id}; options are sent as UTF-8 and file paths via
+    path_argument().  ExifTool answers with {ready{id}} on stdout once the
+    request is done, and -echo4 places the same marker on stderr so both
+    streams can be framed per request.
+    """
+
+    def __init__(self, exiftool_path, common_args=None):
+        self.exiftool_path = exiftool_path
+        self.common_args = list(common_args or [])
+        self.process = None
+        self._stdout = None
+        self._stderr = None
+        self._sequence = itertools.count(1)
+
+    def start(self):
+        cmd = [self.exiftool_path, "-stay_open", "True", "-@", "-"]
+        if self.common_args:
+            cmd += ["-common_args"] + self.common_args
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Reader threads keep both pipes drained so a chatty stderr can never
+        # block ExifTool while we are waiting on stdout, and let us time out.
+        self._stdout = self._start_reader(self.process.stdout)
+        self._stderr = self._start_reader(self.process.stderr)
+
+    def _start_reader(self, stream):
+        lines = queue.Queue()
+
+        def pump():
+            for line in iter(stream.readline, b""):
+                lines.put(line)
+            lines.put(None)
+
+        threading.Thread(target=pump, daemon=True).start()
+        return lines
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def execute(self, args, timeout=None, paths=()):
+        request = [arg.encode("utf-8") for arg in args] + [path_argument(path) for path in paths]
+        for arg in request:
+            if b"\n" in arg:
+                raise ValueError(f"ExifTool arguments cannot contain newlines: {arg!r}")
+        if not self.is_alive():
+            self.start()
+
+        request_id = next(self._sequence)
+        marker = f"{{ready{request_id}}}"
+        request += [b"-echo4", marker.encode("utf-8"), f"-execute{request_id}".encode("utf-8")]
+        self.process.stdin.write(b"\n".join(request) + b"\n")
+        self.process.stdin.flush()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        output = self._read_until(self._stdout, marker, deadline, args, timeout)
+        errors = self._read_until(self._stderr, marker, deadline, args, timeout)
+        return output, errors
+
+    def _read_until(self, lines, marker, deadline, args, timeout):
+        chunks = []
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                line = lines.get(timeout=remaining)
+            except queue.Empty:
+                raise subprocess.TimeoutExpired(args, timeout)
+            if line is None:
+                raise BrokenPipeError("ExifTool worker exited unexpectedly")
+            text = line.decode("utf-8", errors="replace")
+            if text.rstrip("\r\n") == marker:
+                return "".join(chunks)
+            chunks.append(text)
+
+    def close(self, timeout=5):
+        if not self.is_alive():
+            return
+        try:
+            self.process.stdin.write(b"-stay_open\nFalse\n")
+            self.process.stdin.flush()
+            self.process.wait(timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+    def kill(self):
+        if self.is_alive():
+            self.process.kill()
+            self.process.wait()
+
+
+class ExifToolPool:
+    """
+    Pool of persistent ExifTool workers.
+
+    Workers are spawned lazily up to `workers`, so a single-file run still
+    starts only one Perl interpreter.  A worker that times out is killed and
+    replaced; a worker that crashes is restarted and the request retried once.
+    """
+
+    def __init__(self, exiftool_path, workers=None, timeout=60, common_args=None):
+        self.exiftool_path = exiftool_path
+        self.size = max(1, workers or os.cpu_count() or 1)
+        self.timeout = timeout
+        self.common_args = common_args
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._workers) < self.size:
+                worker = ExifToolWorker(self.exiftool_path, self.common_args)
+                self._workers.append(worker)
+                return worker
+        return self._idle.get()
+
+    def execute(self, args, timeout=None, paths=()):
+        """
+        Run one ExifTool command line, the options in args followed by the
+        file paths, and return (stdout, stderr).
+        """
+        if timeout is None:
+            timeout = self.timeout
+        worker = self._checkout()
+        try:
+            for attempt in range(2):
+                try:
+                    return worker.execute(args, timeout, paths)
+                except subprocess.TimeoutExpired:
+                    worker.kill()
+                    return "", f"ExifTool timed out after {timeout} seconds."
+                except (BrokenPipeError, OSError) as e:
+                    worker.kill()
+                    if attempt:
+                        return "", f"ExifTool worker failed: {e}"
+        finally:
+            self._idle.put(worker)
+
+    def extract(self, paths, args=None):
+        """
+        Extract metadata for every path, spreading requests over the workers.
+        Results are returned in the same order as `paths`.
+        """
+        args = list(args or [])
+        paths = list(paths)
+
+        def extract_one(path):
+            output, errors = self.execute(args, paths=[path])
+            return ExifToolResult(path, output, errors)
+
+        if len(paths) <= 1:
+            return [extract_one(path) for path in paths]
+        with ThreadPoolExecutor(max_workers=min(self.size, len(paths))) as executor:
+            return list(executor.map(extract_one, paths))
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
+        self._idle = queue.Queue()
@@ -1,11 +1,28 @@
+import argparse
+import atexit
 import os
 import subprocess
 import datetime
-import time
 import sys
 import signal
 import platform
 
+from exiftool_batch import DEFAULT_MAX_FILES, SYSTEM_TAG_ARGS, extract_tree
+from exiftool_pool import ExifToolPool
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.hashing import hash_manifest
+from common.metadata_cache import MetadataCache
+
+# Shared pool of persistent ExifTool workers, started on first use
+_exiftool_pool = None
+_exiftool_version = None
+
+# Result cache keyed by file content, created on first use unless --no-cache is given
+_metadata_cache = None
+use_cache = True
+
 def print_banner():
     print("\n\n\033[1;33;40m ####################################################\033[0m")
     print("\033[1;33;40m#\033[0m                                                   \033[1;33;40m#\033[0m")
@@ -33,25 +50,70 @@ def make_executable(file_path):
         except subprocess.CalledProcessError as e:
             print(f"Error making {file_path} executable: {e}")
 
-def run_exiftool(file_path):
+def get_exiftool_path():
     # Determine the platform and set the path to Exiftool accordingly
     if platform.system().lower() == "windows":
-        exiftool_path = r"C:\Users\kavis\Downloads\exiftool-12.93_64\exiftool(-k).exe"
-    else:
-        exiftool_path = "/usr/local/bin/exiftool"  # Default path for Unix-based systems
+        return r"C:\Users\kavis\Downloads\exiftool-12.93_64\exiftool(-k).exe"
+    return "/usr/local/bin/exiftool"  # Default path for Unix-based systems
 
-    # Make Exiftool executable if on Unix-based systems
-    if platform.system().lower() != "windows":
-        make_executable(exiftool_path)
+def get_exiftool_pool(workers=None):
+    global _exiftool_pool
+    if _exiftool_pool is None:
+        exiftool_path = get_exiftool_path()
 
-    # Construct the Exiftool command
-    exiftool_command = [exiftool_path, file_path]
+        # Make Exiftool executable if on Unix-based systems
+        if platform.system().lower() != "windows":
+            make_executable(exiftool_path)
+
+        _exiftool_pool = ExifToolPool(exiftool_path, workers=workers)
+        atexit.register(_exiftool_pool.close)
+    return _exiftool_pool
+
+def get_exiftool_version():
+    global _exiftool_version
+    if _exiftool_version is None:
+        output, errors = get_exiftool_pool().execute(["-ver"])
+        _exiftool_version = output.strip()
+    return _exiftool_version
+
+def get_metadata_cache():
+    global _metadata_cache
+    if _metadata_cache is None and use_cache:
+        _metadata_cache = MetadataCache()
+        atexit.register(_metadata_cache.close)
+    return _metadata_cache
+
+def refresh_system_lines(output, file_path, timeout=None):
+    # A cached report names the file it was made from; re-read the path and stat tags
+    # (name, directory, dates, permissions) for this file without parsing it again
+    fresh, errors = get_exiftool_pool().execute(SYSTEM_TAG_ARGS, timeout, paths=[file_path])
+    lines = {}
+    for line in fresh.splitlines(keepends=True):
+        lines[line.split(":", 1)[0].rstrip()] = line
+    return "".join(lines.get(line.split(":", 1)[0].rstrip(), line) for line in output.splitlines(keepends=True))
+
+def run_exiftool(file_path, timeout=None):
+    extracted = []
+
+    def extract():
+        # Send the file to a persistent Exiftool worker instead of spawning a new process
+        output, errors = get_exiftool_pool().execute([], timeout, paths=[file_path])
+        if errors:
+            print(f"Exiftool reported: {errors.strip()}")
+        extracted.append(True)
+        return output or None
+
+    # Reuse the previous result if these exact bytes were already extracted
+    cache = get_metadata_cache()
+    if cache is None:
+        output = extract()
+    else:
+        output = cache.cached(file_path, "exiftool", get_exiftool_version(), [], extract)
+        if output and not extracted:
+            output = refresh_system_lines(output, file_path, timeout)
 
-    # Run the Exiftool command and capture the output
-    result = subprocess.run(exiftool_command, capture_output=True, text=True)
-    
     # Return the captured output
-    return result.stdout
+    return output or ""
 
 def save_output_to_file(output, file_path, directory):
     # Ensure the directory exists
@@ -67,34 +129,72 @@ def save_output_to_file(output, file_path, directory):
         f.write(output)
     
     print_completion_message(output_file_path)
-    
-    # Introduce a small delay to ensure all operations are complete
-    time.sleep(2)
+
+def run_batch(directory_path, output_directory, workers=None, max_files=DEFAULT_MAX_FILES):
+    # Ensure the directory exists
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    # Stream one JSON line per file into a single output file
+    output_file_path = os.path.join(output_directory, "metadata.jsonl")
+    with open(output_file_path, 'w', encoding='utf-8') as sink:
+        pool = get_exiftool_pool(workers)
+        cache = get_metadata_cache()
+        tool_version = get_exiftool_version() if cache is not None else None
+        files, failed = extract_tree(pool, directory_path, sink, max_files=max_files, cache=cache, tool_version=tool_version)
+
+    print(f"Processed {files} files ({failed} with errors).")
+    print_completion_message(output_file_path)
+
+def write_hash_manifest(path, output_directory, workers=None):
+    # Chain of custody: hash the inputs (every digest from one read of each file)
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+    manifest_path = os.path.join(output_directory, "hash_manifest.csv")
+    files, errors = hash_manifest([path], manifest_path, workers=workers)
+    print(f"Hashed {files} files ({errors} unreadable); manifest stored in: {manifest_path}")
 
 def main():
     # Set up signal handling for interruptions
     signal.signal(signal.SIGINT, handle_interrupt)
 
+    parser = argparse.ArgumentParser(description='Extract metadata from a file, or recursively from a directory, with Exiftool.')
+    parser.add_argument('path', nargs='?', help='File or directory to analyze. Prompted for when omitted.')
+    parser.add_argument('--workers', type=int, help='Number of Exiftool processes to run (default: number of CPUs).')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_MAX_FILES, help='Maximum number of files sent to Exiftool per request.')
+    parser.add_argument('--no-cache', action='store_true', help='Always re-extract instead of reusing cached results.')
+    parser.add_argument('--hash', action='store_true', help='Write an MD5/SHA-1/SHA-256 manifest of the input files.')
+    args = parser.parse_args()
+
+    global use_cache
+    use_cache = not args.no_cache
+
     print_banner()
 
     # Ask user for the file path
-    file_path = input("Enter the path to the file: ")
+    file_path = args.path or input("Enter the path to the file or directory: ")
     
     # Validate file path
-    if not os.path.isfile(file_path):
-        print("Invalid file path. Please ensure the file exists and try again.")
+    if not os.path.exists(file_path):
+        print("Invalid file path. Please ensure the file or directory exists and try again.")
         sys.exit(1)
-    
-    # Run Exiftool with the specified file
-    output = run_exiftool(file_path)
-    
-    # Introduce a small delay to ensure that the output is fully captured
-    time.sleep(1)
 
-    # Save the output to a text file in an output directory with a timestamp
+    # Save the output in an output directory with a timestamp
     script_directory = os.path.dirname(os.path.abspath(__file__))
     timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
     output_directory = os.path.join(script_directory, f"output_{timestamp}")
+
+    if args.hash:
+        write_hash_manifest(file_path, output_directory, args.workers)
+
+    if os.path.isdir(file_path):
+        # Batch mode: walk the tree and fan the files out over the worker pool
+        run_batch(file_path, output_directory, args.workers, args.batch_size)
+        return
+
+    # Run Exiftool with the specified file; a single file only needs one worker
+    get_exiftool_pool(workers=1)
+    output = run_exiftool(file_path)
     
     save_output_to_file(output, file_path, output_directory)
 
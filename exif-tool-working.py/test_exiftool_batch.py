@@ -0,0 +1,72 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+from exiftool_batch import extract_tree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.metadata_cache import MetadataCache
+
+
+class FakePool:
+    """
+    Answers like `exiftool -j`: System tags from the path and stat, plus a
+    content tag unless -fast4 asks for the System tags only.
+    """
+    size = 1
+    timeout = 5
+
+    def __init__(self):
+        self.parsed = []
+
+    def execute(self, args, timeout=None, paths=()):
+        records = []
+        for path in paths:
+            record = {"SourceFile": path, "FileName": os.path.basename(path), "Directory": os.path.dirname(path),
+                      "FileModifyDate": os.stat(path).st_mtime}
+            if "-fast4" not in args:
+                self.parsed.append(path)
+                with open(path, 'rb') as f:
+                    record["Comment"] = f.read().decode()
+            records.append(record)
+        return json.dumps(records), ""
+
+
+class ExtractTreeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = MetadataCache(os.path.join(self.temp_dir.name, "cache"))
+
+    def tearDown(self):
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+    def write(self, name, data, mtime):
+        path = os.path.join(self.temp_dir.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(data)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def extract(self, pool, root):
+        sink = io.StringIO()
+        extract_tree(pool, root, sink, cache=self.cache, tool_version="1")
+        return [json.loads(line) for line in sink.getvalue().splitlines()]
+
+    def test_identical_files_keep_their_own_path_tags(self):
+        one = self.write("a/one.jpg", "same bytes", 1000000000)
+        two = self.write("b/two.jpg", "same bytes", 1500000000)
+        pool = FakePool()
+        self.extract(pool, os.path.dirname(one))
+        records = self.extract(pool, os.path.dirname(two))
+
+        self.assertEqual(pool.parsed, [one])
+        self.assertEqual(records, [{"SourceFile": two, "FileName": "two.jpg", "Directory": os.path.dirname(two),
+                                    "FileModifyDate": 1500000000, "Comment": "same bytes"}])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,267 @@
+import collections
+import fnmatch
+import os
+import sys
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+DEFAULT_QUALITY = 0.5
+DEFAULT_CHUNKSIZE = 16
+
+# MIME types worth a full extraction by default; everything else stops after triage
+DEFAULT_ALLOWED_MIME = (
+    "image/*",
+    "audio/*",
+    "video/*",
+    "application/pdf",
+    "application/msword",
+    "application/vnd.*",
+    "application/x-dosexec",
+    "application/x-shockwave-flash",
+)
+
+# Pipeline stage a file stopped at
+STAGE_UNPARSED = "unparsed"    # tier 1 could not identify the file
+STAGE_TRIAGED = "triaged"      # identified, but its MIME type is not on the allow-list
+STAGE_EXTRACTED = "extracted"  # full metadata extraction ran
+
+TieredResult = collections.namedtuple("TieredResult", ["path", "stage", "mime", "description", "output", "error"])
+
+# hachoir entry points, imported once per process by load_hachoir()
+_hachoir = None
+
+
+def load_hachoir():
+    """
+    Import the hachoir library once and return its entry points.
+
+    This directory contains hachoir.py, which shadows the real hachoir
+    package whenever one of these scripts is run directly, so the import
+    is done with this directory temporarily removed from sys.path.
+    """
+    global _hachoir
+    if _hachoir is not None:
+        return _hachoir
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    saved_path = sys.path[:]
+    sys.path[:] = [p for p in sys.path if os.path.abspath(p or os.curdir) != here]
+    shadow = sys.modules.get("hachoir")
+    if shadow is not None and not hasattr(shadow, "__path__"):
+        del sys.modules["hachoir"]
+    try:
+        import hachoir
+        from hachoir.core import config as core_config
+        from hachoir.metadata import extractMetadata
+        from hachoir.parser import createParser
+        try:
+            from hachoir.metadata import config as metadata_config
+        except ImportError:
+            metadata_config = None
+    finally:
+        sys.path[:] = saved_path
+
+    # Errors are returned per file; keep hachoir's own warnings off the console
+    core_config.quiet = True
+    _hachoir = types.SimpleNamespace(
+        version=getattr(hachoir, "__version__", ""),
+        createParser=createParser,
+        extractMetadata=extractMetadata,
+        metadata_config=metadata_config,
+    )
+    return _hachoir
+
+
+def options_from_args(args):
+    """
+    Map the hachoir-metadata style argparse flags onto engine options.
+    """
+    return {
+        "type": bool(getattr(args, "type", False)),
+        "mime": bool(getattr(args, "mime", False)),
+        "level": getattr(args, "level", None),
+        "raw": bool(getattr(args, "raw", False)),
+        "force_parser": getattr(args, "force_parser", None),
+        "quality": getattr(args, "quality", None),
+        "maxlen": getattr(args, "maxlen", None),
+    }
+
+
+def configure(options):
+    h = load_hachoir()
+    maxlen = options.get("maxlen")
+    if maxlen is not None and h.metadata_config is not None:
+        # 0 means unlimited, as with hachoir-metadata --maxlen
+        h.metadata_config.MAX_STR_LENGTH = maxlen or sys.maxsize
+
+
+def _create_parser(file_path, options):
+    h = load_hachoir()
+    force_parser = options.get("force_parser")
+    tags = [("id", force_parser), None] if force_parser else None
+    try:
+        parser = h.createParser(file_path, tags=tags)
+    except Exception as e:
+        return None, str(e)
+    if not parser:
+        return None, f"Unable to parse file: {file_path}"
+    return parser, None
+
+
+def _export_metadata(parser, file_path, options):
+    h = load_hachoir()
+    quality = options.get("quality")
+    try:
+        metadata = h.extractMetadata(parser, DEFAULT_QUALITY if quality is None else quality)
+    except Exception as e:
+        return None, str(e)
+    if not metadata:
+        return None, f"Hachoir can't extract metadata, but is able to parse: {file_path}"
+    level = options.get("level")
+    priority = level * 100 + 99 if level else None
+    lines = metadata.exportPlaintext(priority=priority, human=not options.get("raw"))
+    if not lines:
+        lines = ["(no metadata, priority may be too small)"]
+    return "\n".join(lines) + "\n", None
+
+
+def extract_file(file_path, options):
+    """
+    Parse one file in-process and return (file_path, output, error).
+    The output mirrors what hachoir-metadata prints for the same options.
+    """
+    parser, error = _create_parser(file_path, options)
+    if parser is None:
+        return file_path, None, error
+
+    with parser:
+        if options.get("type") or options.get("mime"):
+            lines = []
+            if options.get("type"):
+                lines.append(parser.description)
+            if options.get("mime"):
+                lines.append(str(parser.mime_type))
+            return file_path, "\n".join(lines) + "\n", None
+        output, error = _export_metadata(parser, file_path, options)
+    return file_path, output, error
+
+
+def mime_allowed(mime, allowed_mime):
+    if allowed_mime is None:
+        return True
+    return any(fnmatch.fnmatchcase(mime, pattern) for pattern in allowed_mime)
+
+
+def tiered_extract_file(file_path, options, allowed_mime=DEFAULT_ALLOWED_MIME):
+    """
+    Two-stage extraction of one file, returning a TieredResult.
+
+    Stage 1 is the cheap triage `hachoir-metadata --type --mime --quality=0.0`
+    would do: guess the parser from the file's magic and read its
+    description and MIME type.  Stage 2, the full extraction at the
+    configured quality, only runs when the MIME type matches allowed_mime
+    (None allows everything).  Both stages share the same open parser.
+    """
+    parser, error = _create_parser(file_path, options)
+    if parser is None:
+        return TieredResult(file_path, STAGE_UNPARSED, None, None, None, error)
+
+    with parser:
+        mime = str(parser.mime_type or "")
+        description = parser.description
+        if not mime_allowed(mime, allowed_mime):
+            return TieredResult(file_path, STAGE_TRIAGED, mime, description, f"{description}\n{mime}\n", None)
+        output, error = _export_metadata(parser, file_path, options)
+    return TieredResult(file_path, STAGE_EXTRACTED, mime, description, output, error)
+
+
+def _init_worker(options):
+    configure(options)
+
+
+def _extract_in_worker(file_path, options):
+    try:
+        return extract_file(file_path, options)
+    except Exception as e:
+        return file_path, None, f"An exception occurred: {e}"
+
+
+def _tiered_in_worker(file_path, options, allowed_mime):
+    try:
+        return tiered_extract_file(file_path, options, allowed_mime)
+    except Exception as e:
+        return TieredResult(file_path, STAGE_UNPARSED, None, None, None, f"An exception occurred: {e}")
+
+
+class HachoirEngine:
+    """
+    Extract metadata with the hachoir library directly instead of spawning
+    hachoir-metadata per file.  Files are spread over a process pool (or a
+    thread pool with use_threads=True) whose workers import hachoir once.
+    """
+
+    def __init__(self, options=None, workers=None, use_threads=False):
+        self.options = dict(options or {})
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.use_threads = use_threads
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def version(self):
+        return load_hachoir().version
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.use_threads:
+                configure(self.options)
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                     initargs=(self.options,))
+        return self._executor
+
+    def extract(self, file_path):
+        """
+        Extract a single file in this process; returns (output, error).
+        """
+        configure(self.options)
+        path, output, error = _extract_in_worker(file_path, self.options)
+        return output, error
+
+    def _map(self, function, file_paths, *args):
+        file_paths = list(file_paths)
+        if len(file_paths) <= 1 or self.workers == 1:
+            configure(self.options)
+            for file_path in file_paths:
+                yield function(file_path, *args)
+            return
+
+        executor = self._get_executor()
+        repeated = [[arg] * len(file_paths) for arg in args]
+        chunksize = 1 if self.use_threads else min(DEFAULT_CHUNKSIZE, max(1, len(file_paths) // (self.workers * 4)))
+        for result in executor.map(function, file_paths, *repeated, chunksize=chunksize):
+            yield result
+
+    def extract_many(self, file_paths):
+        """
+        Yield (file_path, output, error) for every file, in input order.
+        """
+        return self._map(_extract_in_worker, file_paths, self.options)
+
+    def extract_tiered(self, file_paths, allowed_mime=DEFAULT_ALLOWED_MIME):
+        """
+        Yield a TieredResult for every file, in input order.  Only files whose
+        MIME type matches allowed_mime reach the full extraction stage.
+        """
+        return self._map(_tiered_in_worker, file_paths, self.options, allowed_mime)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
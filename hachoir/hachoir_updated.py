@@ -1,10 +1,25 @@
 import os
-import subprocess
+import shlex
 import argparse
 import datetime
-import time
 import signal
 import sys
+import atexit
+import json
+
+from hachoir_engine import (DEFAULT_ALLOWED_MIME, STAGE_EXTRACTED, STAGE_TRIAGED, STAGE_UNPARSED, HachoirEngine,
+                            TieredResult, options_from_args)
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.hashing import hash_manifest
+from common.metadata_cache import MetadataCache
+from common.tool_runner import kill_running_tools, run_tool
+
+# Result cache keyed by file content, created on first use unless --no-cache is given
+_metadata_cache = None
+_hachoir_version = None
+use_cache = True
 
 def print_banner():
     print("\n\n\033[1;33;40m ####################################################\033[0m")
@@ -30,15 +45,42 @@ def print_error_message(message):
 
 def handle_interrupt(signum, frame):
     print("\nProcess interrupted.")
+    # Tools run on the runner's background loop; stop them rather than leave them behind
+    kill_running_tools()
     sys.exit(1)
 
-def run_hachoir_metadata(file_path, options):
-    # Construct the hachoir-metadata command
-    hachoir_command = f"hachoir-metadata {options} \"{file_path}\""
+def get_metadata_cache():
+    global _metadata_cache
+    if _metadata_cache is None and use_cache:
+        _metadata_cache = MetadataCache()
+        atexit.register(_metadata_cache.close)
+    return _metadata_cache
+
+def get_hachoir_version():
+    global _hachoir_version
+    if _hachoir_version is None:
+        try:
+            result = run_tool(["hachoir-metadata", "--version"])
+            _hachoir_version = result.stdout.strip()
+        except OSError:
+            _hachoir_version = ""
+    return _hachoir_version
+
+def run_hachoir_metadata(file_path, options, timeout=None):
+    # Reuse the previous result if these exact bytes were already extracted
+    cache = get_metadata_cache()
+    if cache is not None:
+        return cache.cached(file_path, "hachoir-metadata", get_hachoir_version(), options,
+                            lambda: extract_hachoir_metadata(file_path, options, timeout))
+    return extract_hachoir_metadata(file_path, options, timeout)
+
+def extract_hachoir_metadata(file_path, options, timeout=None):
+    # Construct the hachoir-metadata argument list; no shell sees the file name
+    hachoir_command = ["hachoir-metadata"] + shlex.split(options) + [file_path]
     
     try:
         # Run the hachoir-metadata command and capture the output
-        result = subprocess.run(hachoir_command, shell=True, capture_output=True, text=True)
+        result = run_tool(hachoir_command, timeout=timeout)
         
         if result.returncode != 0:
             # If the command failed, check if there is an error message
@@ -70,16 +112,55 @@ def save_output_to_file(output, file_path, directory):
         f.write(output)
     
     print_completion_message(output_file_path)
-    
-    # Introduce a small delay to ensure all operations are complete
-    time.sleep(2)
+
+def run_hachoir_pipeline(engine, file_paths, allowed_mime):
+    # Answer what we can from the cache and run the tiers only on the remaining files
+    cache = get_metadata_cache()
+    cache_options = dict(engine.options, allowed_mime=None if allowed_mime is None else sorted(allowed_mime))
+    cache_keys = {}
+    misses = []
+    for file_path in file_paths:
+        if cache is not None:
+            try:
+                key, value = cache.lookup(file_path, "hachoir", engine.version, cache_options)
+            except OSError as e:
+                # Missing or unreadable: report it and carry on with the rest of the batch
+                error = f"An exception occurred: {e}"
+                print_error_message(error)
+                yield TieredResult(file_path, STAGE_UNPARSED, None, None, None, error)
+                continue
+            if value is not None:
+                # Entries are keyed by content; the path is always the file asked about
+                cached = json.loads(value)
+                cached["path"] = file_path
+                yield TieredResult(**cached)
+                continue
+            cache_keys[file_path] = key
+        misses.append(file_path)
+
+    for result in engine.extract_tiered(misses, allowed_mime):
+        if cache is not None and result.error is None:
+            cached = result._asdict()
+            del cached["path"]
+            cache.put(cache_keys[result.path], json.dumps(cached))
+        yield result
+
+def write_triage_summary(results, directory):
+    # One line per file that stopped before full extraction
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    summary_path = os.path.join(directory, "triage_summary.txt")
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        for result in results:
+            f.write(f"{result.stage}\t{result.mime or '-'}\t{result.path}\t{result.error or result.description}\n")
+    return summary_path
 
 def main():
     # Set up signal handling for interruptions
     signal.signal(signal.SIGINT, handle_interrupt)
     
     parser = argparse.ArgumentParser(description='Automate hachoir-metadata tool for extracting metadata from files.')
-    parser.add_argument('file', help='The file path to analyze with hachoir-metadata.')
+    parser.add_argument('file', nargs='+', help='The file path(s) to analyze with hachoir-metadata.')
     parser.add_argument('--type', action='store_true', help='Only display file type (description).')
     parser.add_argument('--mime', action='store_true', help='Only display MIME type.')
     parser.add_argument('--level', type=int, help='Quantity of information to display from 1 to 9 (9 is the maximum).')
@@ -93,13 +174,34 @@ def main():
     parser.add_argument('--maxlen', type=int, help='Maximum string length in characters (0 means unlimited).')
     parser.add_argument('--verbose', action='store_true', help='Verbose mode.')
     parser.add_argument('--debug', action='store_true', help='Debug mode.')
+    parser.add_argument('--no-cache', action='store_true', help='Always re-extract instead of reusing cached results.')
+    parser.add_argument('--workers', type=int, help='Number of parallel workers (default: number of CPUs).')
+    parser.add_argument('--threads', action='store_true', help='Use a thread pool instead of a process pool.')
+    parser.add_argument('--allow-mime', action='append', help='MIME type pattern that gets full extraction (repeatable, e.g. "image/*").')
+    parser.add_argument('--all-types', action='store_true', help='Run full extraction on every file that can be parsed.')
+    parser.add_argument('--hash', action='store_true', help='Write an MD5/SHA-1/SHA-256 manifest of the input files.')
 
     args = parser.parse_args()
 
-    # Construct the options string to include all possible tests
-    options = "--type --mime --raw --bench --profiler --verbose --debug"
-    
-    # Optionally include additional options based on arguments
+    global use_cache
+    use_cache = not args.no_cache
+
+    # Construct the options string from the requested flags only
+    options = ""
+    if args.type:
+        options += " --type"
+    if args.mime:
+        options += " --mime"
+    if args.raw:
+        options += " --raw"
+    if args.bench:
+        options += " --bench"
+    if args.profiler:
+        options += " --profiler"
+    if args.verbose:
+        options += " --verbose"
+    if args.debug:
+        options += " --debug"
     if args.level:
         options += f" --level={args.level}"
     if args.force_parser:
@@ -112,22 +214,58 @@ def main():
         options += f" --quality={args.quality}"
     if args.maxlen:
         options += f" --maxlen={args.maxlen}"
+    options = options.strip()
 
     print_banner()
-    
-    # Run hachoir-metadata with the specified options and file
-    output = run_hachoir_metadata(args.file, options)
-    
-    if output is not None:
-        # Introduce a small delay to ensure that the output is fully captured
-        time.sleep(1)
-
-        # Save the output to a text file in an output directory with a timestamp
-        script_directory = os.path.dirname(os.path.abspath(__file__))
-        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_directory = os.path.join(script_directory, f"output_{timestamp}")
-        
-        save_output_to_file(output, args.file, output_directory)
+
+    # Save the output to text files in an output directory with a timestamp
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    output_directory = os.path.join(script_directory, f"output_{timestamp}")
+
+    # Parser listing, version, benchmark and profiler are features of the
+    # hachoir-metadata command itself, so those runs still go through it
+    if args.parser_list or args.version or args.bench or args.profiler:
+        for file_path in args.file:
+            output = run_hachoir_metadata(file_path, options)
+            if output is not None:
+                save_output_to_file(output, file_path, output_directory)
+        return
+
+    # Tier 1 triages every file by type/MIME; tier 2 extracts full metadata
+    # only for allowed MIME types.  --type/--mime stop every file at tier 1.
+    if args.type or args.mime:
+        allowed_mime = ()
+    elif args.all_types:
+        allowed_mime = None
+    else:
+        allowed_mime = tuple(args.allow_mime or DEFAULT_ALLOWED_MIME)
+
+    counts = {STAGE_UNPARSED: 0, STAGE_TRIAGED: 0, STAGE_EXTRACTED: 0}
+    skipped = []
+    failed = 0
+    with HachoirEngine(options_from_args(args), workers=args.workers, use_threads=args.threads) as engine:
+        for result in run_hachoir_pipeline(engine, args.file, allowed_mime):
+            counts[result.stage] += 1
+            if result.error and result.stage == STAGE_EXTRACTED:
+                failed += 1
+                print_error_message(result.error)
+            if result.stage == STAGE_EXTRACTED or (args.type or args.mime):
+                if result.output is not None:
+                    save_output_to_file(result.output, result.path, output_directory)
+            else:
+                skipped.append(result)
+
+    if skipped:
+        print(f"\nTriage summary stored in: {write_triage_summary(skipped, output_directory)}")
+    if args.hash:
+        os.makedirs(output_directory, exist_ok=True)
+        manifest_path = os.path.join(output_directory, "hash_manifest.csv")
+        hash_manifest(args.file, manifest_path, workers=args.workers)
+        print(f"\nInput hashes stored in: {manifest_path}")
+    print(f"\nTier 1 skipped {counts[STAGE_UNPARSED]} unparseable file(s).")
+    print(f"Tier 2 skipped {counts[STAGE_TRIAGED]} file(s) whose type is not on the allow-list.")
+    print(f"Full extraction ran on {counts[STAGE_EXTRACTED]} file(s) ({failed} error(s)).")
 
 if __name__ == "__main__":
     main()
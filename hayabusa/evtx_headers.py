@@ -0,0 +1,93 @@
+import collections
+import mmap
+import struct
+
+FILE_SIGNATURE = b"ElfFile\x00"
+CHUNK_SIGNATURE = b"ElfChnk\x00"
+FILE_HEADER_SIZE = 4096
+CHUNK_SIZE = 65536
+# Records start after the chunk header and its string/template offset tables
+CHUNK_RECORDS_OFFSET = 512
+# signature, size, record id, written time (FILETIME)
+RECORD_HEADER = struct.Struct("<4sIQQ")
+RECORD_SIGNATURE = b"**\x00\x00"
+
+# signature, first chunk, last chunk, next record id, header size, minor, major, header block size, chunk count
+FILE_HEADER = struct.Struct("<8sQQQIHHHH")
+FILE_FLAGS_OFFSET = 120
+# signature, first/last record number, first/last record id, header size, last record offset, free space offset
+CHUNK_HEADER = struct.Struct("<8sQQQQIII")
+
+EvtxFileHeader = collections.namedtuple("EvtxFileHeader", [
+    "first_chunk", "last_chunk", "next_record_id", "major_version", "minor_version", "chunk_count", "dirty",
+])
+EvtxChunkHeader = collections.namedtuple("EvtxChunkHeader", [
+    "index", "offset", "first_record_id", "last_record_id", "last_record_offset", "free_space_offset",
+])
+
+
+def open_mmap(path):
+    """
+    Memory-map an EVTX file read-only; returns None for empty files.
+    The caller closes the map.
+    """
+    with open(path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+
+
+def parse_file_header(data):
+    if len(data) < FILE_HEADER.size or data[:8] != FILE_SIGNATURE:
+        raise ValueError("Not an EVTX file (bad file header signature)")
+    (_, first_chunk, last_chunk, next_record_id, _, minor, major, _, chunk_count) = FILE_HEADER.unpack_from(data, 0)
+    flags = struct.unpack_from("<I", data, FILE_FLAGS_OFFSET)[0]
+    return EvtxFileHeader(first_chunk, last_chunk, next_record_id, major, minor, chunk_count, bool(flags & 1))
+
+
+def iter_chunk_headers(data):
+    """
+    Yield an EvtxChunkHeader for every valid chunk in a mapped EVTX file.
+    Only the 128-byte chunk headers are touched, never the records.
+    """
+    index = 0
+    offset = FILE_HEADER_SIZE
+    while offset + CHUNK_HEADER.size <= len(data):
+        # Unused chunks at the end of a pre-allocated log are zero filled
+        if data[offset:offset + 8] == CHUNK_SIGNATURE:
+            (_, _, _, first_id, last_id, _, last_record_offset, free_space_offset) = CHUNK_HEADER.unpack_from(data, offset)
+            yield EvtxChunkHeader(index, offset, first_id, last_id, last_record_offset, free_space_offset)
+        index += 1
+        offset += CHUNK_SIZE
+
+
+def chunk_time_range(data, chunk):
+    """
+    (first, last) record write times of a chunk as FILETIME values, read from
+    the headers of its first and last record only; None if either record
+    header is not where the chunk header says.
+    """
+    times = []
+    for record_offset in (CHUNK_RECORDS_OFFSET, chunk.last_record_offset):
+        position = chunk.offset + record_offset
+        if record_offset < CHUNK_RECORDS_OFFSET or position + RECORD_HEADER.size > min(len(data), chunk.offset + CHUNK_SIZE):
+            return None
+        signature, _, _, filetime = RECORD_HEADER.unpack_from(data, position)
+        if signature != RECORD_SIGNATURE:
+            return None
+        times.append(filetime)
+    return times[0], times[1]
+
+
+def max_record_id(path):
+    """
+    Highest event record identifier stored in the file, or 0 if it has none.
+    """
+    data = open_mmap(path)
+    if data is None:
+        return 0
+    try:
+        return max((chunk.last_record_id for chunk in iter_chunk_headers(data)), default=0)
+    finally:
+        data.close()
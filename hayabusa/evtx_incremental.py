@@ -0,0 +1,294 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+from evtx_headers import CHUNK_SIZE, FILE_HEADER_SIZE, max_record_id, parse_file_header
+from hayabusa_rules import get_rules_dir, rules_digest
+
+MANIFEST_VERSION = 1
+SAMPLE_SIZE = 64 * 1024
+# The first event record starts right after the first chunk's 512-byte header area
+FIRST_RECORD_OFFSET = FILE_HEADER_SIZE + 512
+STAGING_PREFIX = ".hayabusa_staging_"
+# Unattended runs must not stop at Hayabusa's interactive scan wizard
+DEFAULT_OPTIONS = ["--no-wizard"]
+
+
+def evtx_fingerprint(path):
+    """
+    Cheap change detection for an EVTX file: size, mtime and hashes of the
+    head and of the last 64 KiB.
+
+    The file header is rewritten on every append, so the head hash covers
+    the first event record instead; it only changes when the log is
+    replaced or wraps around, which is what tells a rewrite from an append.
+    """
+    st = os.stat(path)
+    with open(path, 'rb') as f:
+        f.seek(FIRST_RECORD_OFFSET)
+        record_header = f.read(8)
+        if len(record_header) == 8 and record_header[:4] == b"**\x00\x00":
+            record_size = min(struct.unpack("<I", record_header[4:])[0], CHUNK_SIZE)
+            f.seek(FIRST_RECORD_OFFSET)
+            head = hashlib.sha256(f.read(record_size)).hexdigest()
+        else:
+            f.seek(0)
+            head = hashlib.sha256(f.read(SAMPLE_SIZE)).hexdigest()
+        f.seek(max(0, st.st_size - SAMPLE_SIZE))
+        tail = hashlib.sha256(f.read(SAMPLE_SIZE)).hexdigest()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "head": head, "tail": tail}
+
+
+def iter_evtx_files(log_dir):
+    for dirpath, dirnames, filenames in os.walk(log_dir):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith(STAGING_PREFIX))
+        for filename in sorted(filenames):
+            if filename.lower().endswith(".evtx"):
+                yield os.path.abspath(os.path.join(dirpath, filename))
+
+
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        manifest = {"version": MANIFEST_VERSION, "rules_version": None, "files": {}}
+    return manifest
+
+
+def save_manifest(manifest, manifest_path):
+    # Write next to the manifest and rename so an interrupted run never leaves it half written
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".manifest-")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+
+def append_csv(source_path, timeline_path, min_record_id=None):
+    """
+    Append the rows of a csv-timeline output to the timeline, writing the
+    header only if the timeline is new.  Rows with a RecordID at or below
+    min_record_id were already appended by an earlier run and are dropped.
+    Returns the number of rows appended.
+    """
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+    if not os.path.exists(source_path):
+        return 0
+    write_header = not os.path.exists(timeline_path) or os.path.getsize(timeline_path) == 0
+    appended = 0
+    with open(source_path, 'r', encoding='utf-8', errors='replace', newline='') as src, \
+            open(timeline_path, 'a', encoding='utf-8', newline='') as dst:
+        reader = csv.reader(src)
+        writer = csv.writer(dst)
+        header = next(reader, None)
+        if header is None:
+            return 0
+        if write_header:
+            writer.writerow(header)
+        record_column = header.index("RecordID") if "RecordID" in header else None
+        for row in reader:
+            if min_record_id is not None and record_column is not None:
+                try:
+                    if int(row[record_column]) <= min_record_id:
+                        continue
+                except (ValueError, IndexError):
+                    pass
+            writer.writerow(row)
+            appended += 1
+    return appended
+
+
+def is_stable(file_path, fingerprint):
+    """
+    True if the file still has the size and mtime it was scanned with and its
+    header's dirty flag is clear, i.e. no writer has the log open.
+    """
+    st = os.stat(file_path)
+    if st.st_size != fingerprint["size"] or st.st_mtime_ns != fingerprint["mtime_ns"]:
+        return False
+    with open(file_path, 'rb') as f:
+        header = f.read(FILE_HEADER_SIZE)
+    try:
+        return not parse_file_header(header).dirty
+    except (ValueError, struct.error):
+        return False
+
+
+def staged_path(staging_dir, index, file_path):
+    return os.path.join(staging_dir, f"{index:06d}_{os.path.basename(file_path)}")
+
+
+def stage_files(file_paths, parent_dir, copy=()):
+    """
+    Collect files into a new staging directory under parent_dir (the output
+    or temp directory, never the evidence) for one `hayabusa -d` run, using
+    hard links where possible and copies otherwise.  Files in copy are
+    always copied, so a log still being written cannot grow between reading
+    its high-water mark and Hayabusa scanning it.
+    """
+    staging_dir = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=parent_dir)
+    for index, file_path in enumerate(file_paths):
+        target = staged_path(staging_dir, index, file_path)
+        if file_path not in copy:
+            try:
+                os.link(file_path, target)
+                continue
+            except OSError:
+                pass
+        shutil.copy2(file_path, target)
+    return staging_dir
+
+
+class IncrementalTimeline:
+    """
+    Keep a csv-timeline up to date for a growing log directory.
+
+    A manifest records (path, size, mtime, head/tail hash, rules version,
+    highest record id) for every EVTX file already processed.  Each run only
+    feeds Hayabusa the new or changed files and appends their detections to
+    the existing timeline.  Logs that were appended to since the last run are
+    re-scanned on their own and only records past the previous high-water
+    mark are appended.  Files are scanned from a staged snapshot, and the
+    manifest describes that snapshot, so records written during a run are
+    picked up by the next one.
+
+    A changed rule set, or a log that was rewritten or wrapped around,
+    rebuilds the timeline from scratch: the rows carry no source file, so
+    the rewritten log's old detections can only be replaced that way.
+    """
+
+    def __init__(self, hayabusa, log_dir, timeline_path, manifest_path=None, rules_dir=None):
+        self.hayabusa = hayabusa
+        self.log_dir = os.path.abspath(log_dir)
+        self.timeline_path = os.path.abspath(timeline_path)
+        self.manifest_path = manifest_path or self.timeline_path + ".manifest.json"
+        self.rules_dir = rules_dir or get_rules_dir(hayabusa.hayabusa_path)
+        # Fingerprints from the last plan(), used to tell stable logs from ones still being written
+        self.scanned = {}
+
+    def plan(self, manifest):
+        """
+        Split the log directory into (new, appended, unchanged, rewritten)
+        files.  appended holds (path, previous high-water record id) pairs.
+        """
+        new, appended, unchanged, rewritten = [], [], [], []
+        self.scanned = {}
+        for file_path in iter_evtx_files(self.log_dir):
+            previous = manifest["files"].get(file_path)
+            fingerprint = self.scanned[file_path] = evtx_fingerprint(file_path)
+            if previous is None:
+                new.append(file_path)
+            elif all(previous[key] == fingerprint[key] for key in ("size", "mtime_ns", "head", "tail")):
+                unchanged.append(file_path)
+            elif previous["head"] == fingerprint["head"] and fingerprint["size"] >= previous["size"]:
+                appended.append((file_path, previous.get("max_record_id", 0)))
+            else:
+                rewritten.append(file_path)
+        return new, appended, unchanged, rewritten
+
+    def _run(self, input_args, work_dir, options):
+        output_file = os.path.join(work_dir, f"timeline_{len(os.listdir(work_dir))}.csv")
+        output, errors = self.hayabusa.run_command("csv-timeline", input_args + ["-o", output_file] + options)
+        if errors:
+            print(f"\nErrors:\n{errors}")
+        return output_file
+
+    def _snapshot(self, file_paths, work_dir):
+        """
+        Stage the files and describe each staged file as a manifest entry, so
+        the entry matches exactly what Hayabusa scans.  Logs that are stable
+        since plan() are hard-linked; only the ones still being written are
+        copied.  The mtime is the original's from before staging: a write
+        during the copy makes the next run look at the file again.
+        """
+        mtimes = [os.stat(file_path).st_mtime_ns for file_path in file_paths]
+        copy = {file_path for file_path in file_paths
+                if file_path not in self.scanned or not is_stable(file_path, self.scanned[file_path])}
+        staging_dir = stage_files(file_paths, work_dir, copy=copy)
+        entries = {}
+        for index, (file_path, mtime_ns) in enumerate(zip(file_paths, mtimes)):
+            snapshot_path = staged_path(staging_dir, index, file_path)
+            entry = evtx_fingerprint(snapshot_path)
+            entry["mtime_ns"] = mtime_ns
+            entry["max_record_id"] = max_record_id(snapshot_path)
+            entries[file_path] = entry
+        return staging_dir, entries
+
+    def run(self, options=None):
+        options = DEFAULT_OPTIONS + list(options or [])
+        manifest = load_manifest(self.manifest_path)
+        rules_version = rules_digest(self.rules_dir)
+
+        rebuild = manifest["rules_version"] != rules_version
+        new, appended, unchanged, rewritten = self.plan(manifest)
+        if rewritten:
+            print(f"\n{len(rewritten)} logs were rewritten or wrapped around; rebuilding the timeline")
+            rebuild = True
+        if rebuild:
+            # Detections depend on the rules, and a rewritten log's old rows cannot be picked out of the timeline
+            if os.path.exists(self.timeline_path):
+                os.remove(self.timeline_path)
+            manifest = {"version": MANIFEST_VERSION, "rules_version": rules_version, "files": {}}
+            new, appended, unchanged = list(iter_evtx_files(self.log_dir)), [], []
+
+        rows = 0
+        os.makedirs(os.path.dirname(self.timeline_path), exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix="hayabusa_incremental_", dir=os.path.dirname(self.timeline_path))
+        try:
+            entries = {}
+            if new:
+                staging_dir, staged = self._snapshot(new, work_dir)
+                entries.update(staged)
+                try:
+                    rows += append_csv(self._run(["-d", staging_dir], work_dir, options), self.timeline_path)
+                finally:
+                    shutil.rmtree(staging_dir, ignore_errors=True)
+
+            for file_path, previous_max in appended:
+                staging_dir, staged = self._snapshot([file_path], work_dir)
+                entries.update(staged)
+                try:
+                    output_file = self._run(["-f", staged_path(staging_dir, 0, file_path)], work_dir, options)
+                finally:
+                    shutil.rmtree(staging_dir, ignore_errors=True)
+                rows += append_csv(output_file, self.timeline_path, min_record_id=previous_max)
+
+            for file_path, entry in entries.items():
+                entry["rules_version"] = rules_version
+                manifest["files"][file_path] = entry
+            save_manifest(manifest, self.manifest_path)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        return {"new": len(new), "appended": len(appended), "unchanged": len(unchanged), "rewritten": len(rewritten),
+                "rows": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incrementally build a Hayabusa CSV timeline for a growing EVTX directory.')
+    parser.add_argument('log_dir', help='Directory containing EVTX files.')
+    parser.add_argument('timeline', help='CSV timeline to create or append to.')
+    parser.add_argument('--hayabusa', default="/home/ronit/hayabusa-2.17.0-lin-x64-gnu", help='Path to the Hayabusa binary.')
+    parser.add_argument('--manifest', help='Manifest path (default: <timeline>.manifest.json).')
+    parser.add_argument('--rules-dir', help='Hayabusa rules directory (default: rules next to the binary).')
+    args = parser.parse_args()
+
+    from hayabusa_test import Hayabusa
+    hayabusa = Hayabusa(args.hayabusa)
+
+    summary = IncrementalTimeline(hayabusa, args.log_dir, args.timeline, args.manifest, args.rules_dir).run()
+    print(f"\nNew files: {summary['new']}, appended files: {summary['appended']}, unchanged files: {summary['unchanged']}, "
+          f"rewritten files: {summary['rewritten']}")
+    print(f"Appended {summary['rows']} detections to {args.timeline}")
+
+if __name__ == "__main__":
+    main()
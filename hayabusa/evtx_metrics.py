@@ -0,0 +1,176 @@
+import argparse
+import collections
+import json
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+from evtx_incremental import iter_evtx_files
+from evtx_reader import iter_records
+
+LOGON_SUCCESS = 4624
+LOGON_FAILURE = 4625
+LOGON_TYPES = {
+    "0": "System", "2": "Interactive", "3": "Network", "4": "Batch", "5": "Service", "7": "Unlock",
+    "8": "NetworkCleartext", "9": "NewCredentials", "10": "RemoteInteractive", "11": "CachedInteractive",
+}
+
+
+class ComputerMetrics:
+    """
+    Event counts per computer, like `hayabusa computer-metrics`.
+    """
+
+    name = "computer-metrics"
+
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def add(self, fields):
+        self.counts[fields["Computer"]] += 1
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+
+    def result(self):
+        return [{"Computer": computer, "Events": count} for computer, count in self.counts.most_common()]
+
+
+class EidMetrics:
+    """
+    Event counts per channel and event ID, like `hayabusa eid-metrics`.
+    """
+
+    name = "eid-metrics"
+
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def add(self, fields):
+        self.counts[(fields["Channel"], fields["EventID"])] += 1
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+
+    def result(self):
+        total = sum(self.counts.values()) or 1
+        return [{"Channel": channel, "EventID": event_id, "Events": count, "Percent": round(100.0 * count / total, 2)}
+                for (channel, event_id), count in self.counts.most_common()]
+
+
+class LogonSummary:
+    """
+    Successful (4624) and failed (4625) logons per target account, computer,
+    logon type and source, like `hayabusa logon-summary`.
+    """
+
+    name = "logon-summary"
+
+    def __init__(self):
+        self.successful = collections.Counter()
+        self.failed = collections.Counter()
+
+    def add(self, fields):
+        event_id = fields["EventID"]
+        if event_id not in (LOGON_SUCCESS, LOGON_FAILURE) or fields["Channel"] != "Security":
+            return
+        data = fields["Data"]
+        key = (data.get("TargetUserName"), fields["Computer"], data.get("LogonType"),
+               data.get("WorkstationName"), data.get("IpAddress"))
+        (self.successful if event_id == LOGON_SUCCESS else self.failed)[key] += 1
+
+    def merge(self, other):
+        self.successful.update(other.successful)
+        self.failed.update(other.failed)
+
+    @staticmethod
+    def _rows(counts):
+        rows = []
+        for (user, computer, logon_type, source_computer, source_ip), count in counts.most_common():
+            rows.append({
+                "TargetAccount": user,
+                "TargetComputer": computer,
+                "LogonType": f"{logon_type} - {LOGON_TYPES[logon_type]}" if logon_type in LOGON_TYPES else logon_type,
+                "SourceComputer": source_computer,
+                "SourceIP": source_ip,
+                "Count": count,
+            })
+        return rows
+
+    def result(self):
+        return {"successful": self._rows(self.successful), "failed": self._rows(self.failed)}
+
+
+AGGREGATORS = {aggregator.name: aggregator for aggregator in (ComputerMetrics, EidMetrics, LogonSummary)}
+
+
+def scan_file(path, metrics=tuple(AGGREGATORS)):
+    """
+    Read one EVTX file once and feed every record to the requested
+    aggregators.  Returns (aggregators by name, records, decode errors).
+    """
+    aggregators = {name: AGGREGATORS[name]() for name in metrics}
+    records = errors = 0
+    for record in iter_records(path):
+        records += 1
+        try:
+            fields = record.fields
+        except (ValueError, IndexError, KeyError, struct.error):
+            # Damaged or partly overwritten records are counted and skipped
+            errors += 1
+            continue
+        for aggregator in aggregators.values():
+            aggregator.add(fields)
+    return aggregators, records, errors
+
+
+def collect_metrics(paths, metrics=tuple(AGGREGATORS), workers=None):
+    """
+    Scan EVTX files in parallel processes, one file per task, and merge the
+    per-file aggregators.  Returns (aggregators by name, records, errors).
+    """
+    paths = list(paths)
+    merged = {name: AGGREGATORS[name]() for name in metrics}
+    total_records = total_errors = 0
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths) or 1))
+
+    def merge(results):
+        nonlocal total_records, total_errors
+        for aggregators, records, errors in results:
+            for name, aggregator in aggregators.items():
+                merged[name].merge(aggregator)
+            total_records += records
+            total_errors += errors
+
+    if workers == 1:
+        merge(scan_file(path, metrics) for path in paths)
+    else:
+        # Largest files first so a big file does not start last and hold up the run
+        paths.sort(key=os.path.getsize, reverse=True)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            merge(executor.map(scan_file, paths, [metrics] * len(paths)))
+    return merged, total_records, total_errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute computer, event ID and logon metrics for EVTX files in one pass.')
+    parser.add_argument('input', help='EVTX file or directory.')
+    parser.add_argument('--metrics', nargs='+', choices=sorted(AGGREGATORS), default=sorted(AGGREGATORS), help='Metrics to compute (default: all).')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: number of CPUs).')
+    parser.add_argument('-o', '--output', help='Write the metrics as JSON to this file instead of stdout.')
+    args = parser.parse_args()
+
+    paths = list(iter_evtx_files(args.input)) if os.path.isdir(args.input) else [args.input]
+    aggregators, records, errors = collect_metrics(paths, args.metrics, args.workers)
+    report = {"files": len(paths), "records": records, "errors": errors}
+    report.update({name: aggregator.result() for name, aggregator in aggregators.items()})
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Scanned {records} records in {len(paths)} files; metrics stored in {args.output}")
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
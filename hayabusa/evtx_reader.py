@@ -0,0 +1,439 @@
+import datetime
+import struct
+import uuid
+
+from evtx_headers import CHUNK_RECORDS_OFFSET, CHUNK_SIZE, RECORD_HEADER, RECORD_SIGNATURE, iter_chunk_headers, open_mmap
+
+# Resident template definitions: next offset, GUID, data size, then the BinXML fragment
+TEMPLATE_HEADER_SIZE = 24
+
+FILETIME_EPOCH = datetime.datetime(1601, 1, 1, tzinfo=datetime.timezone.utc)
+
+# BinXML tokens (the 0x40 bit only flags "more data follows")
+TOKEN_END_OF_STREAM = 0x00
+TOKEN_OPEN_START_ELEMENT = 0x01
+TOKEN_CLOSE_START_ELEMENT = 0x02
+TOKEN_CLOSE_EMPTY_ELEMENT = 0x03
+TOKEN_END_ELEMENT = 0x04
+TOKEN_VALUE = 0x05
+TOKEN_ATTRIBUTE = 0x06
+TOKEN_CDATA = 0x07
+TOKEN_CHAR_REF = 0x08
+TOKEN_ENTITY_REF = 0x09
+TOKEN_PI_TARGET = 0x0a
+TOKEN_PI_DATA = 0x0b
+TOKEN_TEMPLATE_INSTANCE = 0x0c
+TOKEN_NORMAL_SUBSTITUTION = 0x0d
+TOKEN_OPTIONAL_SUBSTITUTION = 0x0e
+TOKEN_FRAGMENT_HEADER = 0x0f
+
+# Value types
+TYPE_NULL = 0x00
+TYPE_WSTRING = 0x01
+TYPE_STRING = 0x02
+TYPE_BOOL = 0x0d
+TYPE_BINARY = 0x0e
+TYPE_GUID = 0x0f
+TYPE_SIZE_T = 0x10
+TYPE_FILETIME = 0x11
+TYPE_SYSTEMTIME = 0x12
+TYPE_SID = 0x13
+TYPE_HEX_INT32 = 0x14
+TYPE_HEX_INT64 = 0x15
+TYPE_BINXML = 0x21
+TYPE_ARRAY = 0x80
+
+INTEGER_FORMATS = {
+    0x03: "<b", 0x04: "<B", 0x05: "<h", 0x06: "<H", 0x07: "<i",
+    0x08: "<I", 0x09: "<q", 0x0a: "<Q", 0x0b: "<f", 0x0c: "<d",
+}
+ENTITIES = {"amp": "&", "lt": "<", "gt": ">", "quot": '"', "apos": "'"}
+
+
+def filetime_to_datetime(value):
+    return FILETIME_EPOCH + datetime.timedelta(microseconds=value // 10)
+
+
+def format_filetime(value):
+    return filetime_to_datetime(value).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def format_sid(data):
+    revision, count = data[0], data[1]
+    authority = int.from_bytes(data[2:8], "big")
+    subauthorities = struct.unpack_from(f"<{count}I", data, 8)
+    return "-".join(["S", str(revision), str(authority)] + [str(value) for value in subauthorities])
+
+
+class Element:
+    """
+    A decoded XML element: name, attribute dict and children (strings and
+    nested Elements).
+    """
+
+    __slots__ = ("name", "attributes", "children")
+
+    def __init__(self, name, attributes=None, children=None):
+        self.name = name
+        self.attributes = attributes if attributes is not None else {}
+        self.children = children if children is not None else []
+
+    def __repr__(self):
+        return f"<Element {self.name}>"
+
+    @property
+    def text(self):
+        return "".join(child for child in self.children if isinstance(child, str))
+
+    def elements(self):
+        return [child for child in self.children if isinstance(child, Element)]
+
+    def find(self, name):
+        for child in self.children:
+            if isinstance(child, Element) and child.name == name:
+                return child
+        return None
+
+
+class Substitution:
+    """
+    Placeholder in a parsed template for the record's index-th value.
+    """
+
+    __slots__ = ("index", "optional")
+
+    def __init__(self, index, optional):
+        self.index = index
+        self.optional = optional
+
+
+class _TemplateElement:
+    # Element of a parsed template; attributes and children may hold Substitutions
+    __slots__ = ("name", "attributes", "children")
+
+    def __init__(self, name):
+        self.name = name
+        self.attributes = []
+        self.children = []
+
+
+class BinXmlParser:
+    """
+    Decoder for the BinXML in one 64 KiB chunk.
+
+    Element/attribute names and template definitions live at chunk-relative
+    offsets and are shared by many records, so both are parsed once per
+    chunk and cached; a record then only decodes its substitution values
+    and fills them into the cached template.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._names = {}
+        self._templates = {}
+
+    def _name(self, offset, position):
+        """
+        Return (name, position after any name stored inline at position).
+        """
+        name = self._names.get(offset)
+        if name is None:
+            count = struct.unpack_from("<H", self.data, offset + 6)[0]
+            name = self.data[offset + 8:offset + 8 + count * 2].decode("utf-16-le", "replace")
+            self._names[offset] = name
+        if offset == position:
+            count = struct.unpack_from("<H", self.data, offset + 6)[0]
+            position += 8 + count * 2 + 2
+        return name, position
+
+    def _text(self, position):
+        count = struct.unpack_from("<H", self.data, position)[0]
+        return self.data[position + 2:position + 2 + count * 2].decode("utf-16-le", "replace"), position + 2 + count * 2
+
+    def _template(self, offset):
+        template = self._templates.get(offset)
+        if template is None:
+            template, _ = self._parse(offset + TEMPLATE_HEADER_SIZE, in_template=True)
+            self._templates[offset] = template
+        return template
+
+    def parse(self, position):
+        """
+        Decode the BinXML fragment at position into a list of Elements.
+        """
+        nodes, _ = self._parse(position)
+        return nodes
+
+    def _parse(self, position, in_template=False):
+        data = self.data
+        root = []
+        stack = []
+        attribute = None
+
+        def add(value):
+            if attribute is not None:
+                attribute[1].append(value)
+            elif stack:
+                stack[-1].children.append(value)
+            else:
+                root.append(value)
+
+        while True:
+            token = data[position]
+            kind = token & 0x0f if token & 0xb0 == 0 else token
+            if kind == TOKEN_END_OF_STREAM:
+                position += 1
+                break
+            elif kind == TOKEN_FRAGMENT_HEADER:
+                position += 4
+            elif kind == TOKEN_OPEN_START_ELEMENT:
+                # token, dependency id, data size, name offset
+                name_offset = struct.unpack_from("<I", data, position + 7)[0]
+                name, position = self._name(name_offset, position + 11)
+                if token & 0x40:
+                    position += 4  # attribute list size
+                # Attributes are collected as (name, parts) and joined when the element closes
+                stack.append(_TemplateElement(name) if in_template else Element(name, []))
+                attribute = None
+            elif kind == TOKEN_CLOSE_START_ELEMENT:
+                position += 1
+                attribute = None
+            elif kind in (TOKEN_CLOSE_EMPTY_ELEMENT, TOKEN_END_ELEMENT):
+                position += 1
+                attribute = None
+                element = stack.pop()
+                if not in_template:
+                    element.attributes = {name: "".join(parts) for name, parts in element.attributes}
+                add(element)
+                if not stack and not in_template:
+                    # A fragment holds a single root; what follows belongs to the record or value
+                    break
+            elif kind == TOKEN_VALUE:
+                value_type = data[position + 1]
+                if value_type != TYPE_WSTRING:
+                    raise ValueError(f"Unsupported BinXML value type {value_type:#x} at offset {position}")
+                text, position = self._text(position + 2)
+                add(text)
+            elif kind == TOKEN_ATTRIBUTE:
+                name_offset = struct.unpack_from("<I", data, position + 1)[0]
+                name, position = self._name(name_offset, position + 5)
+                attribute = (name, [])
+                stack[-1].attributes.append(attribute)
+            elif kind == TOKEN_CDATA:
+                text, position = self._text(position + 1)
+                add(text)
+            elif kind == TOKEN_CHAR_REF:
+                add(chr(struct.unpack_from("<H", data, position + 1)[0]))
+                position += 3
+            elif kind == TOKEN_ENTITY_REF:
+                name_offset = struct.unpack_from("<I", data, position + 1)[0]
+                name, position = self._name(name_offset, position + 5)
+                add(ENTITIES.get(name, f"&{name};"))
+            elif kind == TOKEN_PI_TARGET:
+                name_offset = struct.unpack_from("<I", data, position + 1)[0]
+                _, position = self._name(name_offset, position + 5)
+            elif kind == TOKEN_PI_DATA:
+                _, position = self._text(position + 1)
+            elif kind == TOKEN_TEMPLATE_INSTANCE:
+                nodes, position = self._template_instance(position)
+                for node in nodes:
+                    add(node)
+                if not stack and not in_template:
+                    break
+            elif kind in (TOKEN_NORMAL_SUBSTITUTION, TOKEN_OPTIONAL_SUBSTITUTION):
+                if not in_template:
+                    raise ValueError(f"Substitution outside a template at offset {position}")
+                index = struct.unpack_from("<H", data, position + 1)[0]
+                add(Substitution(index, kind == TOKEN_OPTIONAL_SUBSTITUTION))
+                position += 4
+            else:
+                raise ValueError(f"Unknown BinXML token {token:#x} at offset {position}")
+
+        if in_template:
+            return root, position
+        return [node for node in root if isinstance(node, Element)], position
+
+    def _template_instance(self, position):
+        # token, unknown byte, template id, definition offset
+        definition_offset = struct.unpack_from("<I", self.data, position + 6)[0]
+        position += 10
+        template = self._template(definition_offset)
+        if definition_offset == position:
+            # The definition is stored right here the first time the chunk uses it
+            data_size = struct.unpack_from("<I", self.data, position + 20)[0]
+            position += TEMPLATE_HEADER_SIZE + data_size
+
+        count = struct.unpack_from("<I", self.data, position)[0]
+        position += 4
+        descriptors = struct.unpack_from("<" + "HBx" * count, self.data, position)
+        position += 4 * count
+        values = []
+        for index in range(count):
+            size, value_type = descriptors[2 * index], descriptors[2 * index + 1]
+            values.append(self._value(position, size, value_type))
+            position += size
+        return [self._instantiate(node, values) for node in template], position
+
+    def _instantiate(self, node, values):
+        element = Element(node.name)
+        for name, parts in node.attributes:
+            resolved = []
+            for part in parts:
+                if isinstance(part, Substitution):
+                    value = values[part.index] if part.index < len(values) else None
+                    if value is None:
+                        continue
+                    resolved.append(value if isinstance(value, str) else "".join(v.text for v in value))
+                else:
+                    resolved.append(part)
+            if resolved or not all(isinstance(part, Substitution) and part.optional for part in parts):
+                element.attributes[name] = "".join(resolved)
+        for child in node.children:
+            if isinstance(child, _TemplateElement):
+                element.children.append(self._instantiate(child, values))
+            elif isinstance(child, Substitution):
+                value = values[child.index] if child.index < len(values) else None
+                if value is None:
+                    continue
+                if isinstance(value, str):
+                    element.children.append(value)
+                else:
+                    element.children.extend(value)
+            else:
+                element.children.append(child)
+        return element
+
+    def _value(self, position, size, value_type):
+        """
+        Decode a substitution value: a string, a list of Elements for
+        embedded BinXML, or None for null values.
+        """
+        data = self.data
+        if value_type == TYPE_NULL:
+            return None
+        if value_type == TYPE_BINXML:
+            return self.parse(position) if size else None
+        raw = data[position:position + size]
+        if value_type == TYPE_WSTRING:
+            return raw.decode("utf-16-le", "replace").rstrip("\x00")
+        if value_type == TYPE_STRING:
+            return raw.decode("latin-1").rstrip("\x00")
+        if value_type in INTEGER_FORMATS:
+            return str(struct.unpack(INTEGER_FORMATS[value_type], raw)[0]) if size else None
+        if value_type == TYPE_BOOL:
+            return "true" if int.from_bytes(raw, "little") else "false"
+        if value_type == TYPE_BINARY:
+            return raw.hex().upper()
+        if value_type == TYPE_GUID:
+            return "{" + str(uuid.UUID(bytes_le=bytes(raw))).upper() + "}"
+        if value_type in (TYPE_SIZE_T, TYPE_HEX_INT32, TYPE_HEX_INT64):
+            return f"{int.from_bytes(raw, 'little'):#x}"
+        if value_type == TYPE_FILETIME:
+            return format_filetime(struct.unpack("<Q", raw)[0])
+        if value_type == TYPE_SYSTEMTIME:
+            year, month, _, day, hour, minute, second, millisecond = struct.unpack("<8H", raw)
+            return f"{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:{second:02d}.{millisecond:03d}Z"
+        if value_type == TYPE_SID:
+            return format_sid(raw)
+        if value_type == TYPE_WSTRING | TYPE_ARRAY:
+            return ", ".join(item for item in raw.decode("utf-16-le", "replace").split("\x00") if item)
+        if value_type & TYPE_ARRAY and (value_type & ~TYPE_ARRAY) in INTEGER_FORMATS:
+            fmt = INTEGER_FORMATS[value_type & ~TYPE_ARRAY]
+            return ", ".join(str(item[0]) for item in struct.iter_unpack(fmt, raw))
+        return raw.hex().upper()
+
+
+class EvtxRecord:
+    """
+    One event record.  The header fields are read immediately; the BinXML
+    body is only decoded when root or fields is first accessed.
+    """
+
+    __slots__ = ("record_id", "filetime", "_parser", "_offset", "_root")
+
+    def __init__(self, parser, offset, record_id, filetime):
+        self.record_id = record_id
+        self.filetime = filetime
+        self._parser = parser
+        self._offset = offset
+        self._root = None
+
+    @property
+    def timestamp(self):
+        return filetime_to_datetime(self.filetime)
+
+    @property
+    def root(self):
+        if self._root is None:
+            nodes = self._parser.parse(self._offset + RECORD_HEADER.size)
+            self._root = nodes[0] if nodes else Element("Event")
+        return self._root
+
+    @property
+    def fields(self):
+        return event_fields(self.root)
+
+
+def event_fields(root):
+    """
+    Flatten an <Event> element into the System fields Hayabusa reports on
+    plus a Data dict of EventData (by Name) or UserData values.
+    """
+    fields = {"EventID": None, "Computer": None, "Channel": None, "Provider": None, "TimeCreated": None,
+              "EventRecordID": None, "Data": {}}
+    system = root.find("System")
+    if system is not None:
+        for child in system.elements():
+            if child.name == "EventID":
+                try:
+                    fields["EventID"] = int(child.text)
+                except ValueError:
+                    fields["EventID"] = child.text
+            elif child.name == "Provider":
+                fields["Provider"] = child.attributes.get("Name")
+            elif child.name == "TimeCreated":
+                fields["TimeCreated"] = child.attributes.get("SystemTime")
+            elif child.name in ("Computer", "Channel", "EventRecordID"):
+                fields[child.name] = child.text
+
+    data = fields["Data"]
+    for section in root.elements():
+        if section.name == "EventData":
+            for index, child in enumerate(section.elements()):
+                data[child.attributes.get("Name") or f"{child.name}[{index + 1}]"] = child.text
+        elif section.name != "System":
+            _collect_leaves(section, data)
+    return fields
+
+
+def _collect_leaves(element, data):
+    children = element.elements()
+    if not children:
+        data[element.name] = element.text
+    for child in children:
+        _collect_leaves(child, data)
+
+
+def iter_records(path):
+    """
+    Yield every EvtxRecord of a file, chunk by chunk, from a memory map.
+    Each chunk is copied out of the map once and decoded on demand.
+    """
+    data = open_mmap(path)
+    if data is None:
+        return
+    try:
+        for chunk in iter_chunk_headers(data):
+            chunk_data = data[chunk.offset:chunk.offset + CHUNK_SIZE]
+            parser = BinXmlParser(chunk_data)
+            end = min(chunk.free_space_offset, len(chunk_data))
+            position = CHUNK_RECORDS_OFFSET
+            while position + RECORD_HEADER.size <= end:
+                signature, size, record_id, filetime = RECORD_HEADER.unpack_from(chunk_data, position)
+                if signature != RECORD_SIGNATURE or size < RECORD_HEADER.size or position + size > end:
+                    break
+                yield EvtxRecord(parser, position, record_id, filetime)
+                position += size
+    finally:
+        data.close()
+
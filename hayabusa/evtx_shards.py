@@ -0,0 +1,204 @@
+import argparse
+import csv
+import heapq
+import json
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from evtx_incremental import DEFAULT_OPTIONS, iter_evtx_files, stage_files
+from timeline_store import iter_json_records, normalize_timestamp
+
+TIMELINE_COMMANDS = {"csv": "csv-timeline", "json": "json-timeline"}
+
+
+def plan_shards(file_paths, shard_count):
+    """
+    Split files into shard_count lists of roughly equal total size.
+
+    Largest files are placed first, each on the currently lightest shard.
+    Ties are broken by path, so every host computes the same plan for the
+    same collection.
+    """
+    shard_count = max(1, shard_count)
+    files = sorted(((os.path.getsize(path), path) for path in file_paths), key=lambda item: (-item[0], item[1]))
+    shards = [[] for _ in range(shard_count)]
+    heap = [(0, index) for index in range(shard_count)]
+    for size, path in files:
+        total, index = heapq.heappop(heap)
+        shards[index].append(path)
+        heapq.heappush(heap, (total + size, index))
+    return [sorted(shard) for shard in shards if shard]
+
+
+def _timestamp_key(record):
+    return normalize_timestamp(record.get("Timestamp") or "") or ""
+
+
+def merge_csv_timelines(input_paths, output_path):
+    """
+    Streaming k-way merge of per-shard csv-timeline files, each already
+    sorted by Timestamp, into one sorted timeline.  Only one row per shard is
+    held in memory; equal timestamps keep shard order.  Returns the row count.
+    """
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+    files = [open(path, 'r', encoding='utf-8', errors='replace', newline='') for path in input_paths]
+    try:
+        readers = [csv.DictReader(f) for f in files]
+        fieldnames = []
+        for reader in readers:
+            for name in reader.fieldnames or []:
+                if name not in fieldnames:
+                    fieldnames.append(name)
+        rows = 0
+        with open(output_path, 'w', encoding='utf-8', newline='') as out:
+            writer = csv.DictWriter(out, fieldnames=fieldnames, restval='')
+            writer.writeheader()
+            for record in heapq.merge(*readers, key=_timestamp_key):
+                writer.writerow(record)
+                rows += 1
+        return rows
+    finally:
+        for f in files:
+            f.close()
+
+
+def merge_json_timelines(input_paths, output_path):
+    """
+    Streaming k-way merge of per-shard json-timeline files into a single
+    JSONL timeline sorted by Timestamp.  Returns the record count.
+    """
+    rows = 0
+    with open(output_path, 'w', encoding='utf-8') as out:
+        for record in heapq.merge(*(iter_json_records(path) for path in input_paths), key=_timestamp_key):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            rows += 1
+    return rows
+
+
+def merge_timelines(input_paths, output_path, fmt="csv"):
+    if fmt == "json":
+        return merge_json_timelines(input_paths, output_path)
+    return merge_csv_timelines(input_paths, output_path)
+
+
+class ShardedTimeline:
+    """
+    Build one timeline for a large EVTX collection from several Hayabusa
+    runs over size-balanced shards.
+
+    Each shard is a separate Hayabusa process scanning a staging directory
+    of hard links to its files, with the CPU budget split between shards via
+    --threads.  The sorted shard outputs are then merged on Timestamp.  A
+    single shard can also be run on its own (shard_index) so the collection
+    can be spread across hosts and merged afterwards with merge_timelines.
+    """
+
+    def __init__(self, hayabusa, log_dir, shard_count, fmt="csv", cpu_budget=None):
+        if fmt not in TIMELINE_COMMANDS:
+            raise ValueError(f"Unknown timeline format {fmt!r}")
+        self.hayabusa = hayabusa
+        self.log_dir = os.path.abspath(log_dir)
+        self.fmt = fmt
+        self.shards = plan_shards(list(iter_evtx_files(self.log_dir)), shard_count)
+        self.cpu_budget = max(1, cpu_budget or os.cpu_count() or 1)
+
+    def run_shard(self, index, output_file, options=None, threads=None):
+        """
+        Run the timeline command over one shard; returns (output, errors).
+        """
+        options = DEFAULT_OPTIONS + list(options or [])
+        if threads:
+            options += ["--threads", str(threads)]
+        if self.fmt == "json":
+            # JSONL output can be merged record by record
+            options.append("-L")
+        output_dir = os.path.dirname(os.path.abspath(output_file))
+        os.makedirs(output_dir, exist_ok=True)
+        staging_dir = stage_files(self.shards[index], output_dir)
+        try:
+            return self.hayabusa.run_command(TIMELINE_COMMANDS[self.fmt], ["-d", staging_dir, "-o", output_file] + options)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def run(self, output_file, options=None):
+        """
+        Run every shard concurrently and merge the results into output_file.
+        Returns the number of merged detections.
+        """
+        if not self.shards:
+            return 0
+        output_dir = os.path.dirname(os.path.abspath(output_file))
+        os.makedirs(output_dir, exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix="hayabusa_shards_", dir=output_dir)
+        threads = max(1, self.cpu_budget // len(self.shards))
+        try:
+            shard_outputs = [os.path.join(work_dir, f"shard_{index:03d}.{self.fmt}") for index in range(len(self.shards))]
+            with ThreadPoolExecutor(max_workers=len(self.shards)) as executor:
+                futures = [executor.submit(self.run_shard, index, shard_output, options, threads)
+                           for index, shard_output in enumerate(shard_outputs)]
+                for index, future in enumerate(futures):
+                    output, errors = future.result()
+                    if errors:
+                        print(f"\nShard {index} errors:\n{errors}")
+            return merge_timelines([path for path in shard_outputs if os.path.exists(path)], output_file, self.fmt)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a Hayabusa timeline from size-balanced shards of an EVTX directory.')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Scan the shards and merge their timelines.')
+    run_parser.add_argument('log_dir', help='Directory containing EVTX files.')
+    run_parser.add_argument('output', help='Merged timeline (or the shard timeline with --shard-index).')
+    run_parser.add_argument('--shards', type=int, default=os.cpu_count() or 1, help='Number of shards (default: CPU count).')
+    run_parser.add_argument('--shard-index', type=int, help='Only run this shard, e.g. on one of several hosts.')
+    run_parser.add_argument('--cpu-budget', type=int, help='Total Hayabusa threads across shards (default: CPU count).')
+    run_parser.add_argument('--hayabusa', default="/home/ronit/hayabusa-2.17.0-lin-x64-gnu", help='Path to the Hayabusa binary.')
+
+    plan_parser = subparsers.add_parser('plan', help='Print the shard plan.')
+    plan_parser.add_argument('log_dir', help='Directory containing EVTX files.')
+    plan_parser.add_argument('--shards', type=int, default=os.cpu_count() or 1, help='Number of shards (default: CPU count).')
+
+    merge_parser = subparsers.add_parser('merge', help='Merge shard timelines produced on other hosts.')
+    merge_parser.add_argument('output', help='Merged timeline.')
+    merge_parser.add_argument('inputs', nargs='+', help='Sorted shard timelines, in shard order.')
+
+    for sub in (run_parser, plan_parser, merge_parser):
+        sub.add_argument('--format', choices=['csv', 'json'], default='csv', help='Timeline format (default: csv).')
+    args = parser.parse_args()
+
+    if args.action == 'merge':
+        rows = merge_timelines(args.inputs, args.output, args.format)
+        print(f"Merged {rows} detections into {args.output}")
+        return
+
+    if args.action == 'plan':
+        shards = plan_shards(list(iter_evtx_files(args.log_dir)), args.shards)
+        for index, shard in enumerate(shards):
+            total = sum(os.path.getsize(path) for path in shard)
+            print(f"Shard {index}: {len(shard)} files, {total} bytes")
+            for path in shard:
+                print(f"  {path}")
+        return
+
+    from hayabusa_test import Hayabusa
+    sharded = ShardedTimeline(Hayabusa(args.hayabusa), args.log_dir, args.shards, args.format, args.cpu_budget)
+    if args.shard_index is not None:
+        if not 0 <= args.shard_index < len(sharded.shards):
+            parser.error(f"--shard-index must be between 0 and {len(sharded.shards) - 1}")
+        output, errors = sharded.run_shard(args.shard_index, args.output, threads=args.cpu_budget)
+        if errors:
+            print(f"\nErrors:\n{errors}")
+        print(f"Shard {args.shard_index} timeline written to {args.output}")
+        return
+
+    rows = sharded.run(args.output)
+    print(f"Merged {rows} detections from {len(sharded.shards)} shards into {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import datetime
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+
+from evtx_headers import (CHUNK_SIZE, FILE_HEADER_SIZE, chunk_time_range, iter_chunk_headers, open_mmap,
+                          parse_file_header)
+from evtx_incremental import DEFAULT_OPTIONS, STAGING_PREFIX, iter_evtx_files
+from evtx_reader import FILETIME_EPOCH
+from timeline_store import normalize_timestamp
+
+# Offsets of the file header fields rewritten for a trimmed copy
+FILE_HEADER_CHUNKS = struct.Struct("<QQ")  # first chunk, last chunk at offset 8
+FILE_HEADER_CHUNK_COUNT_OFFSET = 42
+FILE_HEADER_CHECKSUM_OFFSET = 124
+FILE_HEADER_CHECKSUMMED_SIZE = 120
+
+KEEP_ALL = "all"
+KEEP_SOME = "some"
+KEEP_NONE = "none"
+
+
+def to_filetime(value):
+    """
+    FILETIME for a datetime or a timestamp string; strings without an
+    offset are taken as UTC.
+    """
+    if isinstance(value, str):
+        normalized = normalize_timestamp(value)
+        try:
+            value = datetime.datetime.strptime(normalized, "%Y-%m-%dT%H:%M:%S.%f")
+        except (TypeError, ValueError):
+            raise ValueError(f"Unrecognised timestamp {value!r}")
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    delta = value - FILETIME_EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10 ** 7 + delta.microseconds * 10
+
+
+def format_hayabusa_time(value):
+    # --timeline-start/--timeline-end format, e.g. "2024-03-01 00:00:00 +00:00"
+    return datetime.datetime.strptime(normalize_timestamp(value), "%Y-%m-%dT%H:%M:%S.%f").strftime("%Y-%m-%d %H:%M:%S +00:00")
+
+
+def select_chunks(data, start=None, end=None):
+    """
+    Return (all chunks, chunks overlapping [start, end]) for a mapped file,
+    judging each chunk by the write times of its first and last record.
+    Chunks whose times can't be read are kept, as is the chunk still being
+    written in a dirty file, whose header may lag behind its records.
+    """
+    header = parse_file_header(data)
+    chunks = list(iter_chunk_headers(data))
+    selected = []
+    for chunk in chunks:
+        time_range = chunk_time_range(data, chunk)
+        if time_range is None:
+            selected.append(chunk)
+            continue
+        first, last = time_range
+        if header.dirty and chunk.index == header.last_chunk:
+            last = None
+        if start is not None and last is not None and max(first, last) < start:
+            continue
+        if end is not None and min(first, last if last is not None else first) > end:
+            continue
+        selected.append(chunk)
+    return chunks, selected
+
+
+def write_trimmed(data, chunks, target):
+    """
+    Write an EVTX file holding only the given chunks.  Chunks are
+    self-contained (names and templates are chunk-relative), so only the
+    file header's chunk numbers and checksum need rewriting.
+    """
+    header = bytearray(data[:FILE_HEADER_SIZE])
+    FILE_HEADER_CHUNKS.pack_into(header, 8, 0, len(chunks) - 1)
+    struct.pack_into("<H", header, FILE_HEADER_CHUNK_COUNT_OFFSET, len(chunks))
+    struct.pack_into("<I", header, FILE_HEADER_CHECKSUM_OFFSET, zlib.crc32(bytes(header[:FILE_HEADER_CHECKSUMMED_SIZE])))
+    with open(target, 'wb') as f:
+        f.write(header)
+        for chunk in chunks:
+            f.write(data[chunk.offset:chunk.offset + CHUNK_SIZE])
+
+
+def prefilter_file(path, start, end, staging_dir, name):
+    """
+    Stage one file for the window: hard-link it when every chunk overlaps,
+    write a trimmed copy when only some do, skip it when none do.
+    Returns (KEEP_ALL/KEEP_SOME/KEEP_NONE, bytes staged).
+    """
+    data = open_mmap(path)
+    if data is None:
+        return KEEP_NONE, 0
+    target = os.path.join(staging_dir, name)
+    try:
+        try:
+            chunks, selected = select_chunks(data, start, end)
+        except ValueError:
+            # Not a readable EVTX header; let Hayabusa decide what to do with it
+            chunks, selected = [None], [None]
+        if not selected:
+            return KEEP_NONE, 0
+        if len(selected) < len(chunks):
+            write_trimmed(data, selected, target)
+            return KEEP_SOME, os.path.getsize(target)
+    finally:
+        data.close()
+    try:
+        os.link(path, target)
+    except OSError:
+        shutil.copy2(path, target)
+    return KEEP_ALL, os.path.getsize(target)
+
+
+class TimeWindowTimeline:
+    """
+    csv-timeline/json-timeline over only the part of a log directory that can
+    hold events in [start, end].
+
+    Each file's header and chunk headers are read from a memory map (plus
+    the first and last record header of each chunk for their write times);
+    files entirely outside the window are skipped and chunks outside it are
+    cut from a trimmed copy, so Hayabusa's work follows the window rather
+    than the archive size.  --timeline-start/--timeline-end are passed on to
+    drop the remaining out-of-window records inside kept chunks.
+    """
+
+    def __init__(self, hayabusa, log_dir, start=None, end=None):
+        self.hayabusa = hayabusa
+        self.log_dir = os.path.abspath(log_dir)
+        self.start = start
+        self.end = end
+
+    def stage(self, staging_dir):
+        """
+        Stage the files needed for the window; returns a summary dict.
+        """
+        start = to_filetime(self.start) if self.start else None
+        end = to_filetime(self.end) if self.end else None
+        summary = {KEEP_ALL: 0, KEEP_SOME: 0, KEEP_NONE: 0, "bytes_total": 0, "bytes_staged": 0}
+        for index, file_path in enumerate(iter_evtx_files(self.log_dir)):
+            kept, staged = prefilter_file(file_path, start, end, staging_dir, f"{index:06d}_{os.path.basename(file_path)}")
+            summary[kept] += 1
+            summary["bytes_total"] += os.path.getsize(file_path)
+            summary["bytes_staged"] += staged
+        return summary
+
+    def time_options(self):
+        options = []
+        if self.start:
+            options += ["--timeline-start", format_hayabusa_time(self.start)]
+        if self.end:
+            options += ["--timeline-end", format_hayabusa_time(self.end)]
+        return options
+
+    def run(self, output_file, command="csv-timeline", options=None):
+        """
+        Stage the window and run the timeline command over it.
+        Returns (summary, stdout, stderr); nothing is run if no file overlaps.
+        """
+        output_dir = os.path.dirname(os.path.abspath(output_file))
+        os.makedirs(output_dir, exist_ok=True)
+        # Trimmed copies are new files, so stage next to the output rather than in the evidence directory
+        staging_dir = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=output_dir)
+        try:
+            summary = self.stage(staging_dir)
+            if not os.listdir(staging_dir):
+                return summary, None, ""
+            options = DEFAULT_OPTIONS + self.time_options() + list(options or [])
+            output, errors = self.hayabusa.run_command(command, ["-d", staging_dir, "-o", output_file] + options)
+            return summary, output, errors
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a Hayabusa timeline over only the EVTX files and chunks inside a time window.')
+    parser.add_argument('log_dir', help='Directory containing EVTX files.')
+    parser.add_argument('output', help='Timeline output file.')
+    parser.add_argument('--start', help='Window start, e.g. "2024-03-01 00:00:00 +09:00" (UTC if no offset).')
+    parser.add_argument('--end', help='Window end (inclusive).')
+    parser.add_argument('--format', choices=['csv', 'json'], default='csv', help='Timeline format (default: csv).')
+    parser.add_argument('--hayabusa', default="/home/ronit/hayabusa-2.17.0-lin-x64-gnu", help='Path to the Hayabusa binary.')
+    args = parser.parse_args()
+    if not args.start and not args.end:
+        parser.error("give --start, --end or both")
+
+    from hayabusa_test import Hayabusa
+    window = TimeWindowTimeline(Hayabusa(args.hayabusa), args.log_dir, args.start, args.end)
+    summary, output, errors = window.run(args.output, f"{args.format}-timeline")
+    if errors:
+        print(f"\nErrors:\n{errors}")
+    print(f"\nFiles kept whole: {summary[KEEP_ALL]}, trimmed: {summary[KEEP_SOME]}, skipped: {summary[KEEP_NONE]}")
+    print(f"Hayabusa scanned {summary['bytes_staged']} of {summary['bytes_total']} bytes")
+    if output is None:
+        print("No EVTX file overlaps the window; nothing to run.")
+    else:
+        print(f"Timeline written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import json
+import os
+import shutil
+import sys
+
+from hayabusa_rules import get_rules_dir, rules_digest
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.metadata_cache import DEFAULT_CACHE_DIR, MetadataCache
+
+# Timelines get their own cache so one large report can't evict every ExifTool and hachoir entry
+DEFAULT_HAYABUSA_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, "hayabusa")
+HAYABUSA_CACHE_BYTES = 8 * 1024 ** 3
+# Runs whose stdout and -o file together exceed this are not cached
+MAX_ENTRY_BYTES = 512 * 1024 ** 2
+# Options naming the input/output files or sizing the thread pool; they don't change the result
+IGNORED_VALUE_OPTIONS = {"-f", "--file", "-o", "--output", "-t", "--threads"}
+RULES_OPTIONS = {"-r", "--rules"}
+
+
+def normalize_options(options):
+    normalized = []
+    skip = False
+    for option in options:
+        if skip:
+            skip = False
+        elif option in IGNORED_VALUE_OPTIONS:
+            skip = True
+        else:
+            normalized.append(option)
+    return normalized
+
+
+class HayabusaResultCache:
+    """
+    Memoize Hayabusa reports in a MetadataCache of their own
+    (~/.cache/metadata-saas/hayabusa, HAYABUSA_CACHE_DIR).
+
+    Entries are keyed by (SHA-256 of the EVTX file, Hayabusa binary digest
+    plus rule-set digest, subcommand, options without file paths and thread
+    counts).  The entry itself is a small record of stderr and which parts
+    were kept; stdout and any -o output file are stored as separate cache
+    files, copied in and out in blocks so a timeline is never held in
+    memory.  Runs over MAX_ENTRY_BYTES are not cached.
+    The rule-set digest covers rules/config too (profiles, level tuning).
+    refresh_rules() recomputes it after update-rules, set-default-profile or
+    level-tuning, so results produced with the old rules or configuration
+    simply stop matching and age out of the cache by LRU.
+    """
+
+    def __init__(self, hayabusa_path, cache=None, rules_dir=None):
+        self.hayabusa_path = hayabusa_path
+        self.cache = cache or MetadataCache(os.environ.get("HAYABUSA_CACHE_DIR", DEFAULT_HAYABUSA_CACHE_DIR),
+                                            HAYABUSA_CACHE_BYTES)
+        self.rules_dir = rules_dir or get_rules_dir(hayabusa_path)
+        self._rules_versions = {}
+        self.refresh_rules()
+
+    def close(self):
+        self.cache.close()
+
+    def refresh_rules(self):
+        self._rules_versions = {self.rules_dir: rules_digest(self.rules_dir)}
+
+    def _rules_version(self, command, options):
+        rules_dir = self.rules_dir
+        # search uses -r for its regex; everywhere else it selects another rule set
+        if command != "search":
+            for index, option in enumerate(options[:-1]):
+                if option in RULES_OPTIONS:
+                    rules_dir = options[index + 1]
+        if rules_dir not in self._rules_versions:
+            self._rules_versions[rules_dir] = rules_digest(rules_dir)
+        return self._rules_versions[rules_dir]
+
+    def key(self, command, input_file, options):
+        """
+        Cache key for a run, or None if the input or binary can't be hashed.
+        """
+        try:
+            tool_version = f"{self.cache.file_digest(self.hayabusa_path)}:{self._rules_version(command, options)}"
+            content_digest = self.cache.file_digest(input_file)
+        except OSError:
+            return None
+        return self.cache.make_key(content_digest, "hayabusa-" + command, tool_version, normalize_options(options))
+
+    def _part_key(self, key, part):
+        return self.cache.make_key(key, "hayabusa-" + part, None, None)
+
+    def load(self, key, output_file=None, stream=None):
+        """
+        Replay a cached run: restore its -o file and stream sink and return
+        (stdout, stderr) like Hayabusa.run_command, or None on a miss.
+        """
+        if key is None:
+            return None
+        value = self.cache.get(key)
+        if value is None:
+            return None
+        entry = json.loads(value)
+        if output_file is not None and not entry["output_file"]:
+            return None
+        stdout_path = self.cache.get_path(self._part_key(key, "stdout")) if entry["stdout"] else None
+        output_path = self.cache.get_path(self._part_key(key, "output_file")) if output_file is not None else None
+        if (entry["stdout"] and stdout_path is None) or (output_file is not None and output_path is None):
+            # A part was evicted on its own
+            return None
+        try:
+            if output_path is not None:
+                shutil.copyfile(output_path, output_file)
+            if stdout_path is None:
+                return stream.replay([], entry["errors"]) if stream is not None else ("", entry["errors"])
+            with open(stdout_path, 'r', encoding='utf-8', newline='') as f:
+                if stream is not None:
+                    return stream.replay(f, entry["errors"])
+                return f.read(), entry["errors"]
+        except FileNotFoundError:
+            # Evicted by another process while being read
+            return None
+
+    def store(self, key, output, errors, output_file=None, stream=None):
+        """
+        Remember a finished run; runs that failed or are larger than
+        MAX_ENTRY_BYTES are skipped.
+        """
+        if key is None:
+            return
+        if stream is not None:
+            offset = stream.output_offset() if stream.returncode == 0 else None
+            if offset is None:
+                return
+            stdout_size = os.path.getsize(stream.path) - offset if stream.lines_written else 0
+        else:
+            if output is None:
+                return
+            stdout_size = len(output.encode('utf-8'))
+        output_size = 0
+        if output_file is not None:
+            if not os.path.exists(output_file):
+                return
+            output_size = os.path.getsize(output_file)
+        if stdout_size + output_size > MAX_ENTRY_BYTES:
+            return
+
+        if stdout_size:
+            if stream is not None:
+                self.cache.put_file(self._part_key(key, "stdout"), stream.path, offset)
+            else:
+                self.cache.put(self._part_key(key, "stdout"), output)
+        if output_file is not None:
+            self.cache.put_file(self._part_key(key, "output_file"), output_file)
+        # Written last, so a reader never finds the entry without its parts
+        self.cache.put(key, json.dumps({"errors": errors, "stdout": bool(stdout_size),
+                                        "output_file": output_file is not None}, ensure_ascii=False))
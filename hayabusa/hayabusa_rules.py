@@ -0,0 +1,27 @@
+import hashlib
+import os
+
+
+def get_rules_dir(hayabusa_path):
+    # update-rules keeps the rule set in a "rules" directory next to the binary
+    return os.path.join(os.path.dirname(os.path.abspath(hayabusa_path)), "rules")
+
+
+def rules_digest(rules_dir):
+    """
+    SHA-256 over the relative path and content of every file in the rule set,
+    so any change made by update-rules gives a different digest.  Returns an
+    empty string when the directory does not exist.
+    """
+    if not os.path.isdir(rules_dir):
+        return ""
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(rules_dir):
+        # .git holds history, not rules; skipping it keeps the digest stable across fetches
+        dirnames[:] = sorted(d for d in dirnames if d != ".git")
+        for filename in sorted(filenames):
+            file_path = os.path.join(dirpath, filename)
+            digest.update(os.path.relpath(file_path, rules_dir).replace(os.sep, "/").encode("utf-8") + b"\0")
+            with open(file_path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
@@ -0,0 +1,85 @@
+import collections
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from evtx_incremental import DEFAULT_OPTIONS
+
+# Subcommands that scan EVTX records and accept Hayabusa's --threads option
+THREADED_COMMANDS = {
+    "csv_timeline",
+    "json_timeline",
+    "computer_metrics",
+    "eid_metrics",
+    "logon_summary",
+    "pivot_keywords_list",
+    "search",
+}
+
+# Subcommands that stop at Hayabusa's interactive scan wizard unless told not to
+WIZARD_COMMANDS = {
+    "csv_timeline",
+    "json_timeline",
+}
+
+JobResult = collections.namedtuple("JobResult", ["name", "output", "errors", "elapsed", "threads"])
+
+
+class HayabusaScheduler:
+    """
+    Run independent Hayabusa subcommands concurrently under a CPU budget.
+
+    Up to max_parallel commands run at once and the budget is split evenly
+    between them through Hayabusa's own --threads option, so the machine is
+    not oversubscribed by several commands each sizing itself to all cores.
+    """
+
+    def __init__(self, hayabusa, cpu_budget=None, max_parallel=None):
+        self.hayabusa = hayabusa
+        self.cpu_budget = max(1, cpu_budget or os.cpu_count() or 1)
+        self.max_parallel = max_parallel
+        self.jobs = []
+
+    def add(self, name, method, *args, **kwargs):
+        """
+        Queue hayabusa.<method>(*args, **kwargs) under a display name, e.g.
+        add("eid-metrics", "eid_metrics", evtx_file).
+        """
+        self.jobs.append((name, method, args, kwargs))
+
+    def _threads_per_job(self, parallel):
+        return max(1, self.cpu_budget // parallel)
+
+    def _run_job(self, name, method, args, kwargs, threads):
+        options = []
+        if method in THREADED_COMMANDS:
+            options += ["--threads", str(threads)]
+        if method in WIZARD_COMMANDS:
+            options += DEFAULT_OPTIONS
+        start = time.perf_counter()
+        output, errors = getattr(self.hayabusa, method)(*args, options=options, **kwargs)
+        return JobResult(name, output, errors, time.perf_counter() - start, threads if options else None)
+
+    def run(self):
+        """
+        Run every queued job and return their JobResults in queue order.
+        """
+        if not self.jobs:
+            return []
+        parallel = min(len(self.jobs), self.max_parallel or self.cpu_budget)
+        threads = self._threads_per_job(parallel)
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            futures = [executor.submit(self._run_job, name, method, args, kwargs, threads)
+                       for name, method, args, kwargs in self.jobs]
+            results = [future.result() for future in futures]
+        self.jobs = []
+        return results
+
+
+def format_timings(results, total_elapsed):
+    lines = ["Command                  Wall time  Threads"]
+    for result in results:
+        threads = "-" if result.threads is None else str(result.threads)
+        lines.append(f"{result.name:<24} {result.elapsed:>8.2f}s  {threads}")
+    lines.append(f"{'Total (wall clock)':<24} {total_elapsed:>8.2f}s")
+    return "\n".join(lines)
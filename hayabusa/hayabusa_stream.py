@@ -0,0 +1,133 @@
+import collections
+import os
+import subprocess
+import sys
+import threading
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.tool_runner import run_tool
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+STDERR_TAIL_LINES = 200
+
+
+class CommandStream:
+    """
+    Run a command with Popen and yield its stdout line by line as it arrives.
+
+    Only the last STDERR_TAIL_LINES lines of stderr are kept (drained on a
+    background thread so a full stderr pipe can never stall the command), so
+    memory stays bounded however much the command prints.
+    """
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.returncode = None
+        self._stderr_tail = collections.deque(maxlen=STDERR_TAIL_LINES)
+
+    @property
+    def errors(self):
+        return "".join(self._stderr_tail)
+
+    def _drain_stderr(self, stream):
+        for line in stream:
+            self._stderr_tail.append(line)
+
+    def __iter__(self):
+        process = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   text=True, encoding='utf-8', errors='replace')
+        stderr_thread = threading.Thread(target=self._drain_stderr, args=(process.stderr,), daemon=True)
+        stderr_thread.start()
+        finished = False
+        try:
+            for line in process.stdout:
+                yield line
+            finished = True
+        finally:
+            # The consumer may stop early; don't leave the command running
+            if not finished and process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            self.returncode = process.wait()
+            stderr_thread.join()
+
+
+class FileSink:
+    """
+    Destination for a streamed command: stdout is written straight to path
+    through a large write buffer instead of being collected in memory.
+
+    on_line(line) is called for every line (e.g. progress reporting, on the
+    tool runner's thread) and line_filter(line) decides which lines are
+    written.
+    """
+
+    def __init__(self, path, header=None, line_filter=None, on_line=None):
+        self.path = path
+        self.header = header
+        self.line_filter = line_filter
+        self.on_line = on_line
+        self.lines_written = 0
+        self.returncode = None
+
+    def capture(self, cmd, timeout=None, tool=None):
+        """
+        Stream cmd into the file through the shared tool runner and return
+        (None, stderr), matching Hayabusa.run_command's (stdout, stderr)
+        shape; stdout is in the file.
+        """
+        self.lines_written = 0
+        self.returncode = None
+        try:
+            with open(self.path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+                if self.header:
+                    f.write(self.header)
+
+                def write(line):
+                    if self.on_line is not None:
+                        self.on_line(line)
+                    if self.line_filter is None or self.line_filter(line):
+                        f.write(line)
+                        self.lines_written += 1
+
+                result = run_tool(cmd, tool=tool, timeout=timeout, on_stdout=write, capture=False,
+                                  stderr_lines=STDERR_TAIL_LINES)
+                if not self.lines_written:
+                    f.write("No output generated.")
+        except OSError as e:
+            print(f"An error occurred while running the command: {e}")
+            return None, str(e)
+        self.returncode = result.returncode
+        return None, result.stderr
+
+    def output_offset(self):
+        """
+        Byte offset in the file where the stdout captured by the last
+        capture() starts (it runs to the end of the file when lines_written
+        is non-zero), or None if lines were filtered out and the file no
+        longer holds it all.
+        """
+        if self.line_filter is not None or self.returncode is None:
+            return None
+        return len(self.header.encode('utf-8')) if self.header else 0
+
+    def replay(self, lines, errors):
+        """
+        Write previously captured stdout (an iterable of lines, e.g. an open
+        file) to the file as capture() would have.
+        """
+        self.lines_written = 0
+        with open(self.path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+            if self.header:
+                f.write(self.header)
+            for line in lines:
+                if self.on_line is not None:
+                    self.on_line(line)
+                if self.line_filter is None or self.line_filter(line):
+                    f.write(line)
+                    self.lines_written += 1
+            if not self.lines_written:
+                f.write("No output generated.")
+        self.returncode = 0
+        return None, errors
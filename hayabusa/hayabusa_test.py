@@ -3,13 +3,32 @@ import subprocess
 import sys
 import argparse
 import datetime
+import json
 import time
 import signal
 import platform
 
+from evtx_metrics import collect_metrics
+from hayabusa_cache import HayabusaResultCache
+from hayabusa_scheduler import HayabusaScheduler, format_timings
+from hayabusa_stream import CommandStream, FileSink
+from timeline_store import TimelineStore
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.hashing import hash_manifest
+from common.tool_runner import kill_running_tools, run_tool
+
+# Subcommands that change the rules or the rules/config files (profiles, level tuning)
+CONFIG_COMMANDS = {"update-rules", "set-default-profile", "level-tuning"}
+
 class Hayabusa:
-    def __init__(self, hayabusa_path):
+    def __init__(self, hayabusa_path, cache=None, timeout=None):
         self.hayabusa_path = hayabusa_path
+        # Optional HayabusaResultCache; reports for unchanged evidence and rules are replayed from it
+        self.cache = cache
+        # Seconds before a hung command is killed (None: no limit)
+        self.timeout = timeout
         self.make_executable()
     
     def make_executable(self):
@@ -22,84 +41,115 @@ class Hayabusa:
         elif platform.system().lower() == "windows":
             print(f"Path is set for Windows: {self.hayabusa_path}")
 
-    def run_command(self, command, options=None):
+    def run_command(self, command, options=None, stream=None):
         if options is None:
             options = []
         cmd = [self.hayabusa_path, command] + options
-        try:
-            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
-            return result.stdout, result.stderr
-        except Exception as e:
-            print(f"An error occurred while running the command: {e}")
-            return None, str(e)
-
-    def csv_timeline(self, input_file, output_file, options=None):
+        if stream is not None:
+            # Write stdout straight to the sink's file instead of holding it in memory
+            output, errors = stream.capture(cmd, self.timeout, "hayabusa")
+        else:
+            try:
+                result = run_tool(cmd, tool="hayabusa", timeout=self.timeout)
+                output, errors = result.stdout, result.stderr
+            except Exception as e:
+                print(f"An error occurred while running the command: {e}")
+                output, errors = None, str(e)
+        if self.cache is not None and command in CONFIG_COMMANDS:
+            # Profiles and level tuning live under the rules directory; rehashing it means
+            # reports made with the old rules or configuration are never returned
+            self.cache.refresh_rules()
+        return output, errors
+
+    def run_cached(self, command, input_file, options, stream=None, output_file=None):
+        if self.cache is None:
+            return self.run_command(command, options, stream)
+        key = self.cache.key(command, input_file, options)
+        cached = self.cache.load(key, output_file, stream)
+        if cached is not None:
+            return cached
+        output, errors = self.run_command(command, options, stream)
+        self.cache.store(key, output, errors, output_file, stream)
+        return output, errors
+
+    def stream_command(self, command, options=None):
+        # Yield decoded stdout lines as Hayabusa produces them
+        if options is None:
+            options = []
+        return CommandStream([self.hayabusa_path, command] + options)
+
+    def csv_timeline(self, input_file, output_file, options=None, stream=None):
         if options is None:
             options = []
         options += ["-f", input_file, "-o", output_file]
-        return self.run_command("csv-timeline", options)
+        return self.run_cached("csv-timeline", input_file, options, stream, output_file)
     
-    def json_timeline(self, input_file, output_file, options=None):
+    def json_timeline(self, input_file, output_file, options=None, stream=None):
         if options is None:
             options = []
         options += ["-f", input_file, "-o", output_file]
-        return self.run_command("json-timeline", options)
+        return self.run_cached("json-timeline", input_file, options, stream, output_file)
 
-    def level_tuning(self, options=None):
-        return self.run_command("level-tuning", options)
+    def level_tuning(self, options=None, stream=None):
+        return self.run_command("level-tuning", options, stream)
     
-    def list_profiles(self, options=None):
-        return self.run_command("list-profiles", options)
+    def list_profiles(self, options=None, stream=None):
+        return self.run_command("list-profiles", options, stream)
     
-    def set_default_profile(self, profile, options=None):
+    def set_default_profile(self, profile, options=None, stream=None):
         if options is None:
             options = []
         options += ["-p", profile]
-        return self.run_command("set-default-profile", options)
+        return self.run_command("set-default-profile", options, stream)
     
-    def update_rules(self, options=None):
-        return self.run_command("update-rules", options)
+    def update_rules(self, options=None, stream=None):
+        return self.run_command("update-rules", options, stream)
     
-    def computer_metrics(self, input_file, options=None):
+    def computer_metrics(self, input_file, options=None, stream=None):
         if options is None:
             options = []
         options += ["-f", input_file]
-        return self.run_command("computer-metrics", options)
+        return self.run_cached("computer-metrics", input_file, options, stream)
     
-    def eid_metrics(self, input_file, options=None):
+    def eid_metrics(self, input_file, options=None, stream=None):
         if options is None:
             options = []
         options += ["-f", input_file]
-        return self.run_command("eid-metrics", options)
+        return self.run_cached("eid-metrics", input_file, options, stream)
     
-    def logon_summary(self, input_file, options=None):
+    def logon_summary(self, input_file, options=None, stream=None):
         if options is None:
             options = []
         options += ["-f", input_file]
-        return self.run_command("logon-summary", options)
+        return self.run_cached("logon-summary", input_file, options, stream)
     
-    def pivot_keywords_list(self, input_file, options=None):
+    def pivot_keywords_list(self, input_file, options=None, stream=None):
         if options is None:
             options = []
         options += ["-f", input_file]
-        return self.run_command("pivot-keywords-list", options)
+        return self.run_cached("pivot-keywords-list", input_file, options, stream)
 
-    def search(self, input_file, keywords, options=None):
+    def search(self, input_file, keywords, options=None, stream=None):
         if options is None:
             options = []
         options += ["-f", input_file, "-s", keywords]
-        return self.run_command("search", options)
+        return self.run_cached("search", input_file, options, stream)
 
 def handle_interrupt(signum, frame):
     print("\nProcess interrupted.")
+    # Tools run on the runner's background loop; stop them rather than leave them behind
+    kill_running_tools()
     sys.exit(1)
 
+def get_output_file_path(file_path, command, directory):
+    output_file_name = f"{os.path.splitext(os.path.basename(file_path))[0]}_{command}_output.txt"
+    return os.path.join(directory, output_file_name)
+
 def save_output_to_file(output, file_path, command, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
     
-    output_file_name = f"{os.path.splitext(os.path.basename(file_path))[0]}_{command}_output.txt"
-    output_file_path = os.path.join(directory, output_file_name)
+    output_file_path = get_output_file_path(file_path, command, directory)
     
     try:
         with open(output_file_path, 'w', encoding='utf-8') as f:
@@ -114,7 +164,6 @@ def save_output_to_file(output, file_path, command, directory):
         print(f"Output content: {output}")
     
     print(f"\nOperation Completed.\nOutput stored in: {output_file_path}")
-    time.sleep(2)
 
 def main():
     signal.signal(signal.SIGINT, handle_interrupt)
@@ -122,59 +171,94 @@ def main():
     # Set up argument parsing
     parser = argparse.ArgumentParser(description='Automate Hayabusa tool for analyzing files.')
     parser.add_argument('file', help='The file path to analyze with Hayabusa.')
+    parser.add_argument('--cpu-budget', type=int, help='Total threads shared by all commands (default: number of CPUs).')
+    parser.add_argument('--max-parallel', type=int, help='Maximum number of Hayabusa commands running at once.')
+    parser.add_argument('--store', action='store_true', help='Load the CSV timeline into an indexed timeline.sqlite for querying.')
+    parser.add_argument('--no-cache', action='store_true', help='Always rerun Hayabusa instead of reusing cached reports.')
+    parser.add_argument('--native-metrics', action='store_true', help='Compute computer/eid metrics and the logon summary in one in-process pass.')
+    parser.add_argument('--hash', action='store_true', help='Write an MD5/SHA-1/SHA-256 manifest of the input file.')
+    parser.add_argument('--timeout', type=float, help='Seconds before a hung Hayabusa command is killed.')
     
     args = parser.parse_args()
 
     # Initialize Hayabusa
     hayabusa_path = "/home/ronit/hayabusa-2.17.0-lin-x64-gnu"
-    hayabusa = Hayabusa(hayabusa_path)
+    cache = None if args.no_cache else HayabusaResultCache(hayabusa_path)
+    hayabusa = Hayabusa(hayabusa_path, cache, args.timeout)
 
     output_dir = f"hayabusa_output_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
-    
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    scheduler = HayabusaScheduler(hayabusa, cpu_budget=args.cpu_budget, max_parallel=args.max_parallel)
+
+    def sink(file_path, command):
+        # Stream each command's console output straight into its output file
+        return FileSink(get_output_file_path(file_path, command, output_dir), header=f"Command: {command}\n\n")
+
     # Run List Profiles (This will always run regardless of file type)
-    output, errors = hayabusa.list_profiles()
-    save_output_to_file(output, "list_profiles", "list_profiles", output_dir)
+    scheduler.add("list_profiles", "list_profiles", stream=sink("list_profiles", "list_profiles"))
     
     file_extension = os.path.splitext(args.file)[1].lower()
 
     if file_extension == ".evtx":
         # Run all tests for EVTX files
         print(f"Running tests for EVTX file: {args.file}")
+        base_name = os.path.splitext(os.path.basename(args.file))[0]
 
-        # CSV Timeline
-        output_file = os.path.join(output_dir, f"{os.path.splitext(args.file)[0]}_csv_timeline_output.txt")
-        output, errors = hayabusa.csv_timeline(args.file, output_file)
-        save_output_to_file(output, args.file, "csv-timeline", output_dir)
-        
-        # JSON Timeline
-        output_file = os.path.join(output_dir, f"{os.path.splitext(args.file)[0]}_json_timeline_output.txt")
-        output, errors = hayabusa.json_timeline(args.file, output_file)
-        save_output_to_file(output, args.file, "json-timeline", output_dir)
-
-        # Computer Metrics
-        output, errors = hayabusa.computer_metrics(args.file)
-        save_output_to_file(output, args.file, "computer-metrics", output_dir)
-        
-        # Event ID Metrics
-        output, errors = hayabusa.eid_metrics(args.file)
-        save_output_to_file(output, args.file, "eid-metrics", output_dir)
-        
-        # Logon Summary
-        output, errors = hayabusa.logon_summary(args.file)
-        save_output_to_file(output, args.file, "logon-summary", output_dir)
-        
-        # Pivot Keywords List
-        output, errors = hayabusa.pivot_keywords_list(args.file)
-        save_output_to_file(output, args.file, "pivot-keywords-list", output_dir)
+        # The commands only read the EVTX file, so they can all run at the same time
+        csv_timeline_file = os.path.join(output_dir, f"{base_name}_csv_timeline_output.txt")
+        scheduler.add("csv-timeline", "csv_timeline", args.file, csv_timeline_file,
+                      stream=sink(args.file, "csv-timeline"))
+        scheduler.add("json-timeline", "json_timeline", args.file, os.path.join(output_dir, f"{base_name}_json_timeline_output.txt"),
+                      stream=sink(args.file, "json-timeline"))
+        if not args.native_metrics:
+            scheduler.add("computer-metrics", "computer_metrics", args.file, stream=sink(args.file, "computer-metrics"))
+            scheduler.add("eid-metrics", "eid_metrics", args.file, stream=sink(args.file, "eid-metrics"))
+            scheduler.add("logon-summary", "logon_summary", args.file, stream=sink(args.file, "logon-summary"))
+        scheduler.add("pivot-keywords-list", "pivot_keywords_list", args.file, stream=sink(args.file, "pivot-keywords-list"))
 
         # Search (using placeholder keyword)
         placeholder_keywords = "example"
-        output, errors = hayabusa.search(args.file, placeholder_keywords)
-        save_output_to_file(output, args.file, "search", output_dir)
+        scheduler.add("search", "search", args.file, placeholder_keywords, stream=sink(args.file, "search"))
     else:
         print(f"Unsupported file type: {file_extension}. No tests were run.")
+
+    start = time.perf_counter()
+    results = scheduler.run()
+    total_elapsed = time.perf_counter() - start
+
+    for result in results:
+        if result.errors:
+            print(f"\n{result.name} errors:\n{result.errors}")
+
+    print("\n" + format_timings(results, total_elapsed))
+
+    if args.hash:
+        manifest_path = os.path.join(output_dir, "hash_manifest.csv")
+        hash_manifest([args.file], manifest_path)
+        print(f"\nInput hashes stored in: {manifest_path}")
+
+    if file_extension != ".evtx":
         sys.exit(1)
 
+    if args.native_metrics:
+        # One read of the EVTX file feeds all three reports
+        start = time.perf_counter()
+        aggregators, records, errors = collect_metrics([args.file])
+        for name, aggregator in aggregators.items():
+            metrics_file = os.path.splitext(get_output_file_path(args.file, name, output_dir))[0] + ".json"
+            with open(metrics_file, 'w', encoding='utf-8') as f:
+                json.dump(aggregator.result(), f, indent=2, ensure_ascii=False)
+        print(f"\nNative metrics: {records} records ({errors} unreadable) in {time.perf_counter() - start:.2f}s")
+
+    if args.store and os.path.exists(csv_timeline_file):
+        # Query later with: python timeline_store.py query <db> --start ... --computer ...
+        store_path = os.path.join(output_dir, "timeline.sqlite")
+        with TimelineStore(store_path) as store:
+            count = store.ingest(csv_timeline_file, "csv")
+        print(f"\nLoaded {count} detections into {store_path}")
+
     print(f"\nAll applicable tests have been run. Results are stored in the directory: {output_dir}")
 
 if __name__ == "__main__":
@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import tempfile
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+from timeline_store import BATCH_SIZE, iter_csv_records, iter_json_records
+
+RECORDS_FILE = "records.jsonl"
+INDEX_FILE = "index.sqlite"
+# The trigram tokenizer can only look up substrings of at least three characters
+MIN_INDEXED_LENGTH = 3
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY, offset INTEGER, length INTEGER)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS record_text USING fts5(text, content='', tokenize='trigram')",
+)
+
+
+def record_text(record):
+    """
+    The searchable text of a record: every field value, one per line, the
+    way `hayabusa search` matches keywords against any field.
+    """
+    values = []
+    for value in record.values():
+        if isinstance(value, dict):
+            values.append(record_text(value))
+        elif isinstance(value, list):
+            values.extend(json.dumps(item, ensure_ascii=False) if isinstance(item, (dict, list)) else str(item) for item in value)
+        elif value is not None:
+            values.append(str(value))
+    return "\n".join(values)
+
+
+def _fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def required_literal(pattern, flags=0):
+    """
+    Longest literal run that every match of the regex must contain, or None.
+    Only the top level of the pattern is inspected, so alternations and
+    optional groups never produce a literal that a match could lack.
+    """
+    best = ""
+    current = []
+    for op, value in sre_parse.parse(pattern, flags):
+        if op is sre_parse.LITERAL:
+            current.append(chr(value))
+            continue
+        best = max(best, "".join(current), key=len)
+        current = []
+    best = max(best, "".join(current), key=len)
+    return best if len(best) >= MIN_INDEXED_LENGTH else None
+
+
+class KeywordIndex:
+    """
+    One-time trigram index over event records so keyword and regex hunts do
+    not rescan the EVTX files for every query.
+
+    The index directory holds the records as JSONL plus a SQLite FTS5
+    trigram index mapping substrings to record byte offsets.  Keyword
+    queries (substrings, like `hayabusa search -k`) are answered from the
+    index; regex queries use the longest literal the
+    pattern requires to prefilter candidates before running the regex.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+        self.records_path = os.path.join(index_dir, RECORDS_FILE)
+        self.db = sqlite3.connect(os.path.join(index_dir, INDEX_FILE))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.db.commit()
+        self._records = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._records is not None:
+            self._records.close()
+            self._records = None
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def build(self, source_path, fmt=None):
+        """
+        (Re)build the index from a `hayabusa search` CSV dump, a csv-timeline
+        or a json-timeline/JSONL file.  Returns the number of records.
+        """
+        if fmt is None:
+            fmt = "json" if os.path.splitext(source_path)[1].lower() in (".json", ".jsonl") else "csv"
+        records = iter_json_records(source_path) if fmt == "json" else iter_csv_records(source_path)
+
+        if self._records is not None:
+            self._records.close()
+            self._records = None
+        with self.db:
+            self.db.execute("DELETE FROM records")
+            # A contentless FTS5 table refuses DELETE; 'delete-all' is its way to clear the index
+            self.db.execute("INSERT INTO record_text(record_text) VALUES ('delete-all')")
+
+        count = 0
+        rows, texts = [], []
+        offset = 0
+        self.db.execute("PRAGMA synchronous=OFF")
+        try:
+            with open(self.records_path, 'wb') as out, self.db:
+                for record in records:
+                    line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                    out.write(line)
+                    count += 1
+                    rows.append((count, offset, len(line)))
+                    texts.append((count, record_text(record)))
+                    offset += len(line)
+                    if len(rows) >= BATCH_SIZE:
+                        self._insert(rows, texts)
+                        rows, texts = [], []
+                if rows:
+                    self._insert(rows, texts)
+            with self.db:
+                self.db.execute("INSERT INTO record_text(record_text) VALUES ('optimize')")
+        finally:
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        return count
+
+    def _insert(self, rows, texts):
+        self.db.executemany("INSERT INTO records (id, offset, length) VALUES (?, ?, ?)", rows)
+        self.db.executemany("INSERT INTO record_text (rowid, text) VALUES (?, ?)", texts)
+
+    def build_from_evtx(self, hayabusa, input_path, options=None):
+        """
+        Dump every record of an EVTX file or directory once with
+        `hayabusa search -r .` and index the dump.
+        """
+        options = list(options or [])
+        input_args = ["-d", input_path] if os.path.isdir(input_path) else ["-f", input_path]
+        fd, dump_path = tempfile.mkstemp(prefix=".search_dump_", suffix=".csv", dir=self.index_dir)
+        os.close(fd)
+        try:
+            output, errors = hayabusa.run_command("search", input_args + ["-r", ".", "-o", dump_path] + options)
+            if errors:
+                print(f"\nErrors:\n{errors}")
+            return self.build(dump_path, "csv")
+        finally:
+            os.remove(dump_path)
+
+    def _read(self, offset, length):
+        if self._records is None:
+            self._records = open(self.records_path, 'rb')
+        self._records.seek(offset)
+        return json.loads(self._records.read(length).decode("utf-8"))
+
+    def _candidates(self, literals, all_literals=True):
+        """
+        (id, offset, length) of records containing the literals, or of every
+        record when none of them can be looked up in the trigram index.
+        """
+        indexed = [literal for literal in literals if len(literal) >= MIN_INDEXED_LENGTH]
+        if not indexed or (not all_literals and len(indexed) != len(literals)):
+            return self.db.execute("SELECT id, offset, length FROM records ORDER BY id")
+        match = (" AND " if all_literals else " OR ").join(_fts_phrase(literal) for literal in indexed)
+        return self.db.execute(
+            "SELECT id, offset, length FROM records WHERE id IN "
+            "(SELECT rowid FROM record_text WHERE record_text MATCH ?) ORDER BY id",
+            (match,),
+        )
+
+    def search(self, keywords, all_keywords=False, limit=None, ignore_case=False):
+        """
+        Yield records containing any (or, with all_keywords, every) keyword
+        as a substring, in record order.  Matching is case-sensitive unless
+        ignore_case is set; the trigram lookup itself ignores case and only
+        narrows the candidates.
+        """
+        if isinstance(keywords, str):
+            keywords = [keywords]
+        fold = str.casefold if ignore_case else str
+        folded = [fold(keyword) for keyword in keywords]
+        combine = all if all_keywords else any
+        found = 0
+        for _, offset, length in self._candidates(keywords, all_keywords):
+            record = self._read(offset, length)
+            text = fold(record_text(record))
+            if combine(keyword in text for keyword in folded):
+                yield record
+                found += 1
+                if limit and found >= limit:
+                    return
+
+    def search_regex(self, pattern, ignore_case=False, limit=None):
+        """
+        Yield records whose text matches the regular expression, in record
+        order.  Only records holding the pattern's required literal are read.
+        """
+        flags = re.IGNORECASE if ignore_case else 0
+        regex = re.compile(pattern, flags)
+        literal = required_literal(pattern, flags)
+        found = 0
+        for _, offset, length in self._candidates([literal] if literal else []):
+            record = self._read(offset, length)
+            if regex.search(record_text(record)):
+                yield record
+                found += 1
+                if limit and found >= limit:
+                    return
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and query a keyword index over EVTX records.')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Index the records of EVTX files or of a timeline file.')
+    build_parser.add_argument('index_dir', help='Directory for the index.')
+    source = build_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--evtx', help='EVTX file or directory, dumped once with hayabusa search.')
+    source.add_argument('--timeline', help='Existing search dump, csv-timeline or json-timeline output.')
+    build_parser.add_argument('--format', choices=['csv', 'json'], help='Timeline format (default: from the file extension).')
+    build_parser.add_argument('--hayabusa', default="/home/ronit/hayabusa-2.17.0-lin-x64-gnu", help='Path to the Hayabusa binary.')
+
+    search_parser = subparsers.add_parser('search', help='Query the index; prints matching records as JSONL.')
+    search_parser.add_argument('index_dir', help='Directory of the index.')
+    search_parser.add_argument('-k', '--keyword', action='append', help='Keyword (repeatable).')
+    search_parser.add_argument('-r', '--regex', help='Regular expression.')
+    search_parser.add_argument('-i', '--ignore-case', action='store_true', help='Case-insensitive keywords or regex.')
+    search_parser.add_argument('-a', '--and-logic', action='store_true', help='Require every keyword.')
+    search_parser.add_argument('--limit', type=int, help='Maximum number of records to print.')
+    args = parser.parse_args()
+
+    with KeywordIndex(args.index_dir) as index:
+        if args.action == 'build':
+            if args.evtx:
+                from hayabusa_test import Hayabusa
+                count = index.build_from_evtx(Hayabusa(args.hayabusa), args.evtx)
+            else:
+                count = index.build(args.timeline, args.format)
+            print(f"Indexed {count} records in {args.index_dir}")
+            return
+
+        if bool(args.keyword) == bool(args.regex):
+            parser.error("give either --keyword or --regex")
+        if args.keyword:
+            records = index.search(args.keyword, args.and_logic, args.limit, args.ignore_case)
+        else:
+            records = index.search_regex(args.regex, args.ignore_case, args.limit)
+        for record in records:
+            print(json.dumps(record, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import argparse
+import csv
+import datetime
+import json
+import os
+import re
+import sqlite3
+import sys
+
+BATCH_SIZE = 10000
+JSON_READ_SIZE = 1024 * 1024
+JSON_SEPARATORS = re.compile(r"[\s,\[\]]*")
+
+TIMESTAMP_FORMATS = ("%Y-%m-%d %H:%M:%S.%f %z", "%Y-%m-%d %H:%M:%S %z", "%Y-%m-%d %H:%M:%S.%f%z", "%Y-%m-%d %H:%M:%S%z")
+# Query bounds without an offset are taken as UTC
+NAIVE_TIMESTAMP_FORMATS = ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+# Indexed columns detections can be grouped by; fields without a column are kept as JSON
+GROUP_COLUMNS = ("computer", "event_id", "level", "rule_title")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    ts_utc TEXT,
+    timestamp TEXT,
+    computer TEXT,
+    event_id INTEGER,
+    level TEXT,
+    rule_title TEXT,
+    channel TEXT,
+    record_id INTEGER,
+    fields TEXT,
+    source TEXT
+)
+"""
+
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS detections_ts ON detections (ts_utc)",
+    "CREATE INDEX IF NOT EXISTS detections_computer ON detections (computer, ts_utc)",
+    "CREATE INDEX IF NOT EXISTS detections_event_id ON detections (event_id, ts_utc)",
+    "CREATE INDEX IF NOT EXISTS detections_level ON detections (level, ts_utc)",
+    "CREATE INDEX IF NOT EXISTS detections_rule ON detections (rule_title, ts_utc)",
+)
+
+
+def normalize_timestamp(value):
+    """
+    Convert a Hayabusa timestamp such as "2021-12-12 16:16:04.237 +09:00" to a
+    sortable UTC string; values that cannot be parsed are returned unchanged.
+    """
+    if not value:
+        return value
+    text = value.strip().replace("T", " ").replace("Z", " +00:00")
+    if len(text) > 6 and text[-6] in "+-" and text[-3] == ":":
+        text = text[:-3] + text[-2:]
+    for fmt in TIMESTAMP_FORMATS + NAIVE_TIMESTAMP_FORMATS:
+        try:
+            parsed = datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(datetime.timezone.utc)
+        return parsed.strftime("%Y-%m-%dT%H:%M:%S.%f")
+    return value
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_csv_records(path):
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+    with open(path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+def iter_json_records(path):
+    """
+    Yield detections from json-timeline output, which may be JSONL, a JSON
+    array or back-to-back pretty-printed objects, without loading the file.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        while True:
+            position = JSON_SEPARATORS.match(buffer, position).end()
+            if position == len(buffer):
+                if eof:
+                    return
+                buffer = f.read(JSON_READ_SIZE)
+                position = 0
+                eof = not buffer
+                continue
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    raise
+                # The next record straddles the chunk boundary; keep its start and read on
+                chunk = f.read(JSON_READ_SIZE)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+class TimelineStore:
+    """
+    SQLite (WAL) store of Hayabusa csv-timeline/json-timeline detections with
+    indexes on Timestamp, Computer, EventID, Level and RuleTitle.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.db = sqlite3.connect(db_path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(SCHEMA)
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def _row(self, record, source):
+        lookup = {key.lower(): key for key in record}
+
+        def take(name):
+            key = lookup.get(name.lower())
+            return record.pop(key) if key is not None else None
+
+        timestamp = take("Timestamp")
+        row = (
+            normalize_timestamp(timestamp),
+            timestamp,
+            take("Computer"),
+            _to_int(take("EventID")),
+            take("Level"),
+            take("RuleTitle"),
+            take("Channel"),
+            _to_int(take("RecordID")),
+            json.dumps(record, ensure_ascii=False) if record else None,
+            source,
+        )
+        return row
+
+    def ingest(self, path, fmt=None):
+        """
+        Stream a timeline file into the store and return the number of rows.
+        The format is taken from the extension unless fmt is "csv" or "json".
+        """
+        if fmt is None:
+            fmt = "json" if os.path.splitext(path)[1].lower() in (".json", ".jsonl") else "csv"
+        records = iter_json_records(path) if fmt == "json" else iter_csv_records(path)
+        source = os.path.basename(path)
+
+        count = 0
+        batch = []
+        # Bulk load quickly; the data can always be re-ingested from the timeline file
+        self.db.execute("PRAGMA synchronous=OFF")
+        try:
+            with self.db:
+                for record in records:
+                    batch.append(self._row(dict(record), source))
+                    if len(batch) >= BATCH_SIZE:
+                        self._insert(batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    self._insert(batch)
+                    count += len(batch)
+            # Building the indexes after the bulk insert is much faster than maintaining them row by row
+            with self.db:
+                for statement in INDEXES:
+                    self.db.execute(statement)
+        finally:
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("ANALYZE")
+        return count
+
+    def _insert(self, rows):
+        self.db.executemany(
+            "INSERT INTO detections (ts_utc, timestamp, computer, event_id, level, rule_title, channel, record_id, fields, source) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def _where(self, start=None, end=None, computers=None, event_ids=None, levels=None, rule=None):
+        clauses = []
+        params = []
+        if start:
+            clauses.append("ts_utc >= ?")
+            params.append(normalize_timestamp(start))
+        if end:
+            clauses.append("ts_utc <= ?")
+            params.append(normalize_timestamp(end))
+        for column, values in (("computer", computers), ("event_id", event_ids), ("level", levels)):
+            if values:
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        if rule:
+            clauses.append("rule_title LIKE ?")
+            params.append(f"%{rule}%")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, start=None, end=None, computers=None, event_ids=None, levels=None, rule=None, limit=None):
+        """
+        Yield matching detections as dicts, ordered by time.  start and end
+        accept Hayabusa timestamps or UTC "YYYY-MM-DD HH:MM:SS" strings.
+        """
+        where, params = self._where(start, end, computers, event_ids, levels, rule)
+        sql = "SELECT timestamp, computer, event_id, level, rule_title, channel, record_id, fields FROM detections" + where
+        sql += " ORDER BY ts_utc"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        for row in self.db.execute(sql, params):
+            record = {
+                "Timestamp": row["timestamp"],
+                "RuleTitle": row["rule_title"],
+                "Level": row["level"],
+                "Computer": row["computer"],
+                "Channel": row["channel"],
+                "EventID": row["event_id"],
+                "RecordID": row["record_id"],
+            }
+            if row["fields"]:
+                record.update(json.loads(row["fields"]))
+            yield record
+
+    def count_by(self, column, start=None, end=None, computers=None, event_ids=None, levels=None, rule=None):
+        """
+        Return [(value, hits)] grouped by one of the indexed columns, most hits first.
+        """
+        if column not in GROUP_COLUMNS:
+            raise ValueError(f"Cannot group by {column!r}")
+        where, params = self._where(start, end, computers, event_ids, levels, rule)
+        sql = f"SELECT {column}, COUNT(*) FROM detections{where} GROUP BY {column} ORDER BY COUNT(*) DESC"
+        return [tuple(row) for row in self.db.execute(sql, params)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load Hayabusa timelines into an indexed store and query them.')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help='Load csv-timeline or json-timeline output files.')
+    ingest_parser.add_argument('db', help='Path to the timeline database.')
+    ingest_parser.add_argument('files', nargs='+', help='Timeline files to load.')
+    ingest_parser.add_argument('--format', choices=['csv', 'json'], help='Input format (default: from the file extension).')
+
+    for action, help_text in (('query', 'List matching detections.'),
+                              ('rules', 'Count hits per rule.'),
+                              ('hosts', 'Count hits per computer.')):
+        query_parser = subparsers.add_parser(action, help=help_text)
+        query_parser.add_argument('db', help='Path to the timeline database.')
+        query_parser.add_argument('--start', help='Earliest timestamp (inclusive).')
+        query_parser.add_argument('--end', help='Latest timestamp (inclusive).')
+        query_parser.add_argument('--computer', action='append', help='Computer name (repeatable).')
+        query_parser.add_argument('--event-id', type=int, action='append', help='Event ID (repeatable).')
+        query_parser.add_argument('--level', action='append', help='Level, e.g. high or crit (repeatable).')
+        query_parser.add_argument('--rule', help='Substring of the rule title.')
+        if action == 'query':
+            query_parser.add_argument('--limit', type=int, help='Maximum number of detections to print.')
+            query_parser.add_argument('--output-format', choices=['jsonl', 'csv'], default='jsonl', help='Output format.')
+
+    args = parser.parse_args()
+
+    with TimelineStore(args.db) as store:
+        if args.action == 'ingest':
+            for file_path in args.files:
+                count = store.ingest(file_path, args.format)
+                print(f"Loaded {count} detections from {file_path}")
+            return
+
+        filters = dict(start=args.start, end=args.end, computers=args.computer, event_ids=args.event_id,
+                       levels=args.level, rule=args.rule)
+        if args.action == 'query':
+            writer = None
+            for record in store.query(limit=args.limit, **filters):
+                if args.output_format == 'csv':
+                    if writer is None:
+                        writer = csv.DictWriter(sys.stdout, fieldnames=list(record), extrasaction='ignore')
+                        writer.writeheader()
+                    writer.writerow({key: json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+                                     for key, value in record.items()})
+                else:
+                    print(json.dumps(record, ensure_ascii=False))
+        else:
+            column = "rule_title" if args.action == 'rules' else "computer"
+            for value, hits in store.count_by(column, **filters):
+                print(f"{hits:>10}  {value}")
+
+if __name__ == "__main__":
+    main()
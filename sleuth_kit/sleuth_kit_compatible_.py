@@ -6,6 +6,16 @@ import sys
 import signal
 import platform
 
+from tsk_bodyfile import BodyfileStream
+from tsk_partitions import PartitionAnalyzer
+from tsk_recovery import DedupRecovery
+from tsk_timeline import build_timeline
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.hashing import hash_manifest
+from common.tool_runner import kill_running_tools, run_tool
+
 class SleuthKit:
     def __init__(self, sleuthkit_path):
         self.sleuthkit_path = sleuthkit_path
@@ -19,17 +29,42 @@ class SleuthKit:
             except subprocess.CalledProcessError as e:
                 print(f"Error making {self.sleuthkit_path} executable: {e}")
 
-    def run_command(self, command, options=None):
+    def run_command(self, command, options=None, timeout=None):
         if options is None:
             options = []
-        cmd = [self.sleuthkit_path] + command.split() + options
+        tool, *args = command.split()
+        cmd = [self.tool_path(tool)] + args + options
         try:
-            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace', shell=True)
+            # Limited per tool, so e.g. many icat runs cannot starve an fls listing
+            result = run_tool(cmd, tool=tool, timeout=timeout)
             return result.stdout, result.stderr
         except Exception as e:
             print(f"An error occurred while running the command: {e}")
             return None, str(e)
 
+    def tool_path(self, tool):
+        # sleuthkit_path may be the directory holding the TSK binaries
+        if os.path.isdir(self.sleuthkit_path):
+            return os.path.join(self.sleuthkit_path, tool)
+        return tool
+
+    def iter_fls(self, image_name, offset, options=None):
+        """
+        Recursively list the file system as bodyfile records (fls -r -p -m /),
+        yielding a BodyfileEntry per file as fls prints it.  Iterate the
+        returned BodyfileStream; its errors and returncode are set afterwards.
+        """
+        if options is None:
+            options = []
+        cmd = [self.tool_path("fls"), "-r", "-p", "-m", "/", "-o", str(offset)] + options + [image_name]
+        return BodyfileStream(cmd)
+
+    def icat_command(self, image_name, offset, inode, options=None):
+        # Argument list for streaming one file's content from icat's stdout
+        if options is None:
+            options = []
+        return [self.tool_path("icat"), "-o", str(offset)] + options + [image_name, str(inode)]
+
     def fls(self, image_name, offset, options=None):
         if options is None:
             options = []
@@ -39,7 +74,8 @@ class SleuthKit:
     def mmls(self, image_name, options=None):
         if options is None:
             options = []
-        return self.run_command(f"mmls {image_name}", options)
+        options += [image_name]
+        return self.run_command("mmls", options)
 
     def fsstat(self, image_name, offset, options=None):
         if options is None:
@@ -54,7 +90,10 @@ class SleuthKit:
         return self.run_command("tsk_recover", options)
 
     def img_stat(self, image_name, options=None):
-        return self.run_command(f"img_stat {image_name}", options)
+        if options is None:
+            options = []
+        options += [image_name]
+        return self.run_command("img_stat", options)
 
 def print_banner():
     print("\n\n\033[1;33;40m ####################################################\033[0m")
@@ -73,6 +112,8 @@ def print_completion_message(output_file_path):
 
 def handle_interrupt(signum, frame):
     print("\nProcess interrupted.")
+    # Tools run on the runner's background loop; stop them rather than leave them behind
+    kill_running_tools()
     sys.exit(1)
 
 def save_output_to_file(output, file_path, directory):
@@ -95,6 +136,43 @@ def save_output_to_file(output, file_path, directory):
     print_completion_message(output_file_path)
     time.sleep(2)
 
+def save_entries_to_file(entries, file_path, directory):
+    # Write bodyfile records as fls produces them instead of holding the listing in memory
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    output_file_name = f"{os.path.splitext(os.path.basename(file_path))[0]}_bodyfile.txt"
+    output_file_path = os.path.join(directory, output_file_name)
+
+    count = 0
+    with open(output_file_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(entry.to_line() + "\n")
+            count += 1
+
+    print(f"\nListed {count} files and directories.")
+    print_completion_message(output_file_path)
+    return entries.errors
+
+def print_partition_summary(summary):
+    print(f"\nSector size: {summary['sector_size']} bytes")
+    for partition in summary["partitions"]:
+        filesystem = partition["filesystem"] or "no file system"
+        print(f"  {partition['slot']:<8} start {partition['start']:<12} {partition['description']:<28} "
+              f"{filesystem:<8} {partition['entries']} entries ({partition['deleted']} deleted) "
+              f"in {partition['elapsed']:.1f}s")
+        if partition["recovered_manifest"]:
+            print(f"    recovered file hashes: {partition['recovered_manifest']}")
+        for error in partition["errors"]:
+            print(f"    {error}")
+
+def write_hash_manifest(path, output_directory):
+    # Chain of custody for recovered files: every digest from one read of each file
+    os.makedirs(output_directory, exist_ok=True)
+    manifest_path = os.path.join(output_directory, "hash_manifest.csv")
+    files, errors = hash_manifest([path], manifest_path)
+    print(f"Hashed {files} recovered files ({errors} unreadable); manifest stored in: {manifest_path}")
+
 def main():
     signal.signal(signal.SIGINT, handle_interrupt)
 
@@ -111,6 +189,9 @@ def main():
     print("3. Display File System Details (fsstat)")
     print("4. Recover Deleted Files (tsk_recover)")
     print("5. Display Image Details (img_stat)")
+    print("6. Analyze All Partitions (mmls + fsstat/fls/tsk_recover)")
+    print("7. Recover Deleted Files in Parallel, Deduplicated (fls + icat)")
+    print("8. Build a MAC(B) Timeline (fls + sort)")
 
     choice = input("Enter the number of the operation: ")
 
@@ -118,16 +199,24 @@ def main():
     image_name = None
 
     # Ask user for the file path if the operation requires it
-    if choice in ['1', '2', '3', '4', '5']:
+    if choice in ['1', '2', '3', '4', '5', '6', '7', '8']:
         image_name = input("Enter the path to the disk image file: ")
         if not os.path.exists(image_name):
             print("Invalid file path. Please ensure the file or directory exists and try again.")
             sys.exit(1)
 
+    # Output directory for this run, named with a timestamp
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    output_directory = os.path.join(script_directory, f"sleuthkit_output_{timestamp}")
+
     # Perform the chosen operation
+    entries = None
+    summary = None
     if choice == '1':
         offset = input("Enter the offset value: ")
-        output, errors = sleuthkit.fls(image_name, offset)
+        output, errors = None, None
+        entries = sleuthkit.iter_fls(image_name, offset)
     elif choice == '2':
         output, errors = sleuthkit.mmls(image_name)
     elif choice == '3':
@@ -139,6 +228,21 @@ def main():
         output, errors = sleuthkit.tsk_recover(image_name, offset, destination_dir)
     elif choice == '5':
         output, errors = sleuthkit.img_stat(image_name)
+    elif choice == '6':
+        recover = input("Also recover deleted files with tsk_recover? (y/n): ").strip().lower() == 'y'
+        summary = PartitionAnalyzer(sleuthkit, image_name, output_directory, recover=recover).run()
+        output, errors = None, summary["mmls_errors"]
+    elif choice == '7':
+        offset = input("Enter the offset value: ")
+        recovery = DedupRecovery(sleuthkit, image_name, output_directory, offset).run()
+        output, errors = None, recovery.get("fls_errors")
+    elif choice == '8':
+        offset = input("Enter the offset value: ")
+        os.makedirs(output_directory, exist_ok=True)
+        timeline_path = os.path.join(output_directory, f"{os.path.splitext(os.path.basename(image_name))[0]}_timeline.csv")
+        entries = sleuthkit.iter_fls(image_name, offset)
+        event_count = build_timeline(entries, timeline_path)
+        output, errors = None, entries.errors
     else:
         print("Invalid choice.")
         sys.exit(1)
@@ -146,14 +250,24 @@ def main():
     # Introduce a small delay to ensure the output is fully captured
     time.sleep(1)
 
-    # Save the output to a text file in an output directory with a timestamp
-    script_directory = os.path.dirname(os.path.abspath(__file__))
-    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    output_directory = os.path.join(script_directory, f"sleuthkit_output_{timestamp}")
-
-    if choice in ['1', '2', '3', '4', '5']:
+    # Save the output to a text file in the output directory
+    if summary is not None:
+        print_partition_summary(summary)
+        print_completion_message(os.path.join(output_directory, "summary.json"))
+    elif choice == '7':
+        print(f"\nExtracted {recovery['extracted']} deleted files: {recovery['stored']} stored, "
+              f"{recovery['duplicates']} duplicates, {recovery['errors']} failed")
+        print_completion_message(recovery["manifest"])
+    elif choice == '8':
+        print(f"\nWrote {event_count} timeline events.")
+        print_completion_message(timeline_path)
+    elif entries is not None:
+        errors = save_entries_to_file(entries, image_name, output_directory)
+    elif choice in ['1', '2', '3', '4', '5']:
         if image_name:
             save_output_to_file(output, image_name, output_directory)
+        if choice == '4':
+            write_hash_manifest(destination_dir, output_directory)
 
     if errors:
         print(f"\nErrors:\n{errors}")
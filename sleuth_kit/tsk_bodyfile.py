@@ -0,0 +1,135 @@
+import collections
+import subprocess
+import tempfile
+
+# MD5|name|inode|mode_as_string|UID|GID|size|atime|mtime|ctime|crtime
+BODYFILE_FIELDS = 11
+DELETED_SUFFIXES = (" (deleted)", " (deleted-realloc)")
+STDERR_TAIL_BYTES = 64 * 1024
+
+
+class BodyfileEntry:
+    """
+    One line of `fls -m` bodyfile output.  Times are Unix epoch seconds
+    (0 when the file system does not record them).
+    """
+
+    __slots__ = ("inode", "mode", "path", "uid", "gid", "size", "atime", "mtime", "ctime", "crtime", "deleted")
+
+    def __init__(self, inode, mode, path, uid, gid, size, atime, mtime, ctime, crtime, deleted=False):
+        self.inode = inode
+        self.mode = mode
+        self.path = path
+        self.uid = uid
+        self.gid = gid
+        self.size = size
+        self.atime = atime
+        self.mtime = mtime
+        self.ctime = ctime
+        self.crtime = crtime
+        self.deleted = deleted
+
+    def __repr__(self):
+        return f"<BodyfileEntry {self.inode} {self.path!r}>"
+
+    @property
+    def type(self):
+        # mode_as_string is "<name type>/<meta type><permissions>", e.g. "r/rrwxrwxrwx"
+        if len(self.mode) > 2 and self.mode[1] == "/":
+            return self.mode[2] if self.mode[2] != "-" else self.mode[0]
+        return self.mode[:1]
+
+    @property
+    def is_dir(self):
+        return self.type == "d"
+
+    @property
+    def meta_address(self):
+        # NTFS inodes are "<mft entry>-<attribute type>-<attribute id>"
+        try:
+            return int(self.inode.split("-", 1)[0])
+        except ValueError:
+            return None
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_line(self):
+        path = self.path + (DELETED_SUFFIXES[0] if self.deleted else "")
+        return "|".join(["0", path, self.inode, self.mode, str(self.uid), str(self.gid), str(self.size),
+                         str(self.atime), str(self.mtime), str(self.ctime), str(self.crtime)])
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def parse_bodyfile_line(line):
+    """
+    Parse one bodyfile line into a BodyfileEntry, or None for lines that are
+    not bodyfile records.  File names may themselves contain "|", so the
+    fixed fields are taken from both ends of the line.
+    """
+    fields = line.rstrip("\r\n").split("|")
+    if len(fields) < BODYFILE_FIELDS:
+        return None
+    name = "|".join(fields[1:len(fields) - 9])
+    inode, mode, uid, gid, size, atime, mtime, ctime, crtime = fields[-9:]
+    deleted = False
+    for suffix in DELETED_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            deleted = True
+            break
+    return BodyfileEntry(inode, mode, name, _to_int(uid), _to_int(gid), _to_int(size),
+                         _to_int(atime), _to_int(mtime), _to_int(ctime), _to_int(crtime), deleted)
+
+
+def iter_bodyfile(lines):
+    for line in lines:
+        entry = parse_bodyfile_line(line)
+        if entry is not None:
+            yield entry
+
+
+class BodyfileStream:
+    """
+    Run an fls command and yield a BodyfileEntry per output line as it is
+    produced, so listing a volume of millions of files takes constant memory.
+
+    stderr goes to a temporary file (it can't fill a pipe and stall fls) and
+    its tail is available as errors once iteration finishes.
+    """
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.returncode = None
+        self.errors = ""
+        self.counts = collections.Counter()
+
+    def __iter__(self):
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=stderr,
+                                       text=True, encoding='utf-8', errors='replace')
+            finished = False
+            try:
+                for line in process.stdout:
+                    entry = parse_bodyfile_line(line)
+                    if entry is None:
+                        self.counts["skipped"] += 1
+                        continue
+                    self.counts["entries"] += 1
+                    yield entry
+                finished = True
+            finally:
+                # The consumer may stop early; don't leave fls running
+                if not finished and process.poll() is None:
+                    process.kill()
+                process.stdout.close()
+                self.returncode = process.wait()
+                size = stderr.seek(0, 2)
+                stderr.seek(max(0, size - STDERR_TAIL_BYTES))
+                self.errors = stderr.read().decode('utf-8', errors='replace')
@@ -0,0 +1,302 @@
+import argparse
+import json
+import mmap
+import struct
+import uuid
+
+from tsk_partitions import DEFAULT_SECTOR_SIZE, Partition
+
+MBR_SIGNATURE = b"\x55\xaa"
+MBR_ENTRY = struct.Struct("<B3sB3sII")  # status, CHS first, type, CHS last, first LBA, sectors
+MBR_TABLE_OFFSET = 446
+GPT_SIGNATURE = b"EFI PART"
+GPT_HEADER = struct.Struct("<8sIIIIQQQQ16sQII")
+EXTENDED_TYPES = (0x05, 0x0F, 0x85)
+# GPT headers are looked for at LBA 1 for these sector sizes
+SECTOR_SIZES = (512, 4096)
+# Formats the reader does not decode; leave them to the TSK tools
+CONTAINER_SIGNATURES = {
+    b"EVF\x09\x0d\x0a\xff\x00": "ewf",
+    b"LVF\x09\x0d\x0a\xff\x00": "ewf",
+    b"KDMV": "vmdk",
+    b"conectix": "vhd",
+    b"vhdxfile": "vhdx",
+    b"QFI\xfb": "qcow",
+    b"AFF10\r\n\x00": "aff",
+}
+
+MBR_TYPES = {
+    0x01: "DOS FAT12", 0x04: "DOS FAT16 (<32MB)", 0x05: "DOS Extended", 0x06: "DOS FAT16",
+    0x07: "NTFS / exFAT", 0x0B: "Win95 FAT32", 0x0C: "Win95 FAT32", 0x0E: "DOS FAT16", 0x0F: "Win95 Extended",
+    0x27: "Windows Recovery", 0x82: "Linux Swap / Solaris x86", 0x83: "Linux", 0x85: "Linux Extended",
+    0x8E: "Linux Logical Volume Manager", 0xA5: "FreeBSD", 0xAF: "Mac OS X HFS", 0xEE: "GPT Safety Partition",
+    0xEF: "EFI File System",
+}
+
+GPT_TYPES = {
+    "c12a7328-f81f-11d2-ba4b-00a0c93ec93b": "EFI System Partition",
+    "e3c9e316-0b5c-4db8-817d-f92df00215ae": "Microsoft Reserved Partition",
+    "ebd0a0a2-b9e5-4433-87c0-68b6b72699c7": "Basic data partition",
+    "de94bba4-06d1-4d40-a16a-bfd50179d6ac": "Windows Recovery Environment",
+    "5808c8aa-7e8f-42e0-85d2-e1e90434cfb3": "LDM metadata partition",
+    "af9b60a0-1431-4f62-bc68-3311714a69ad": "LDM data partition",
+    "0fc63daf-8483-4772-8e79-3d69d8477de4": "Linux filesystem data",
+    "0657fd6d-a4ab-43c4-84e5-0933c84b4f4f": "Linux swap",
+    "e6d6d379-f507-44c2-a23c-238f2a3df928": "Linux LVM",
+    "48465300-0000-11aa-aa11-00306543ecac": "Apple HFS+",
+    "7c3457ef-0000-11aa-aa11-00306543ecac": "Apple APFS",
+    "21686148-6449-6e6f-744e-656564454649": "BIOS boot partition",
+}
+
+EXT_MAGIC = 0xEF53
+EXT_SUPERBLOCK_OFFSET = 1024
+EXT_COMPAT_JOURNAL = 0x4
+EXT_INCOMPAT_EXTENTS = 0x40
+EXT_INCOMPAT_64BIT = 0x80
+EXT_INCOMPAT_FLEX_BG = 0x200
+
+
+def open_image(image_name):
+    """
+    Read-only memory map of a raw image, or None if it is empty or can't
+    be mapped.  Slicing the map and struct.unpack_from read straight from
+    the page cache.
+    """
+    try:
+        with open(image_name, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+
+def container_format(data):
+    for signature, name in CONTAINER_SIGNATURES.items():
+        if data[:len(signature)] == signature:
+            return name
+    return None
+
+
+def _ascii(raw):
+    return raw.split(b"\x00", 1)[0].decode('ascii', errors='replace').strip() or None
+
+
+def detect_filesystem(data, offset):
+    """
+    Identify the file system starting at byte offset from its boot sector
+    or superblock.  Returns a dict with "type" (named as fsstat names it)
+    and the basic geometry, or None if it is not NTFS, FAT, exFAT or ext.
+    """
+    boot = data[offset:offset + 512]
+    if len(boot) < 512:
+        return None
+
+    if boot[3:11] == b"NTFS    ":
+        bytes_per_sector, sectors_per_cluster = struct.unpack_from("<HB", boot, 11)
+        total_sectors, mft_cluster = struct.unpack_from("<QQ", boot, 40)
+        serial, = struct.unpack_from("<Q", boot, 72)
+        return {"type": "NTFS", "sector_size": bytes_per_sector, "cluster_size": bytes_per_sector * sectors_per_cluster,
+                "size": total_sectors * bytes_per_sector, "mft_cluster": mft_cluster, "serial": f"{serial:016X}"}
+
+    if boot[3:11] == b"EXFAT   ":
+        volume_sectors, = struct.unpack_from("<Q", boot, 72)
+        serial, = struct.unpack_from("<I", boot, 100)
+        sector_shift, cluster_shift = struct.unpack_from("<BB", boot, 108)
+        return {"type": "exFAT", "sector_size": 1 << sector_shift, "cluster_size": 1 << (sector_shift + cluster_shift),
+                "size": volume_sectors << sector_shift, "serial": f"{serial:08X}"}
+
+    if boot[510:512] == MBR_SIGNATURE and boot[0] in (0xEB, 0xE9):
+        bytes_per_sector, sectors_per_cluster, reserved, fats, root_entries, total16 = struct.unpack_from("<HBHBHH", boot, 11)
+        fat_size16, = struct.unpack_from("<H", boot, 22)
+        total32, fat_size32 = struct.unpack_from("<II", boot, 32)
+        if bytes_per_sector in (512, 1024, 2048, 4096) and sectors_per_cluster and fats:
+            fat_size = fat_size16 or fat_size32
+            total = total16 or total32
+            root_sectors = (root_entries * 32 + bytes_per_sector - 1) // bytes_per_sector
+            clusters = (total - reserved - fats * fat_size - root_sectors) // sectors_per_cluster
+            # Only FAT32 leaves the 16-bit FAT size empty; FAT12/16 are told apart by cluster count
+            if not fat_size16:
+                fat_type = "FAT32"
+            else:
+                fat_type = "FAT12" if clusters < 4085 else "FAT16"
+            serial_at, label_at = (67, 71) if fat_type == "FAT32" else (39, 43)
+            serial, = struct.unpack_from("<I", boot, serial_at)
+            return {"type": fat_type, "sector_size": bytes_per_sector,
+                    "cluster_size": bytes_per_sector * sectors_per_cluster, "size": total * bytes_per_sector,
+                    "clusters": clusters, "serial": f"{serial:08X}", "label": _ascii(boot[label_at:label_at + 11])}
+
+    superblock = data[offset + EXT_SUPERBLOCK_OFFSET:offset + EXT_SUPERBLOCK_OFFSET + 1024]
+    if len(superblock) == 1024 and struct.unpack_from("<H", superblock, 56)[0] == EXT_MAGIC:
+        inodes, blocks_lo = struct.unpack_from("<II", superblock, 0)
+        log_block_size, = struct.unpack_from("<I", superblock, 24)
+        compat, incompat = struct.unpack_from("<II", superblock, 92)
+        blocks_hi = struct.unpack_from("<I", superblock, 0x150)[0] if incompat & EXT_INCOMPAT_64BIT else 0
+        block_size = 1024 << log_block_size
+        if incompat & (EXT_INCOMPAT_EXTENTS | EXT_INCOMPAT_64BIT | EXT_INCOMPAT_FLEX_BG):
+            fs_type = "Ext4"
+        elif compat & EXT_COMPAT_JOURNAL:
+            fs_type = "Ext3"
+        else:
+            fs_type = "Ext2"
+        return {"type": fs_type, "block_size": block_size, "size": ((blocks_hi << 32) | blocks_lo) * block_size,
+                "inodes": inodes, "uuid": str(uuid.UUID(bytes=bytes(superblock[104:120]))),
+                "label": _ascii(superblock[120:136]), "last_mounted": _ascii(superblock[136:200])}
+    return None
+
+
+def parse_mbr(data, sector_size=DEFAULT_SECTOR_SIZE):
+    """
+    Partitions of a DOS partition table, following the chain of extended
+    boot records for logical partitions.  Slots are numbered like mmls's
+    "<table>:<entry>".  Returns None if sector 0 is not an MBR.
+    """
+    if len(data) < 512 or data[510:512] != MBR_SIGNATURE:
+        return None
+    partitions = []
+    extended = []
+    for index in range(4):
+        status, _, part_type, _, start, length = MBR_ENTRY.unpack_from(data, MBR_TABLE_OFFSET + index * 16)
+        if part_type == 0 or length == 0 or status not in (0x00, 0x80):
+            continue
+        if part_type in EXTENDED_TYPES:
+            extended.append(start)
+            continue
+        partitions.append(_mbr_partition(f"000:{index:03d}", part_type, start, length))
+
+    # Logical partitions: each EBR holds one partition (relative to the EBR) and a link (relative to the extended partition)
+    table = 1
+    seen = set()
+    for extended_start in extended:
+        ebr = extended_start
+        while ebr not in seen and (ebr + 1) * sector_size <= len(data):
+            seen.add(ebr)
+            position = ebr * sector_size
+            if data[position + 510:position + 512] != MBR_SIGNATURE:
+                break
+            _, _, part_type, _, start, length = MBR_ENTRY.unpack_from(data, position + MBR_TABLE_OFFSET)
+            if part_type and length:
+                partitions.append(_mbr_partition(f"{table:03d}:000", part_type, ebr + start, length))
+            _, _, link_type, _, link_start, _ = MBR_ENTRY.unpack_from(data, position + MBR_TABLE_OFFSET + 16)
+            table += 1
+            if link_type not in EXTENDED_TYPES or not link_start:
+                break
+            ebr = extended_start + link_start
+    partitions.sort(key=lambda partition: partition.start)
+    return partitions
+
+
+def _mbr_partition(slot, part_type, start, length):
+    description = f"{MBR_TYPES.get(part_type, 'Unknown Type')} (0x{part_type:02x})"
+    return Partition(slot, start, start + length - 1, length, description)
+
+
+def parse_gpt(data):
+    """
+    Return (sector size, partitions) of a GPT, or None if there is none.
+    """
+    for sector_size in SECTOR_SIZES:
+        if len(data) < sector_size * 2:
+            continue
+        header = GPT_HEADER.unpack_from(data, sector_size)
+        if header[0] != GPT_SIGNATURE:
+            continue
+        entries_lba, entry_count, entry_size = header[10], header[11], header[12]
+        if entry_size < 128:
+            return None
+        partitions = []
+        base = entries_lba * sector_size
+        for index in range(entry_count):
+            entry = data[base + index * entry_size:base + (index + 1) * entry_size]
+            if len(entry) < 128:
+                break
+            type_guid = bytes(entry[:16])
+            if type_guid == bytes(16):
+                continue
+            first, last = struct.unpack_from("<QQ", entry, 32)
+            type_name = str(uuid.UUID(bytes_le=type_guid))
+            name = bytes(entry[56:128]).decode('utf-16-le', errors='replace').split("\x00", 1)[0]
+            description = name or GPT_TYPES.get(type_name, type_name)
+            partitions.append(Partition(f"000:{index:03d}", first, last, last - first + 1, description))
+        partitions.sort(key=lambda partition: partition.start)
+        return sector_size, partitions
+    return None
+
+
+def read_volume(data):
+    """
+    Return (scheme, sector size, partitions) for a mapped raw image:
+    "gpt", "dos", or "none" for a bare file system, whose single partition
+    starts at 0.  None if nothing recognisable is found.
+    """
+    gpt = parse_gpt(data)
+    if gpt is not None:
+        return "gpt", gpt[0], gpt[1]
+    partitions = parse_mbr(data)
+    # A FAT or NTFS boot sector also ends in 55 AA; its "table" is boot code
+    if partitions is not None and detect_filesystem(data, 0) is None:
+        return "dos", DEFAULT_SECTOR_SIZE, partitions
+    if detect_filesystem(data, 0) is not None:
+        return "none", DEFAULT_SECTOR_SIZE, [Partition("-", 0, len(data) // DEFAULT_SECTOR_SIZE - 1,
+                                                         len(data) // DEFAULT_SECTOR_SIZE, "Whole image")]
+    return None
+
+
+def image_info(image_name):
+    """
+    img_stat/mmls/fsstat-style summary of a raw image read in-process, or
+    None when the image is in a container format or has no recognisable
+    layout (use the TSK tools for those).
+    """
+    data = open_image(image_name)
+    if data is None:
+        return None
+    try:
+        if container_format(data):
+            return None
+        volume = read_volume(data)
+        if volume is None:
+            return None
+        scheme, sector_size, partitions = volume
+        info = {"image": image_name, "type": "raw", "size": len(data), "sector_size": sector_size,
+                "volume_system": scheme, "partitions": []}
+        for partition in partitions:
+            row = partition._asdict()
+            row["filesystem"] = detect_filesystem(data, partition.start * sector_size)
+            info["partitions"].append(row)
+        return info
+    finally:
+        data.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quick in-process triage of raw disk images: partition table and file systems.')
+    parser.add_argument('images', nargs='+', help='Raw/dd disk images.')
+    parser.add_argument('--sleuthkit', help='Sleuth Kit binaries directory; img_stat and mmls are run for images the reader cannot decode.')
+    parser.add_argument('--json', action='store_true', help='Print one JSON object per image.')
+    args = parser.parse_args()
+
+    sleuthkit = None
+    for image_name in args.images:
+        info = image_info(image_name)
+        if info is None:
+            if not args.sleuthkit:
+                print(f"{image_name}: not a raw image with a recognisable layout; rerun with --sleuthkit")
+                continue
+            if sleuthkit is None:
+                from sleuth_kit_compatible_ import SleuthKit
+                sleuthkit = SleuthKit(args.sleuthkit)
+            img_stat, _ = sleuthkit.img_stat(image_name)
+            mmls, errors = sleuthkit.mmls(image_name)
+            print(f"{image_name}:\n{img_stat or ''}{mmls or ''}{errors or ''}")
+            continue
+        if args.json:
+            print(json.dumps(info, ensure_ascii=False))
+            continue
+        print(f"{image_name}: {info['size']} bytes, {info['volume_system']} volume system, {info['sector_size']}-byte sectors")
+        for partition in info["partitions"]:
+            filesystem = partition["filesystem"]
+            details = f"{filesystem['type']} {filesystem.get('label') or ''}".strip() if filesystem else "-"
+            print(f"  {partition['slot']:<8} {partition['start']:>12} {partition['end']:>12} {partition['length']:>12}  "
+                  f"{partition['description']:<30} {details}")
+
+if __name__ == "__main__":
+    main()
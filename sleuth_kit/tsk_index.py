@@ -0,0 +1,336 @@
+import argparse
+import calendar
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from tsk_partitions import PartitionAnalyzer
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.metadata_cache import DEFAULT_CACHE_DIR, MetadataCache
+
+BATCH_SIZE = 10000
+DEFAULT_INDEX_DIR = os.path.join(DEFAULT_CACHE_DIR, "tsk-index")
+TIME_COLUMNS = ("atime", "mtime", "ctime", "crtime")
+SIZE_SUFFIXES = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS partitions (
+        offset INTEGER PRIMARY KEY,
+        entries INTEGER,
+        built REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY,
+        partition_offset INTEGER,
+        inode TEXT,
+        type TEXT,
+        path TEXT,
+        extension TEXT,
+        size INTEGER,
+        deleted INTEGER,
+        uid INTEGER,
+        gid INTEGER,
+        atime INTEGER,
+        mtime INTEGER,
+        ctime INTEGER,
+        crtime INTEGER
+    )
+    """,
+)
+
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS files_extension ON files (extension, mtime)",
+    "CREATE INDEX IF NOT EXISTS files_size ON files (size)",
+    "CREATE INDEX IF NOT EXISTS files_path ON files (path)",
+    "CREATE INDEX IF NOT EXISTS files_inode ON files (partition_offset, inode)",
+) + tuple(f"CREATE INDEX IF NOT EXISTS files_{column} ON files ({column})" for column in TIME_COLUMNS)
+
+
+def parse_size(value):
+    """
+    Bytes for "1500", "10K", "1.5G" (1024-based suffixes).
+    """
+    text = str(value).strip().upper().rstrip("B")
+    if text and text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def parse_time(value):
+    """
+    Unix time for a UTC "YYYY-MM-DD[ HH:MM[:SS]]" string or a number.
+    """
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    for fmt in TIME_FORMATS:
+        try:
+            return calendar.timegm(datetime.datetime.strptime(value, fmt).timetuple())
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised time {value!r}")
+
+
+def format_time(value):
+    if not value:
+        return None
+    return datetime.datetime.fromtimestamp(value, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def file_extension(path):
+    extension = os.path.splitext(path)[1]
+    return extension[1:].lower() if extension else None
+
+
+class FilesystemIndex:
+    """
+    SQLite (WAL) index of an image's file listing, built from one recursive
+    fls bodyfile walk per partition and queried by extension, size, path
+    and MAC/B times without reading the image again.
+
+    One database per image, named after the image's SHA-256 (hashed once
+    and then remembered by inode, size and mtime), with rows keyed by
+    partition offset.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.db = sqlite3.connect(db_path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.db.commit()
+
+    @classmethod
+    def for_image(cls, image_name, index_dir=None, cache=None):
+        index_dir = index_dir or os.environ.get("TSK_INDEX_DIR", DEFAULT_INDEX_DIR)
+        os.makedirs(index_dir, exist_ok=True)
+        owned_cache = cache is None
+        cache = cache or MetadataCache()
+        try:
+            digest = cache.file_digest(image_name)
+        finally:
+            if owned_cache:
+                cache.close()
+        return cls(os.path.join(index_dir, f"{digest}.sqlite"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def indexed_partitions(self):
+        return {row["offset"]: row["entries"] for row in self.db.execute("SELECT offset, entries FROM partitions")}
+
+    def build(self, sleuthkit, image_name, offset, options=None, rebuild=False):
+        """
+        Walk one partition with fls and index every entry.  Returns the
+        number of entries, or None if the partition was already indexed.
+        The walk is one transaction: if fls fails, the partition keeps
+        whatever it had before.
+        """
+        if not rebuild and offset in self.indexed_partitions():
+            return None
+
+        count = 0
+        batch = []
+        entries = sleuthkit.iter_fls(image_name, offset, options)
+        # Bulk load quickly; the index can always be rebuilt from the image
+        self.db.execute("PRAGMA synchronous=OFF")
+        try:
+            with self.db:
+                self.db.execute("DELETE FROM files WHERE partition_offset = ?", (offset,))
+                for entry in entries:
+                    batch.append((offset, entry.inode, entry.type, entry.path, file_extension(entry.path), entry.size,
+                                  int(entry.deleted), entry.uid, entry.gid,
+                                  entry.atime, entry.mtime, entry.ctime, entry.crtime))
+                    if len(batch) >= BATCH_SIZE:
+                        self._insert(batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    self._insert(batch)
+                    count += len(batch)
+                if entries.returncode != 0:
+                    # Raised inside the transaction so the partial listing is rolled back
+                    raise RuntimeError(f"fls failed at offset {offset}: {entries.errors.strip()}")
+                self.db.execute("INSERT OR REPLACE INTO partitions (offset, entries, built) VALUES (?, ?, ?)",
+                                (offset, count, time.time()))
+            with self.db:
+                for statement in INDEXES:
+                    self.db.execute(statement)
+        finally:
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("ANALYZE")
+        return count
+
+    def _insert(self, rows):
+        self.db.executemany(
+            "INSERT INTO files (partition_offset, inode, type, path, extension, size, deleted, uid, gid, "
+            "atime, mtime, ctime, crtime) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    @staticmethod
+    def _where(extensions=None, min_size=None, max_size=None, path=None, deleted=None, file_type=None,
+               offset=None, time_column="mtime", after=None, before=None, like=False):
+        """
+        (WHERE clause, parameters) for the filters query() and count() take;
+        the clause is empty when there is nothing to filter on.
+        """
+        if time_column not in TIME_COLUMNS:
+            raise ValueError(f"Unknown time column {time_column!r}")
+        clauses = []
+        params = []
+        if extensions:
+            clauses.append(f"extension IN ({', '.join('?' * len(extensions))})")
+            params.extend(extension.lower().lstrip(".") for extension in extensions)
+        if min_size is not None:
+            clauses.append("size >= ?")
+            params.append(min_size)
+        if max_size is not None:
+            clauses.append("size <= ?")
+            params.append(max_size)
+        if path:
+            if like:
+                clauses.append("path LIKE ?")
+                params.append(path)
+            else:
+                # "_" and "%" are common in file names, so match them literally
+                escaped = path.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                clauses.append("path LIKE ? ESCAPE '\\'")
+                params.append(f"%{escaped}%")
+        if deleted is not None:
+            clauses.append("deleted = ?")
+            params.append(int(deleted))
+        if file_type:
+            clauses.append("type = ?")
+            params.append(file_type)
+        if offset is not None:
+            clauses.append("partition_offset = ?")
+            params.append(offset)
+        if after is not None:
+            clauses.append(f"{time_column} >= ?")
+            params.append(after)
+        if before is not None:
+            clauses.append(f"{time_column} <= ?")
+            params.append(before)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query(self, extensions=None, min_size=None, max_size=None, path=None, deleted=None, file_type=None,
+              offset=None, time_column="mtime", after=None, before=None, order_by="path", limit=None, like=False):
+        """
+        Yield matching files as dicts.  path is a substring, or a LIKE
+        pattern with like=True; deleted=True/False keeps only deleted or
+        allocated entries; after/before bound time_column.
+        """
+        if order_by not in TIME_COLUMNS + ("path", "size"):
+            raise ValueError(f"Cannot order by {order_by!r}")
+        where, params = self._where(extensions, min_size, max_size, path, deleted, file_type, offset, time_column,
+                                    after, before, like)
+        sql = "SELECT * FROM files" + where
+        sql += f" ORDER BY {order_by}" + (" DESC" if order_by == "size" else "")
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        for row in self.db.execute(sql, params):
+            record = {key: row[key] for key in row.keys() if key not in ("id",)}
+            record["deleted"] = bool(record["deleted"])
+            for column in TIME_COLUMNS:
+                record[column] = format_time(record[column])
+            yield record
+
+    def count(self, extensions=None, min_size=None, max_size=None, path=None, deleted=None, file_type=None,
+              offset=None, time_column="mtime", after=None, before=None, like=False):
+        """
+        Number of files query() would yield for the same filters, counted by SQLite.
+        """
+        where, params = self._where(extensions, min_size, max_size, path, deleted, file_type, offset, time_column,
+                                    after, before, like)
+        return self.db.execute("SELECT COUNT(*) FROM files" + where, params).fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index a disk image listing once and query it repeatedly.')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Walk the image with fls and index it.')
+    build_parser.add_argument('image', help='Disk image file.')
+    build_parser.add_argument('--offset', type=int, action='append', help='Partition offset in sectors (repeatable; default: every partition mmls finds).')
+    build_parser.add_argument('--rebuild', action='store_true', help='Re-walk partitions that are already indexed.')
+    build_parser.add_argument('--sleuthkit', default="C:/Path/To/SleuthKit/Binaries", help='Sleuth Kit binaries directory.')
+
+    query_parser = subparsers.add_parser('query', help='Query an indexed image; prints JSONL.')
+    query_parser.add_argument('image', help='Disk image file.')
+    query_parser.add_argument('--ext', action='append', help='File extension, e.g. docx (repeatable).')
+    query_parser.add_argument('--min-size', type=parse_size, help='Minimum size, e.g. 1G.')
+    query_parser.add_argument('--max-size', type=parse_size, help='Maximum size.')
+    query_parser.add_argument('--path', help='Path substring.')
+    query_parser.add_argument('--like', action='store_true', help='Treat --path as a LIKE pattern (%% and _ wildcards).')
+    state = query_parser.add_mutually_exclusive_group()
+    state.add_argument('--deleted', action='store_const', const=True, help='Only deleted entries.')
+    state.add_argument('--allocated', action='store_const', const=False, dest='deleted', help='Only allocated entries.')
+    query_parser.add_argument('--type', help='Entry type: r (file), d (directory), l (link)...')
+    query_parser.add_argument('--offset', type=int, help='Only this partition offset.')
+    query_parser.add_argument('--time', choices=TIME_COLUMNS, default='mtime', help='Timestamp the bounds apply to (default: mtime).')
+    query_parser.add_argument('--after', type=parse_time, help='Earliest time (UTC), e.g. 2024-03-01.')
+    query_parser.add_argument('--before', type=parse_time, help='Latest time (UTC).')
+    query_parser.add_argument('--order-by', default='path', choices=('path', 'size') + TIME_COLUMNS, help='Sort order.')
+    query_parser.add_argument('--limit', type=int, help='Maximum number of files to print.')
+    query_parser.add_argument('--count', action='store_true', help='Only print the number of matches.')
+
+    for sub in (build_parser, query_parser):
+        sub.add_argument('--index-dir', help='Where index databases are kept (default: ~/.cache/metadata-saas/tsk-index).')
+    args = parser.parse_args()
+
+    with FilesystemIndex.for_image(args.image, args.index_dir) as index:
+        if args.action == 'build':
+            from sleuth_kit_compatible_ import SleuthKit
+            sleuthkit = SleuthKit(args.sleuthkit)
+            offsets = args.offset
+            sector_options = []
+            if not offsets:
+                analyzer = PartitionAnalyzer(sleuthkit, args.image, None)
+                sector_size, partitions, _ = analyzer.discover()
+                offsets = [partition.start for partition in partitions]
+                if sector_size != 512:
+                    sector_options = ["-b", str(sector_size)]
+            for offset in offsets:
+                try:
+                    count = index.build(sleuthkit, args.image, offset, list(sector_options), args.rebuild)
+                except RuntimeError as e:
+                    print(e)
+                    continue
+                if count is None:
+                    print(f"Offset {offset}: already indexed")
+                else:
+                    print(f"Offset {offset}: indexed {count} entries")
+            print(f"Index: {index.db_path}")
+            return
+
+        if args.count:
+            print(index.count(args.ext, args.min_size, args.max_size, args.path, args.deleted, args.type, args.offset,
+                              args.time, args.after, args.before, args.like))
+            return
+        records = index.query(args.ext, args.min_size, args.max_size, args.path, args.deleted, args.type, args.offset,
+                              args.time, args.after, args.before, args.order_by, args.limit, args.like)
+        for record in records:
+            print(json.dumps(record, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
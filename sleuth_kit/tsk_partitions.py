@@ -0,0 +1,179 @@
+import collections
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.hashing import hash_manifest
+
+DEFAULT_SECTOR_SIZE = 512
+# Concurrent partitions; every one reads the same image, so the disk rather than the CPU is the limit
+DEFAULT_IO_WORKERS = 4
+
+Partition = collections.namedtuple("Partition", ["slot", "start", "end", "length", "description"])
+
+MMLS_ROW = re.compile(r"^\s*(\d+):\s+(\S+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(.*?)\s*$")
+MMLS_UNITS = re.compile(r"Units are in (\d+)-byte sectors")
+# Partition table entries and containers rather than file systems
+NON_FILESYSTEM_SLOTS = ("Meta", "-------")
+NON_FILESYSTEM_DESCRIPTIONS = ("Unallocated", "Extended", "Primary Table", "Safety Table", "GPT Header", "Partition Table")
+
+
+def parse_mmls(output):
+    """
+    Parse mmls output into (sector size, [Partition]) covering every row of
+    the volume table, including metadata and unallocated space.
+    """
+    sector_size = DEFAULT_SECTOR_SIZE
+    partitions = []
+    for line in (output or "").splitlines():
+        units = MMLS_UNITS.search(line)
+        if units:
+            sector_size = int(units.group(1))
+            continue
+        row = MMLS_ROW.match(line)
+        if row:
+            _, slot, start, end, length, description = row.groups()
+            partitions.append(Partition(slot, int(start), int(end), int(length), description))
+    return sector_size, partitions
+
+
+def filesystem_partitions(partitions):
+    """
+    The allocated partitions that can hold a file system.
+    """
+    return [partition for partition in partitions
+            if partition.slot not in NON_FILESYSTEM_SLOTS
+            and not any(text in partition.description for text in NON_FILESYSTEM_DESCRIPTIONS)]
+
+
+def parse_fsstat(output):
+    """
+    "Key: Value" pairs from fsstat's report, first occurrence of each key,
+    e.g. {"File System Type": "NTFS", "Volume Serial Number": ...}.
+    """
+    fields = {}
+    for line in (output or "").splitlines():
+        key, separator, value = line.partition(":")
+        key = key.strip()
+        if separator and key and not key.startswith("-") and key not in fields:
+            fields[key] = value.strip()
+    return fields
+
+
+class PartitionAnalyzer:
+    """
+    Unattended analysis of every file system partition in an image.
+
+    mmls finds the partitions; fsstat, a streamed fls bodyfile listing and
+    optionally tsk_recover then run for each of them in a thread pool of
+    io_workers (the work is in the TSK processes, so threads are enough),
+    and a structured result is gathered per partition.  Recovered files
+    are hashed into a manifest next to their directory.
+    """
+
+    def __init__(self, sleuthkit, image_name, output_dir, io_workers=DEFAULT_IO_WORKERS, recover=False):
+        self.sleuthkit = sleuthkit
+        self.image_name = image_name
+        self.output_dir = output_dir
+        self.io_workers = max(1, io_workers)
+        self.recover = recover
+
+    def discover(self):
+        """
+        Return (sector size, file system partitions, mmls errors).  An image
+        without a volume system is treated as a single file system at offset 0.
+
+        Raw images with a DOS or GPT table are read in-process; mmls is only
+        run for container formats and layouts the reader does not know.
+        """
+        from tsk_image import image_info
+        info = image_info(self.image_name)
+        if info is not None:
+            partitions = [Partition(row["slot"], row["start"], row["end"], row["length"], row["description"])
+                          for row in info["partitions"]]
+            return info["sector_size"], filesystem_partitions(partitions), ""
+
+        output, errors = self.sleuthkit.mmls(self.image_name)
+        sector_size, partitions = parse_mmls(output)
+        if not partitions:
+            return sector_size, [Partition("-", 0, 0, 0, "Whole image")], errors
+        return sector_size, filesystem_partitions(partitions), errors
+
+    def analyze_partition(self, partition, sector_size):
+        start = time.perf_counter()
+        name = f"partition_{partition.slot.replace(':', '_')}_{partition.start}"
+        options = [] if sector_size == DEFAULT_SECTOR_SIZE else ["-b", str(sector_size)]
+        result = {
+            "slot": partition.slot,
+            "start": partition.start,
+            "length": partition.length,
+            "description": partition.description,
+            "filesystem": None,
+            "fsstat": None,
+            "bodyfile": None,
+            "entries": 0,
+            "deleted": 0,
+            "recovered_to": None,
+            "recovered_manifest": None,
+            "errors": [],
+        }
+
+        output, errors = self.sleuthkit.fsstat(self.image_name, partition.start, list(options))
+        if errors:
+            result["errors"].append(errors.strip())
+        fields = parse_fsstat(output)
+        if not fields.get("File System Type"):
+            # Swap, encrypted or unformatted space; nothing for fls to list
+            result["elapsed"] = time.perf_counter() - start
+            return result
+        result["filesystem"] = fields["File System Type"]
+        result["fsstat"] = fields
+
+        bodyfile_path = os.path.join(self.output_dir, f"{name}_bodyfile.txt")
+        entries = self.sleuthkit.iter_fls(self.image_name, partition.start, list(options))
+        with open(bodyfile_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(entry.to_line() + "\n")
+                result["entries"] += 1
+                result["deleted"] += entry.deleted
+        if entries.errors:
+            result["errors"].append(entries.errors.strip())
+        result["bodyfile"] = bodyfile_path
+
+        if self.recover:
+            destination_dir = os.path.join(self.output_dir, f"{name}_recovered")
+            os.makedirs(destination_dir, exist_ok=True)
+            output, errors = self.sleuthkit.tsk_recover(self.image_name, partition.start, destination_dir, list(options))
+            if errors:
+                result["errors"].append(errors.strip())
+            result["recovered_to"] = destination_dir
+            manifest_path = os.path.join(self.output_dir, f"{name}_recovered_manifest.csv")
+            files, unreadable = hash_manifest([destination_dir], manifest_path)
+            if unreadable:
+                result["errors"].append(f"{unreadable} recovered file(s) could not be hashed")
+            result["recovered_manifest"] = manifest_path
+
+        result["elapsed"] = time.perf_counter() - start
+        return result
+
+    def run(self):
+        """
+        Analyze every file system partition concurrently; returns a summary
+        dict and writes it to summary.json in the output directory.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        sector_size, partitions, errors = self.discover()
+        summary = {"image": self.image_name, "sector_size": sector_size, "mmls_errors": errors or None, "partitions": []}
+        if partitions:
+            with ThreadPoolExecutor(max_workers=min(self.io_workers, len(partitions))) as executor:
+                futures = [executor.submit(self.analyze_partition, partition, sector_size) for partition in partitions]
+                summary["partitions"] = [future.result() for future in futures]
+
+        with open(os.path.join(self.output_dir, "summary.json"), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        return summary
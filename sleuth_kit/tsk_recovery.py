@@ -0,0 +1,279 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from tsk_partitions import DEFAULT_IO_WORKERS
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.hashing import MultiHasher
+from common.tool_runner import kill_running_tools, stream_tool
+
+READ_SIZE = 1024 * 1024
+# Files up to this size are hashed in memory and never written if their content is already stored
+SPOOL_BYTES = 8 * 1024 * 1024
+# Extractions queued per worker, so a listing of millions of entries is not submitted at once
+QUEUE_PER_WORKER = 4
+STDERR_TAIL_BYTES = 4096
+STDERR_TAIL_LINES = 50
+# Fields a name sharing an already extracted metadata address takes from that entry's row
+SHARED_FIELDS = ("md5", "sha1", "sha256", "object", "error", "recovered_size")
+
+
+class ContentStore:
+    """
+    Content-addressed directory of recovered files, objects/<sha[:2]>/<sha>.
+
+    Each file is stored once however many entries (or runs over the same
+    store) share its content; the manifest maps names to objects.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def claim(self, digest):
+        """
+        True if the caller should store this content: it is neither stored
+        already nor being stored by another worker.
+        """
+        with self._lock:
+            if digest in self._pending or os.path.exists(self.object_path(digest)):
+                return False
+            self._pending.add(digest)
+            return True
+
+    def commit(self, digest, source=None, data=None):
+        """
+        Move a spooled temporary file (or write in-memory data) into place.
+        """
+        target = self.object_path(digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            if source is not None:
+                os.replace(source, target)
+            else:
+                fd, temp_path = tempfile.mkstemp(dir=self.objects_dir, prefix=".tmp-")
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, target)
+        finally:
+            with self._lock:
+                self._pending.discard(digest)
+
+    def spool_file(self):
+        fd, temp_path = tempfile.mkstemp(dir=self.objects_dir, prefix=".tmp-")
+        return os.fdopen(fd, 'wb'), temp_path
+
+
+def extract(sleuthkit, image_name, offset, entry, store, options=None, timeout=None):
+    """
+    Stream one entry's content out of icat through the hashes and store it
+    unless identical content is already stored.  Returns a manifest row.
+    icat runs on the shared tool runner, so a hung one is killed after
+    timeout seconds (and on Ctrl+C) instead of stalling the recovery.
+    """
+    row = {"path": entry.path, "inode": entry.inode, "size": entry.size, "deleted": entry.deleted,
+           "mtime": entry.mtime, "md5": None, "sha1": None, "sha256": None, "object": None, "duplicate": False,
+           "error": None}
+    # SHA-256 names the stored object; MD5 and SHA-1 come from the same read for the manifest
+    hasher = MultiHasher()
+    buffered = []
+    length = 0
+    spool, spool_path = None, None
+    cmd = sleuthkit.icat_command(image_name, offset, entry.inode, options)
+    try:
+        stream = stream_tool(cmd, timeout=timeout, stderr_lines=STDERR_TAIL_LINES)
+        for block in stream:
+            hasher.update(block)
+            length += len(block)
+            if spool is None and length > SPOOL_BYTES:
+                # Too big to keep in memory; write as we go and drop it afterwards if it is a duplicate
+                spool, spool_path = store.spool_file()
+                spool.writelines(buffered)
+                buffered = []
+            if spool is not None:
+                spool.write(block)
+            else:
+                buffered.append(block)
+        result = stream.result
+        if result.returncode != 0 or result.timed_out:
+            row["error"] = result.stderr[-STDERR_TAIL_BYTES:].strip() or f"icat exited with {result.returncode}"
+            return row
+        if spool is not None:
+            spool.close()
+            spool = None
+
+        row.update(hasher.hexdigests())
+        row["recovered_size"] = length
+        row["object"] = os.path.relpath(store.object_path(row["sha256"]), store.root)
+        if store.claim(row["sha256"]):
+            store.commit(row["sha256"], source=spool_path, data=None if spool_path else b"".join(buffered))
+            spool_path = None
+        else:
+            row["duplicate"] = True
+        return row
+    except OSError as e:
+        row["error"] = str(e)
+        return row
+    finally:
+        if spool is not None:
+            spool.close()
+        if spool_path is not None and os.path.exists(spool_path):
+            os.remove(spool_path)
+
+
+class DedupRecovery:
+    """
+    Recover the deleted files of one partition in parallel, storing each
+    distinct content once.
+
+    fls -d lists the deleted entries; regular files with content are fed
+    to io_workers threads that each run icat -r and hash the bytes as they
+    arrive (the work is in the icat processes, so threads are enough).
+    Entries sharing a metadata address are extracted once, and content
+    already in the store is not written again.  manifest.jsonl gets one
+    row per entry with its hashes and the object holding its content;
+    the other names of an extracted address get rows pointing at the
+    same object, with same_inode_as naming the entry that was extracted.
+    """
+
+    def __init__(self, sleuthkit, image_name, output_dir, offset=0, io_workers=DEFAULT_IO_WORKERS, options=None,
+                 timeout=None):
+        self.sleuthkit = sleuthkit
+        self.image_name = image_name
+        self.output_dir = output_dir
+        self.offset = offset
+        self.io_workers = max(1, io_workers)
+        self.options = list(options or [])
+        # Seconds before one icat is killed and its entry recorded as failed (None: the runner's default)
+        self.timeout = timeout
+
+    def candidates(self, counts):
+        """
+        Yield (entry, first) for deleted regular files with content; first
+        is False for later names of a metadata address already yielded.
+        """
+        seen = set()
+        entries = self.sleuthkit.iter_fls(self.image_name, self.offset, ["-d"] + self.options)
+        for entry in entries:
+            counts["listed"] += 1
+            if entry.type != "r" or entry.size <= 0:
+                continue
+            # NTFS lists a file once per name and per $DATA stream; the inode string tells them apart
+            if entry.inode in seen:
+                counts["same_inode"] += 1
+                yield entry, False
+                continue
+            seen.add(entry.inode)
+            yield entry, True
+        if entries.errors:
+            counts["fls_errors"] = entries.errors.strip()
+
+    def run(self):
+        """
+        Recover into output_dir; returns a summary dict and writes it to
+        recovery_summary.json next to manifest.jsonl.
+        """
+        start = time.perf_counter()
+        store = ContentStore(self.output_dir)
+        counts = {"listed": 0, "same_inode": 0, "extracted": 0, "stored": 0, "duplicates": 0, "errors": 0,
+                  "bytes_recovered": 0, "bytes_stored": 0}
+        manifest_path = os.path.join(self.output_dir, "manifest.jsonl")
+        options = ["-r"] + self.options
+
+        with open(manifest_path, 'w', encoding='utf-8') as manifest, \
+                ThreadPoolExecutor(max_workers=self.io_workers) as executor:
+            # Shared fields of every extracted address, and names waiting for their address to finish
+            extracted = {}
+            waiting = {}
+
+            def write_alias(entry, shared):
+                row = {"path": entry.path, "inode": entry.inode, "size": entry.size, "deleted": entry.deleted,
+                       "mtime": entry.mtime, "duplicate": True}
+                row.update(shared)
+                manifest.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+            def write(done):
+                for future in done:
+                    row = future.result()
+                    counts["extracted"] += 1
+                    if row["error"]:
+                        counts["errors"] += 1
+                    elif row["duplicate"]:
+                        counts["duplicates"] += 1
+                        counts["bytes_recovered"] += row["recovered_size"]
+                    else:
+                        counts["stored"] += 1
+                        counts["bytes_recovered"] += row["recovered_size"]
+                        counts["bytes_stored"] += row["recovered_size"]
+                    manifest.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    shared = {field: row[field] for field in SHARED_FIELDS if field in row}
+                    shared["same_inode_as"] = row["path"]
+                    extracted[row["inode"]] = shared
+                    for alias in waiting.pop(row["inode"], ()):
+                        write_alias(alias, shared)
+
+            pending = set()
+            try:
+                for entry, first in self.candidates(counts):
+                    if not first:
+                        if entry.inode in extracted:
+                            write_alias(entry, extracted[entry.inode])
+                        else:
+                            waiting.setdefault(entry.inode, []).append(entry)
+                        continue
+                    if len(pending) >= self.io_workers * QUEUE_PER_WORKER:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        write(done)
+                    pending.add(executor.submit(extract, self.sleuthkit, self.image_name, self.offset, entry, store,
+                                                options, self.timeout))
+                write(wait(pending).done)
+            except KeyboardInterrupt:
+                # Stop the running icats before the executor waits for its threads
+                for future in pending:
+                    future.cancel()
+                kill_running_tools()
+                raise
+
+        summary = {"image": self.image_name, "offset": self.offset, "manifest": manifest_path,
+                   "elapsed": time.perf_counter() - start}
+        summary.update(counts)
+        with open(os.path.join(self.output_dir, "recovery_summary.json"), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recover deleted files in parallel with fls and icat, storing identical content once.')
+    parser.add_argument('image', help='Disk image file.')
+    parser.add_argument('output_dir', help='Recovery store; reusing it across runs skips content already recovered.')
+    parser.add_argument('--offset', type=int, default=0, help='Partition offset in sectors (default: 0).')
+    parser.add_argument('--workers', type=int, default=DEFAULT_IO_WORKERS, help=f'Concurrent icat processes (default: {DEFAULT_IO_WORKERS}).')
+    parser.add_argument('--sleuthkit', default="C:/Path/To/SleuthKit/Binaries", help='Sleuth Kit binaries directory.')
+    parser.add_argument('--timeout', type=float, help='Seconds before a hung icat is killed and its file marked as failed.')
+    args = parser.parse_args()
+
+    from sleuth_kit_compatible_ import SleuthKit
+    summary = DedupRecovery(SleuthKit(args.sleuthkit), args.image, args.output_dir, args.offset, args.workers,
+                            timeout=args.timeout).run()
+    if summary.get("fls_errors"):
+        print(f"\nErrors:\n{summary['fls_errors']}")
+    print(f"\nExtracted {summary['extracted']} deleted files: {summary['stored']} stored, "
+          f"{summary['duplicates']} duplicates, {summary['errors']} failed")
+    print(f"Wrote {summary['bytes_stored']} of {summary['bytes_recovered']} recovered bytes")
+    print(f"Manifest: {summary['manifest']}")
+
+if __name__ == "__main__":
+    main()
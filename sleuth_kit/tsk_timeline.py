@@ -0,0 +1,160 @@
+import argparse
+import csv
+import datetime
+import heapq
+import json
+import os
+import tempfile
+
+from tsk_bodyfile import iter_bodyfile
+from tsk_index import parse_time
+
+# Events held in memory before a sorted run is spilled to disk
+DEFAULT_RUN_SIZE = 500000
+# Runs merged at once; more than this are merged in several passes to stay under the open file limit
+MAX_MERGE_FANIN = 128
+TIMELINE_FIELDS = ["Date", "Size", "Type", "Mode", "UID", "GID", "Meta", "File Name"]
+MACB = (("atime", "a"), ("mtime", "m"), ("ctime", "c"), ("crtime", "b"))
+
+
+def expand_entry(entry):
+    """
+    The timeline events of one bodyfile entry: one per distinct timestamp,
+    flagged with the times it stands for in mactime's "macb" order, e.g.
+    "m.cb" when the modified, changed and born times are equal.  Zero
+    (unrecorded) times produce no event.
+    """
+    times = {}
+    for attribute, flag in MACB:
+        value = getattr(entry, attribute)
+        if value:
+            times.setdefault(value, set()).add(flag)
+    path = entry.path + (" (deleted)" if entry.deleted else "")
+    for value, flags in times.items():
+        macb = "".join(flag if flag in flags else "." for flag in "macb")
+        yield (value, path, macb, entry.size, entry.mode, entry.uid, entry.gid, entry.inode)
+
+
+def _write_run(events, temp_dir):
+    fd, path = tempfile.mkstemp(dir=temp_dir, prefix="run-", suffix=".jsonl")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for event in events:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+    return path
+
+
+def _read_run(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            yield tuple(json.loads(line))
+
+
+def _merge_runs(paths, temp_dir):
+    # Merge in passes of at most MAX_MERGE_FANIN runs until one pass can finish the job
+    while len(paths) > MAX_MERGE_FANIN:
+        merged = []
+        for index in range(0, len(paths), MAX_MERGE_FANIN):
+            group = paths[index:index + MAX_MERGE_FANIN]
+            merged.append(_write_run(heapq.merge(*[_read_run(path) for path in group]), temp_dir))
+            for path in group:
+                os.remove(path)
+        paths = merged
+    return heapq.merge(*[_read_run(path) for path in paths])
+
+
+def external_sort(events, run_size=DEFAULT_RUN_SIZE, temp_dir=None):
+    """
+    Yield events in sorted order holding at most run_size of them in
+    memory: sorted runs are spilled to temporary files and then k-way
+    merged with heapq.merge.  Input that fits in one run never touches disk.
+    """
+    buffer = []
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="tsk_timeline_", dir=temp_dir) as run_dir:
+        for event in events:
+            buffer.append(event)
+            if len(buffer) >= run_size:
+                buffer.sort()
+                runs.append(_write_run(buffer, run_dir))
+                buffer = []
+        if not runs:
+            buffer.sort()
+            yield from buffer
+            return
+        if buffer:
+            buffer.sort()
+            runs.append(_write_run(buffer, run_dir))
+            buffer = []
+        yield from _merge_runs(runs, run_dir)
+
+
+def format_time(value):
+    return datetime.datetime.fromtimestamp(value, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def timeline_events(entries, start=None, end=None):
+    for entry in entries:
+        for event in expand_entry(entry):
+            if start is not None and event[0] < start:
+                continue
+            if end is not None and event[0] > end:
+                continue
+            yield event
+
+
+def write_timeline(events, output_file, fmt="csv"):
+    """
+    Write sorted events as a mactime-style CSV (Date in UTC) or as JSON
+    lines with the same fields.  Returns the number of events written.
+    """
+    count = 0
+    with open(output_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer:
+            writer.writerow(TIMELINE_FIELDS)
+        for value, path, macb, size, mode, uid, gid, inode in events:
+            row = [format_time(value), size, macb, mode, uid, gid, inode, path]
+            if writer:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(dict(zip(TIMELINE_FIELDS, row)), ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def build_timeline(entries, output_file, fmt="csv", start=None, end=None, run_size=DEFAULT_RUN_SIZE, temp_dir=None):
+    """
+    Expand bodyfile entries into MAC(B) events, sort them in bounded memory
+    and write the timeline.  start/end are Unix times bounding the events.
+    """
+    events = timeline_events(entries, start, end)
+    return write_timeline(external_sort(events, run_size, temp_dir), output_file, fmt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a sorted MAC(B) timeline from a bodyfile or straight from fls.')
+    parser.add_argument('input', help='Bodyfile, or a disk image with --image.')
+    parser.add_argument('output', help='Timeline output file.')
+    parser.add_argument('--image', action='store_true', help='Input is a disk image; list it with fls.')
+    parser.add_argument('--offset', type=int, default=0, help='Partition offset in sectors for --image (default: 0).')
+    parser.add_argument('--sleuthkit', default="C:/Path/To/SleuthKit/Binaries", help='Sleuth Kit binaries directory.')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv', help='Timeline format (default: csv).')
+    parser.add_argument('--start', type=parse_time, help='Earliest event time (UTC), e.g. 2024-03-01.')
+    parser.add_argument('--end', type=parse_time, help='Latest event time (UTC).')
+    parser.add_argument('--run-size', type=int, default=DEFAULT_RUN_SIZE, help=f'Events sorted in memory per run (default: {DEFAULT_RUN_SIZE}).')
+    parser.add_argument('--temp-dir', help='Directory for sort runs (default: system temp directory).')
+    args = parser.parse_args()
+
+    if args.image:
+        from sleuth_kit_compatible_ import SleuthKit
+        entries = SleuthKit(args.sleuthkit).iter_fls(args.input, args.offset)
+        count = build_timeline(entries, args.output, args.format, args.start, args.end, args.run_size, args.temp_dir)
+        if entries.errors:
+            print(f"\nErrors:\n{entries.errors}")
+    else:
+        with open(args.input, encoding='utf-8', errors='replace') as f:
+            count = build_timeline(iter_bodyfile(f), args.output, args.format, args.start, args.end, args.run_size, args.temp_dir)
+    print(f"Wrote {count} events to {args.output}")
+
+if __name__ == "__main__":
+    main()